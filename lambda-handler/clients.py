@@ -0,0 +1,55 @@
+"""
+AWS clients shared by the whole container.
+
+Clients are built from a plain botocore session: importing boto3 also imports
+s3transfer and roughly doubles the SDK import time on a cold start, and none of
+the handler code needs the boto3 resource layer. Every route calls DynamoDB, so
+dynamo.py creates that client at import, during the Lambda init phase (which
+runs before any request with provisioned concurrency). The others (S3 for the
+export and import jobs, Lambda for continuations) are created on first use,
+so an invocation only pays for the services it actually calls.
+"""
+import threading
+
+import botocore.session
+from botocore.config import Config
+
+# Options of every client: a connection pool large enough for the handler's
+# thread pools (batch writes, parallel queries) with TCP keepalive on pooled
+# connections, adaptive retries (backoff plus client-side rate limiting once the
+# service throttles) and timeouts that fail well inside the Lambda budget
+BASE_CONFIG = Config(
+    max_pool_connections=32,
+    tcp_keepalive=True,
+    connect_timeout=2,
+    read_timeout=5,
+    retries={'mode': 'adaptive', 'total_max_attempts': 4}
+)
+
+# Per-service additions
+CLIENT_CONFIGS = {
+    # Presigned URLs must use SigV4 (required for Lambda's temporary credentials
+    # outside us-east-1 and for KMS-encrypted objects)
+    's3': Config(signature_version='s3v4'),
+}
+
+_session = None
+_clients = {}
+_lock = threading.Lock()
+
+
+def client(service):
+    """Returns the shared low-level client for service (thread-safe)."""
+    found = _clients.get(service)
+    if found is None:
+        global _session
+        with _lock:
+            found = _clients.get(service)
+            if found is None:
+                if _session is None:
+                    _session = botocore.session.get_session()
+                config = BASE_CONFIG
+                if service in CLIENT_CONFIGS:
+                    config = config.merge(CLIENT_CONFIGS[service])
+                found = _clients[service] = _session.create_client(service, config=config)
+    return found
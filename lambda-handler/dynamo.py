@@ -0,0 +1,206 @@
+"""
+Thin data-access layer over the low-level DynamoDB client.
+
+The boto3 resource layer runs every attribute through TypeSerializer /
+TypeDeserializer and turns every number into a Decimal. Our rows only hold
+strings and numbers (PK, SK, itemName, quantity, role, createdAt, ...), so the
+marshalling here is hand-written for those shapes: strings pass through, integral
+numbers become int and only fractional numbers pay for a Decimal.
+
+Functions take and return plain Python values with the same parameter and
+response names as the DynamoDB API; the table name is filled in here. Every
+call asks for ReturnConsumedCapacity and reports its latency, capacity and row
+count to instrumentation.py.
+"""
+import os
+from decimal import Decimal
+
+import clients
+import instrumentation
+
+TABLE_NAME = os.environ['table']  # Single DynamoDB table
+
+# Created at import rather than by the first request (see clients.py)
+_client = clients.client('dynamodb')
+
+
+def client():
+    """The low-level DynamoDB client."""
+    return _client
+
+
+# ----------------------------------------------------------------------------
+# Marshalling
+# ----------------------------------------------------------------------------
+def serialize(value):
+    """Python value -> DynamoDB AttributeValue."""
+    if isinstance(value, str):
+        return {"S": value}
+    if isinstance(value, bool):
+        return {"BOOL": value}
+    if isinstance(value, (int, Decimal)):
+        return {"N": str(value)}
+    if isinstance(value, float):
+        return {"N": repr(value)}
+    if value is None:
+        return {"NULL": True}
+    if isinstance(value, dict):
+        return {"M": {k: serialize(v) for k, v in value.items()}}
+    if isinstance(value, (list, tuple)):
+        return {"L": [serialize(v) for v in value]}
+    raise TypeError(f"Cannot store {type(value).__name__} in DynamoDB.")
+
+
+def deserialize(attribute):
+    """DynamoDB AttributeValue -> Python value."""
+    if "S" in attribute:
+        return attribute["S"]
+    if "N" in attribute:
+        return number(attribute["N"])
+    if "BOOL" in attribute:
+        return attribute["BOOL"]
+    if "NULL" in attribute:
+        return None
+    if "M" in attribute:
+        return {k: deserialize(v) for k, v in attribute["M"].items()}
+    if "L" in attribute:
+        return [deserialize(v) for v in attribute["L"]]
+    raise TypeError(f"Unsupported attribute type {list(attribute)}.")
+
+
+def number(text):
+    """Integral numbers (quantity, createdAt, versions) become int, the rest Decimal."""
+    if "." in text or "e" in text or "E" in text:
+        return Decimal(text)
+    return int(text)
+
+
+def serialize_item(item):
+    return {k: serialize(v) for k, v in item.items()}
+
+
+def deserialize_item(record):
+    return {k: deserialize(v) for k, v in record.items()}
+
+
+def _call(operation, **kwargs):
+    """Makes one DynamoDB API call and records it for the current request."""
+    kwargs.setdefault("ReturnConsumedCapacity", "TOTAL")
+    metrics = instrumentation.dynamodb_call_started()
+    resp = {}
+    try:
+        resp = getattr(client(), operation)(**kwargs)
+        return resp
+    finally:
+        instrumentation.record_dynamodb_call(metrics, operation, resp)
+
+
+def _request(kwargs):
+    """Marshals the value-carrying parameters of a request in place."""
+    kwargs.setdefault("TableName", TABLE_NAME)
+    for name in ("Key", "Item", "ExpressionAttributeValues", "ExclusiveStartKey"):
+        if name in kwargs:
+            kwargs[name] = serialize_item(kwargs[name])
+    return kwargs
+
+
+def _response(resp):
+    """Unmarshals the value-carrying parts of a response in place."""
+    for name in ("Item", "Attributes", "LastEvaluatedKey"):
+        if name in resp:
+            resp[name] = deserialize_item(resp[name])
+    if "Items" in resp:
+        resp["Items"] = [deserialize_item(r) for r in resp["Items"]]
+    return resp
+
+
+# ----------------------------------------------------------------------------
+# Single-item and query operations
+# ----------------------------------------------------------------------------
+def get_item(**kwargs):
+    return _response(_call("get_item", **_request(kwargs)))
+
+
+def put_item(**kwargs):
+    return _response(_call("put_item", **_request(kwargs)))
+
+
+def update_item(**kwargs):
+    return _response(_call("update_item", **_request(kwargs)))
+
+
+def delete_item(**kwargs):
+    return _response(_call("delete_item", **_request(kwargs)))
+
+
+def query(**kwargs):
+    return _response(_call("query", **_request(kwargs)))
+
+
+def scan(**kwargs):
+    """Table scans are for one-off maintenance tasks only, never for routes."""
+    return _response(_call("scan", **_request(kwargs)))
+
+
+def query_records(**kwargs):
+    """Like query, but leaves Items as low-level records (see serialization.py)."""
+    resp = _call("query", **_request(kwargs))
+    if "LastEvaluatedKey" in resp:
+        resp["LastEvaluatedKey"] = deserialize_item(resp["LastEvaluatedKey"])
+    return resp
+
+
+# ----------------------------------------------------------------------------
+# Batch and transactional operations (single calls; callers handle chunking
+# and retries of unprocessed entries)
+# ----------------------------------------------------------------------------
+def batch_get_item(keys, **kwargs):
+    """
+    One BatchGetItem call for at most 100 keys. Returns (items, unprocessed_keys).
+    """
+    request = dict(kwargs, Keys=[serialize_item(k) for k in keys])
+    resp = _call("batch_get_item", RequestItems={TABLE_NAME: request})
+    items = [deserialize_item(r) for r in resp.get("Responses", {}).get(TABLE_NAME, [])]
+    unprocessed = resp.get("UnprocessedKeys", {}).get(TABLE_NAME, {}).get("Keys", [])
+    return items, [deserialize_item(k) for k in unprocessed]
+
+
+def batch_write_item(requests):
+    """
+    One BatchWriteItem call for at most 25 {"PutRequest": {"Item": ...}} /
+    {"DeleteRequest": {"Key": ...}} requests. Returns the unprocessed requests.
+    """
+    marshalled = []
+    for r in requests:
+        if "PutRequest" in r:
+            marshalled.append({"PutRequest": {"Item": serialize_item(r["PutRequest"]["Item"])}})
+        else:
+            marshalled.append({"DeleteRequest": {"Key": serialize_item(r["DeleteRequest"]["Key"])}})
+    resp = _call("batch_write_item", RequestItems={TABLE_NAME: marshalled})
+    unprocessed = []
+    for r in resp.get("UnprocessedItems", {}).get(TABLE_NAME, []):
+        if "PutRequest" in r:
+            unprocessed.append({"PutRequest": {"Item": deserialize_item(r["PutRequest"]["Item"])}})
+        else:
+            unprocessed.append({"DeleteRequest": {"Key": deserialize_item(r["DeleteRequest"]["Key"])}})
+    return unprocessed
+
+
+def transact_get_items(keys):
+    """TransactGetItems for the given keys; returns the rows (None where missing)."""
+    resp = _call("transact_get_items", TransactItems=[
+        {"Get": {"TableName": TABLE_NAME, "Key": serialize_item(k)}} for k in keys
+    ])
+    return [deserialize_item(r["Item"]) if "Item" in r else None for r in resp["Responses"]]
+
+
+def transact_write_items(actions):
+    """
+    TransactWriteItems for actions shaped like [{"Put": {"Item": ..., ...}},
+    {"Update": {"Key": ..., ...}}, ...] with plain Python values.
+    """
+    marshalled = []
+    for action in actions:
+        (kind, params), = action.items()
+        marshalled.append({kind: _request(dict(params))})
+    return _call("transact_write_items", TransactItems=marshalled)
@@ -0,0 +1,149 @@
+"""
+Idempotency keys for retried writes (the `Idempotency-Key` request header).
+
+The first request with a key claims an IDEMPOTENCY# row in the table with a
+conditional put, runs, and stores its status code, headers and body on the row.
+A retry with the same key finds the row in the response of its failed put
+(ReturnValuesOnConditionCheckFailure), so a replay costs one write request and
+none of the route's work. A retry that arrives while the first request still
+runs tries again for up to WAIT_SECONDS and then gets 409. Responses that ask
+the client to try again (5xx, and any with Retry-After: 429 and the 409 of a
+lost race) are not stored: the row is deleted, so the next retry runs the
+route again. Rows expire after TTL_SECONDS (DynamoDB TTL
+on expiresAt).
+
+Keys are scoped to the user, and a key sent again with a different route, path
+or body is rejected rather than replayed.
+"""
+import hashlib
+import json
+import math
+import time
+import uuid
+
+from botocore.exceptions import ClientError
+
+import dynamo
+import instrumentation
+import serialization
+
+HEADER = "Idempotency-Key"
+REPLAYED_HEADER = "Idempotent-Replayed"
+MAX_KEY_LENGTH = 255
+TTL_SECONDS = 24 * 3600
+WAIT_SECONDS = 3  # how long a duplicate waits for the first request to finish
+DEFAULT_LOCK_SECONDS = 30  # claim lifetime when the Lambda context is unknown
+MAX_STORED_BODY_BYTES = 300 * 1024  # DynamoDB rows are at most 400 KB
+IN_PROGRESS_RETRY_AFTER_SECONDS = 1
+
+
+class InProgress(Exception):
+    """An earlier request with the same key is still running (409 with Retry-After)."""
+
+    def __init__(self, message, retry_after=IN_PROGRESS_RETRY_AFTER_SECONDS):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def fingerprint(route_key, path, body):
+    """Hash of what the request asks for; a reused key must come with the same one."""
+    text = json.dumps([route_key, path, body], sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def is_stored(status_code, headers):
+    """Whether a response is final: 5xx and responses with Retry-After tell the client to try again."""
+    return status_code < 500 and "Retry-After" not in headers
+
+
+class Claim:
+    """One request's hold on an idempotency key."""
+
+    def __init__(self, user_id, key, request_fingerprint):
+        if not 0 < len(key) <= MAX_KEY_LENGTH or not key.isascii() or not key.isprintable():
+            raise ValueError(f"{HEADER} must be 1 to {MAX_KEY_LENGTH} printable ASCII characters.")
+        self.key = {"PK": f"IDEMPOTENCY#{user_id}#{key}", "SK": "IDEMPOTENCY"}
+        self.fingerprint = request_fingerprint
+        self.token = uuid.uuid4().hex
+
+    def acquire(self, context=None):
+        """
+        Claims the key for this request and returns None, or returns the stored
+        (statusCode, body, headers) of the earlier request with the key. A claim
+        whose request is past its Lambda deadline, or an expired row not yet
+        removed by TTL, is taken over.
+        """
+        deadline = time.monotonic() + WAIT_SECONDS
+        delay = 0.1
+        while True:
+            now = time.time()
+            remaining = context.get_remaining_time_in_millis() / 1000 if context is not None else DEFAULT_LOCK_SECONDS
+            try:
+                dynamo.put_item(
+                    Item=dict(self.key, status="running", fingerprint=self.fingerprint, token=self.token,
+                              lockedUntil=math.ceil(now + remaining), expiresAt=int(now) + TTL_SECONDS),
+                    ConditionExpression="attribute_not_exists(PK) OR expiresAt < :now OR "
+                                        "(#status = :running AND lockedUntil < :now)",
+                    ExpressionAttributeNames={"#status": "status"},
+                    ExpressionAttributeValues={":now": int(now), ":running": "running"},
+                    ReturnValuesOnConditionCheckFailure="ALL_OLD"
+                )
+                return None
+            except ClientError as e:
+                if e.response.get("Error", {}).get("Code") != "ConditionalCheckFailedException":
+                    raise
+                record = dynamo.deserialize_item(e.response.get("Item", {}))
+            if record.get("fingerprint") != self.fingerprint:
+                raise ValueError(f"{HEADER} was already used for a different request.")
+            if record.get("status") == "completed":
+                return replay(record)
+            if time.monotonic() + delay > deadline:
+                raise InProgress("A request with this Idempotency-Key is still in progress, please retry.")
+            time.sleep(delay)
+            delay = min(delay * 2, 1.0)
+
+    def finish(self, status_code, body, headers):
+        """
+        Stores the response for later duplicates, or gives the key up if the
+        response is not final. Failures are logged, not raised: the response
+        itself has already been produced.
+        """
+        try:
+            if is_stored(status_code, headers):
+                self._complete(status_code, body, headers)
+            else:
+                dynamo.delete_item(
+                    Key=self.key,
+                    ConditionExpression="#token = :token",
+                    ExpressionAttributeNames={"#token": "token"},
+                    ExpressionAttributeValues={":token": self.token}
+                )
+        except ClientError as e:
+            # A failed condition means the claim was taken over after our deadline
+            instrumentation.log("warning", "Could not finish idempotency claim.",
+                                error=str(e), errorType=type(e).__name__)
+
+    def _complete(self, status_code, body, headers):
+        values = {":token": self.token, ":completed": "completed", ":code": status_code,
+                  ":headers": dict(headers)}
+        update = "SET #status = :completed, statusCode = :code, responseHeaders = :headers"
+        if len(body.encode("utf-8")) <= MAX_STORED_BODY_BYTES:
+            update += ", responseBody = :body"
+            values[":body"] = body
+        dynamo.update_item(
+            Key=self.key,
+            UpdateExpression=update + " REMOVE lockedUntil",
+            ConditionExpression="#token = :token",
+            ExpressionAttributeNames={"#status": "status", "#token": "token"},
+            ExpressionAttributeValues=values
+        )
+
+
+def replay(record):
+    """The (statusCode, body, headers) stored on a completed row."""
+    headers = dict(record.get("responseHeaders") or {}, **{REPLAYED_HEADER: "true"})
+    body = record.get("responseBody")
+    if body is None:  # too large to store
+        body = json.dumps({"message": "This request was already processed."})
+        headers["Content-Type"] = "application/json"
+    return record["statusCode"], serialization.Raw(body), headers
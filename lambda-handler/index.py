@@ -1,476 +1,1824 @@
+import base64
+import csv
 import json
-import boto3
+import math
+from botocore.exceptions import ClientError
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from decimal import Decimal
 import os
+import heapq
+import random
 import time
+import uuid
+import zlib
 
-client = boto3.client('dynamodb')
-dynamodb = boto3.resource("dynamodb")
-table = dynamodb.Table(os.environ['table'])  # Single DynamoDB table
+import clients
+import dynamo
+import idempotency
+import instrumentation
+import routes
+import serialization
+import storage
+from routes import ANY_ROLE, EDITORS
+
+# GSI over the ACCESS rows: userId -> PK (WAREHOUSE#<id>)
+user_access_index = os.environ.get('userAccessIndex', 'UserAccessIndex')
+# Sparse GSI of the items below their reorder threshold: lowStockPK -> SK
+low_stock_index = os.environ.get('lowStockIndex', 'LowStockIndex')
+# GSI of the ITEM rows and tombstones by time of change: PK -> updatedAt
+item_changes_index = os.environ.get('itemChangesIndex', 'ItemChangesIndex')
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 100  # BatchGetItem accepts at most 100 keys per call
+BATCH_WRITE_SIZE = 25  # BatchWriteItem accepts at most 25 requests per call
+BATCH_WRITE_WORKERS = 8  # also BatchGetItem chunks fetched in parallel
+PARALLEL_QUERY_WORKERS = 8  # per-warehouse queries of GET /low-stock
+BATCH_MAX_ATTEMPTS = 6
+# Stop deleting and hand over to a new invocation when less than this is left
+DELETE_TIME_RESERVE_MS = 2000
+DELETE_PAGE_SIZE = 500  # rows per Query page, i.e. work done between budget checks
+BACKFILL_PAGE_SIZE = 1000  # rows per Scan page of backfill_access_user_ids
+MAX_BULK_ITEMS = 5000  # items accepted by one POST .../items/batch request
+MAX_BATCH_GET_ITEMS = 500  # item IDs accepted by one POST .../items/batch-get request
+MAX_TRANSFER_ITEMS = 500  # items moved by one POST .../transfers request
+TRANSACT_MAX_ACTIONS = 100  # TransactWriteItems accepts at most 100 actions per call
+# Items per transfer transaction: two item writes each, plus both warehouses' totals
+TRANSFER_BATCH_ITEMS = (TRANSACT_MAX_ACTIONS - 2) // 2
+# ... and with sharded warehouses up to two TOTALS rows per item as well
+SHARDED_TRANSFER_BATCH_ITEMS = TRANSACT_MAX_ACTIONS // 4
+# Item partitions of a sharded warehouse (created in one transaction with one
+# TOTALS row each, next to METADATA and the owner's ACCESS row)
+MAX_ITEM_SHARDS = 32
+# Read-then-write attempts of an item write that keeps the warehouse totals
+# (itemCount, totalQuantity on METADATA) in step before answering 409
+ITEM_WRITE_MAX_ATTEMPTS = 3
+# Attempts of a transaction cancelled because a concurrent transaction touched
+# the same totals row, before answering 429
+TRANSACTION_CONFLICT_MAX_ATTEMPTS = 5
+# Deleted items leave a TOMBSTONE# row for delta sync, removed by DynamoDB TTL
+TOMBSTONE_TTL_SECONDS = 7 * 24 * 3600
+# GET .../items?since= never moves the high-water mark closer to now than this,
+# so writes still on their way to the GSI (or stamped by a clock slightly
+# behind) are picked up by the next sync
+SYNC_LAG_MS = 5000
+EXPORT_PAGE_SIZE = 1000  # ITEM rows per Query page of an export
+EXPORT_PART_SIZE = 5 * 1024 * 1024  # S3 minimum for every part but the last
+# Export/import work done inside the POST request before handing over to an async invocation
+JOB_INLINE_BUDGET_MS = 5000
+# Leave time to finish a step (an export part, an import batch) and checkpoint the job
+JOB_TIME_RESERVE_MS = 4000
+EXPORT_URL_TTL_SECONDS = 3600
+IMPORT_BATCH_SIZE = 500  # rows parsed per batch of parallel BatchWriteItem calls
+IMPORT_MAX_LINE_BYTES = 64 * 1024  # longer lines are rejected (DynamoDB items are at most 400 KB)
+IMPORT_MAX_ERRORS = 20  # rejected rows reported on the job (all are counted)
+IMPORT_EXTENSIONS = {".csv": "csv", ".ndjson": "ndjson", ".jsonl": "ndjson"}
+# format -> (Content-Type, header line, record -> line)
+EXPORT_FORMATS = {
+    "ndjson": (serialization.NDJSON_CONTENT_TYPE, None, lambda r: serialization.encode_item(r) + "\n"),
+    "csv": (serialization.CSV_CONTENT_TYPE, serialization.CSV_ITEM_HEADER, serialization.encode_item_csv)
+}
+
+# (warehouse, user) -> role cache shared by warm invocations of this container
+ROLE_CACHE_MAX_SIZE = int(os.environ.get('roleCacheMaxSize', '1024'))
+ROLE_CACHE_TTL_SECONDS = float(os.environ.get('roleCacheTtlSeconds', '30'))
+# Optional per-warehouse request rate limit of this container (0 = off)
+WAREHOUSE_RATE_LIMIT = float(os.environ.get('warehouseRateLimit', '0'))  # requests per second
+WAREHOUSE_BURST = float(os.environ.get('warehouseBurst', str(2 * WAREHOUSE_RATE_LIMIT)))
+# DynamoDB errors answered with 429 once botocore's own retries gave up
+THROTTLING_ERRORS = {"ProvisionedThroughputExceededException", "ThrottlingException",
+                     "RequestLimitExceeded", "ThrottlingError"}
+THROTTLED_RETRY_AFTER_SECONDS = 1
 
 def handler(event, context):
-    print(event)
-    statusCode = 200
+    # Internal events sent by schedule_continuation (not via API Gateway)
+    task = event.get("task")
+    if task is not None:
+        return run_task(task, event, context)
+
     headers = {
         "Content-Type": "application/json"
     }
-    body = {}
 
-    # Get the authenticated user from HTTP API Gateway
-    authorized_user_id = event["requestContext"]["authorizer"]["jwt"]["claims"]["cognito:username"]
+    route_key = event.get('routeKey')
+    instrumentation.start_request(route_key, context)
+    claim, replayed = None, False
+    try:
+        entry = ROUTE_TABLE.get(route_key)
+        if entry is None:
+            raise ValueError(f"Unsupported route: {route_key}")
+        route_handler, route = entry
 
-    # stuff = [event, context]
-    # return {
-    #     "statusCode": statusCode,
-    #     "headers": headers,
-    #     "body": json.dumps(str(stuff))
-    # }
+        request = Request(event, context)
+        if route.body:
+            validate_body(request.body, route.body)
+        if route.roles is not None and not route.inline_auth:
+            with instrumentation.timer("auth"):
+                # Routes limited to owners/editors never trust a cached role
+                require_access(request.warehouse_id, request.user_id, allowed_roles=route.roles,
+                               fresh=bool(route.roles))
+            charge_rate_limit(request.warehouse_id)
 
-    # Helper functions
-    def get_user_access_role(warehouse_id, user_id):
-        """
-        Returns the role (str) if user has an ACCESS row in that warehouse partition,
-        or None if no access row found.
-        """
-        resp = table.get_item(
-            Key={
-                "PK": f"WAREHOUSE#{warehouse_id}",
-                "SK": f"ACCESS#{user_id}"
-            }
-        )
-        item = resp.get("Item")
-        if item:
-            return item.get("role")
-        return None
+        result = None
+        idempotency_key = request.header(idempotency.HEADER)
+        if route.idempotent and idempotency_key is not None:
+            new_claim = idempotency.Claim(request.user_id, idempotency_key,
+                                          idempotency.fingerprint(route_key, request.path, request.body))
+            result = new_claim.acquire(context)
+            if result is None:
+                claim = new_claim
+            else:
+                replayed = True
+        if result is None:
+            result = route_handler(request)
+        statusCode, body = result[0], result[1]
+        if len(result) > 2:
+            headers.update(result[2])
 
-    def require_access(warehouse_id, user_id, allowed_roles=None):
-        """
-        Raises a 403 error if user_id does not have one of the allowed_roles in the warehouse.
-        If allowed_roles is None, any valid role is accepted.
-        """
-        role = get_user_access_role(warehouse_id, user_id)
-        if role is None:
-            raise PermissionError("No access to this warehouse.")
-        if allowed_roles and role not in allowed_roles:
-            raise PermissionError(f"Must have one of {allowed_roles} roles to perform this action.")
-        # If we get here, user has valid permission
+    except PermissionError as pe:
+        statusCode = 403
+        body = {"error": str(pe)}
+    except PreconditionFailed as pf:
+        statusCode = 412
+        body = {"error": str(pf)}
+    except idempotency.InProgress as ip:
+        statusCode = 409
+        body = {"error": str(ip)}
+        headers["Retry-After"] = str(math.ceil(ip.retry_after))
+    except Throttled as te:
+        statusCode = 429
+        body = {"error": str(te)}
+        headers["Retry-After"] = str(math.ceil(te.retry_after))
+    except ValueError as ve:
+        statusCode = 400
+        body = {"error": str(ve)}
+    except Exception as e:
+        if is_throttling(e) or is_transaction_conflict(e):
+            # Table capacity is exhausted, or the rows are contended: tell the
+            # client to back off instead of failing
+            instrumentation.log("warning", "Throttled by DynamoDB.", errorType=type(e).__name__)
+            statusCode = 429
+            body = {"error": "Too many requests, please retry."}
+            headers["Retry-After"] = str(THROTTLED_RETRY_AFTER_SECONDS)
+        else:
+            instrumentation.log_exception("Unhandled error", e)
+            statusCode = 500
+            body = {"error": "Internal server error"}
 
-    try:
-        route_key = event['routeKey']
-        path_parameters = event.get('pathParameters', {})
-        request_body = {}
+    with instrumentation.timer("serialization"):
+        response = build_response(statusCode, body, headers)
+    if claim is not None:
+        # Stored for retries with the same Idempotency-Key (or released if not final)
+        claim.finish(statusCode, response["body"], headers)
+    instrumentation.finish_request(statusCode, {
+        "pathParameters": event.get("pathParameters"),
+        "roleCache": role_cache.stats(),
+        "idempotentReplay": replayed
+    })
+    return response
+
+def run_task(task, event, context):
+    task_handler = TASKS.get(task)
+    if task_handler is None:
+        raise ValueError(f"Unsupported task: {task}")
+    instrumentation.start_request(f"task:{task}", context)
+    result = task_handler(event, context)
+    instrumentation.finish_request(200, result)
+    return result
+
+def delete_warehouse_task(event, context):
+    done = delete_warehouse_partition(event["warehouseId"], context)
+    return {"warehouseId": event["warehouseId"], "complete": done}
+
+def recount_warehouse_task(event, context):
+    totals = recount_warehouse(event["warehouseId"])
+    return {
+        "warehouseId": event["warehouseId"],
+        "itemCount": totals["itemCount"],
+        "totalQuantity": float(totals["totalQuantity"])
+    }
+
+def backfill_access_user_ids_task(event, context):
+    updated, complete = backfill_access_user_ids(context, event.get("startKey"))
+    return {"updated": updated, "complete": complete}
+
+def export_warehouse_task(event, context):
+    job = dynamo.get_item(
+        Key={"PK": f"WAREHOUSE#{event['warehouseId']}", "SK": f"EXPORT#{event['exportId']}"},
+        ConsistentRead=True
+    ).get("Item")
+    # A repeated event for a finished (or deleted) job does nothing
+    done = job is None or job["status"] != "running" or run_export(job, context)
+    return {"warehouseId": event["warehouseId"], "exportId": event["exportId"], "complete": done}
+
+def import_items_task(event, context):
+    job = dynamo.get_item(
+        Key={"PK": f"WAREHOUSE#{event['warehouseId']}", "SK": f"IMPORT#{event['importId']}"},
+        ConsistentRead=True
+    ).get("Item")
+    done = job is None or job["status"] != "running" or run_import(job, context)
+    return {"warehouseId": event["warehouseId"], "importId": event["importId"], "complete": done}
+
+class Request:
+    """
+    The parts of an API Gateway (HTTP API v2) event that route handlers use.
+    Route handlers take a Request and return (statusCode, body) or
+    (statusCode, body, extra_headers).
+    """
+
+    def __init__(self, event, context):
+        self.event = event
+        self.context = context
+        # Get the authenticated user from HTTP API Gateway
+        self.user_id = event["requestContext"]["authorizer"]["jwt"]["claims"]["cognito:username"]
+        self.path = event.get('pathParameters') or {}
+        self.query = event.get('queryStringParameters') or {}
+        self.body = {}
         if event.get('body'):
-            request_body = json.loads(event['body'])
-
-        # --------------------------------------------------------------------
-        # 1. WAREHOUSE MANAGEMENT
-        # --------------------------------------------------------------------
-        # 1A) CREATE WAREHOUSE (POST /warehouses)
-        if route_key == "POST /warehouses":
-            warehouse_id = request_body.get('warehouseId')
-            warehouse_name = request_body.get('warehouseName', '')
-            created_at = int(time.time())
-
-            # Check if warehouse already exists
-            resp = table.get_item(
-                Key={
-                    "PK": f"WAREHOUSE#{warehouse_id}",
-                    "SK": "METADATA"
-                }
-            )
-            if resp.get("Item"):
-                statusCode = 400
-                body = {"error": f"Warehouse {warehouse_id} already exists."}
-                return build_response(statusCode, body, headers)
-
-            # Create the warehouse metadata row
-            table.put_item(
-                Item={
-                    "PK": f"WAREHOUSE#{warehouse_id}",
-                    "SK": "METADATA",
-                    "warehouseName": warehouse_name,
-                    "createdAt": created_at
-                }
-            )
+            self.body = json.loads(event['body'])
+            if not isinstance(self.body, dict):
+                raise ValueError("Request body must be a JSON object.")
 
-            # Also create an ACCESS row for the creating user => role="owner"
-            table.put_item(
-                Item={
-                    "PK": f"WAREHOUSE#{warehouse_id}",
-                    "SK": f"ACCESS#{authorized_user_id}",
-                    "role": "owner",
-                    "addedAt": created_at
-                }
-            )
+    @property
+    def warehouse_id(self):
+        return self.path.get("warehouseId")
+
+    def header(self, name):
+        # HTTP API (payload v2) delivers header names in lower case
+        return (self.event.get("headers") or {}).get(name.lower())
+
+    def if_match(self):
+        """The If-Match entity tags ("*" or a set of ETags), None without the header."""
+        return parse_etags(self.header("If-Match"))
+
+    def if_none_match(self):
+        return parse_etags(self.header("If-None-Match"))
+
+class PreconditionFailed(Exception):
+    """An If-Match header does not match the current version (412)."""
+
+class Throttled(Exception):
+    """The request has to be retried later (429 with Retry-After)."""
+
+    def __init__(self, message, retry_after=THROTTLED_RETRY_AFTER_SECONDS):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class JobFailed(Exception):
+    """An import cannot go on because of its input object (the job fails, not the request)."""
+
+# ----------------------------------------------------------------------------
+# 1. WAREHOUSE MANAGEMENT
+# ----------------------------------------------------------------------------
+# 1A) CREATE WAREHOUSE (POST /warehouses)
+def create_warehouse(request):
+    warehouse_id = request.body.get('warehouseId')
+    warehouse_name = request.body.get('warehouseName', '')
+    shards = request.body.get('itemShards', 1)
+    created_at = int(time.time())
+    if "#" in warehouse_id:
+        # Item shards live in WAREHOUSE#<id>#<n> partitions
+        raise ValueError("warehouseId must not contain '#'.")
+    if shards != int(shards) or not 1 <= shards <= MAX_ITEM_SHARDS:
+        raise ValueError(f"itemShards must be an integer from 1 to {MAX_ITEM_SHARDS}.")
+    shards = int(shards)
+
+    metadata = {
+        "PK": f"WAREHOUSE#{warehouse_id}",
+        "SK": "METADATA",
+        "warehouseName": warehouse_name,
+        "createdAt": created_at,
+        "itemCount": 0,
+        "totalQuantity": 0,
+        "version": 1
+    }
+    access = {
+        "PK": f"WAREHOUSE#{warehouse_id}",
+        "SK": f"ACCESS#{request.user_id}",
+        "userId": request.user_id,
+        "role": "owner",
+        "addedAt": created_at
+    }
+    rows = [metadata, access]
+    if shards > 1:
+        # ACCESS rows carry the shard count so the access check of every
+        # request learns it; each shard keeps its own share of the totals
+        metadata["itemShards"] = access["itemShards"] = shards
+        rows.extend({"PK": pk, "SK": "TOTALS", "itemCount": 0, "totalQuantity": 0, "version": 1}
+                    for pk in shard_pks(warehouse_id, shards))
+
+    # Create the warehouse metadata row and the creating user's ACCESS row
+    # (role="owner") atomically; the conditions reject an existing warehouse
+    try:
+        dynamo.transact_write_items([
+            {"Put": {"Item": row, "ConditionExpression": "attribute_not_exists(PK)"}} for row in rows
+        ])
+    except ClientError as e:
+        if not is_condition_failure(e):
+            raise
+        return 400, {"error": f"Warehouse {warehouse_id} already exists."}
+
+    return 200, {
+        "message": f"Created warehouse {warehouse_id}.",
+        "warehouseId": warehouse_id
+    }
+
+# 1B) LIST WAREHOUSES (GET /warehouses)
+def list_warehouses(request):
+    # Step 1: page through the user's ACCESS rows on the UserAccessIndex GSI
+    limit = parse_limit(request.query.get("limit"))
+    query_kwargs = {
+        "IndexName": user_access_index,
+        "KeyConditionExpression": "userId = :uid",
+        "ExpressionAttributeValues": {":uid": request.user_id},
+        "Limit": limit
+    }
+    start_key = decode_cursor(request.query.get("cursor"), userId=request.user_id)
+    if start_key:
+        query_kwargs["ExclusiveStartKey"] = start_key
+    resp = dynamo.query(**query_kwargs)
+    access_rows = resp.get("Items", [])
+
+    # Step 2: BatchGet the METADATA rows for those warehouses
+    metadata = batch_get_items([
+        {"PK": it["PK"], "SK": "METADATA"} for it in access_rows
+    ])
+    metadata_by_pk = {it["PK"]: it for it in metadata}
+    # Sharded warehouses keep their totals on the shards' TOTALS rows
+    totals = shard_totals({
+        pk[len("WAREHOUSE#"):]: int(meta["itemShards"])
+        for pk, meta in metadata_by_pk.items() if meta.get("itemShards", 1) > 1
+    })
+
+    results = []
+    for it in access_rows:
+        meta = metadata_by_pk.get(it["PK"])
+        if meta:
+            warehouse_id = it["PK"].replace("WAREHOUSE#", "")
+            role_cache.observe_version(warehouse_id, meta.get("accessVersion"))
+            item_count, total_quantity, _ = totals.get(
+                warehouse_id, (meta.get("itemCount", 0), meta.get("totalQuantity", 0), 0))
+            results.append({
+                "warehouseId": warehouse_id,
+                "warehouseName": meta.get("warehouseName", ""),
+                "createdAt": meta.get("createdAt"),
+                "itemCount": item_count,
+                "totalQuantity": total_quantity,
+                "role": it.get("role")
+            })
+
+    return 200, {
+        "warehouses": results,
+        "nextCursor": encode_cursor(resp.get("LastEvaluatedKey"))
+    }
+
+# 1C) GET WAREHOUSE (GET /warehouses/{warehouseId})
+def get_warehouse(request):
+    warehouse_id = request.warehouse_id
+
+    # Check user has some role in this warehouse (owner, editor, viewer, etc)
+    # and retrieve the warehouse in the same round trip
+    item = read_with_access(
+        warehouse_id, request.user_id, "METADATA", allowed_roles=ANY_ROLE,
+        consistent=is_true(request.query.get("consistent"))
+    )
+    if not item:
+        return 404, {"error": "Warehouse not found"}
+    shards = int(item.get("itemShards", 1))
+    item_count, total_quantity = item.get("itemCount", 0), item.get("totalQuantity", 0)
+    # Pollers send the ETag back and get an empty 304 while nothing changed
+    tag = etag(item.get("version"))
+    if shards > 1:
+        # Item writes change the shards' TOTALS rows, not METADATA
+        item_count, total_quantity, totals_version = shard_totals({warehouse_id: shards})[warehouse_id]
+        tag = etag(item.get("version"), totals_version)
+    if etag_matches(tag, request.if_none_match()):
+        return 304, serialization.Raw(""), {"ETag": tag}
+    return 200, {
+        "warehouseId": warehouse_id,
+        "warehouseName": item.get("warehouseName", ""),
+        "createdAt": item.get("createdAt", ""),
+        "itemCount": item_count,
+        "totalQuantity": total_quantity,
+        "itemShards": shards
+    }, {"ETag": tag}
+
+# 1D) UPDATE WAREHOUSE (PUT /warehouses/{warehouseId}) - owners only
+def update_warehouse(request):
+    warehouse_id = request.warehouse_id
+    new_name = request.body.get('warehouseName', '')
+
+    # Update the warehouse name; with If-Match only if the version still matches
+    update_kwargs = {
+        "Key": {
+            "PK": f"WAREHOUSE#{warehouse_id}",
+            "SK": "METADATA"
+        },
+        "UpdateExpression": "SET warehouseName = :wn ADD version :one",
+        "ExpressionAttributeValues": {
+            ":wn": new_name,
+            ":one": 1
+        },
+        "ReturnValues": "UPDATED_NEW"
+    }
+    if_match = request.if_match()
+    if if_match is not None:
+        condition, condition_values = version_condition(if_match)
+        update_kwargs["ConditionExpression"] = condition
+        update_kwargs["ExpressionAttributeValues"].update(condition_values)
+    try:
+        resp = dynamo.update_item(**update_kwargs)
+    except ClientError as e:
+        if not is_condition_failure(e):
+            raise
+        raise PreconditionFailed(f"Warehouse {warehouse_id} has changed.")
+    return 200, {"message": f"Warehouse {warehouse_id} updated."}, {
+        "ETag": etag(resp["Attributes"]["version"])
+    }
+
+# 1E) DELETE WAREHOUSE (DELETE /warehouses/{warehouseId}) - owners only
+def delete_warehouse(request):
+    warehouse_id = request.warehouse_id
+    bump_access_version(warehouse_id, if_match=request.if_match())
+
+    # Delete all items (ITEM#, ACCESS#, METADATA) in parallel batches. If the
+    # invocation runs out of time the rest is handed to a later invocation.
+    if delete_warehouse_partition(warehouse_id, request.context):
+        return 200, {"message": f"Warehouse {warehouse_id} and all related records deleted."}
+    return 202, {
+        "message": f"Deletion of warehouse {warehouse_id} is in progress.",
+        "status": "deleting"
+    }
+
+# ----------------------------------------------------------------------------
+# 2. WAREHOUSE ACCESS MANAGEMENT (owners only)
+# ----------------------------------------------------------------------------
+# 2A) GRANT/UPDATE ACCESS (POST /warehouses/{warehouseId}/access)
+def grant_access(request):
+    warehouse_id = request.warehouse_id
+    user_to_grant = request.body.get("userId")
+    new_role = request.body.get("role")  # e.g. "editor", "viewer", etc.
+
+    # Insert or update the ACCESS row
+    now = int(time.time())
+    access = {
+        "PK": f"WAREHOUSE#{warehouse_id}",
+        "SK": f"ACCESS#{user_to_grant}",
+        "userId": user_to_grant,
+        "role": new_role,
+        "addedAt": now
+    }
+    shards = item_shards(warehouse_id)
+    if shards > 1:
+        access["itemShards"] = shards
+    dynamo.put_item(Item=access)
+    role_cache.invalidate(warehouse_id, user_to_grant)
+    bump_access_version(warehouse_id)
+    return 200, {"message": f"User {user_to_grant} given role '{new_role}' in warehouse {warehouse_id}."}
+
+# 2B) LIST USERS WITH ACCESS (GET /warehouses/{warehouseId}/access)
+def list_access(request):
+    # Get one page of ACCESS rows for this warehouse
+    rows, next_cursor = query_partition_page(
+        f"WAREHOUSE#{request.warehouse_id}", "ACCESS#", request.query, records=True
+    )
+    return page_response(request, serialization.encode_access, rows, "access", next_cursor)
+
+# 2C) REVOKE ACCESS (DELETE /warehouses/{warehouseId}/access/{userId})
+def revoke_access(request):
+    warehouse_id = request.warehouse_id
+    user_to_revoke = request.path.get("userId")
+
+    # Delete the ACCESS row for that user
+    dynamo.delete_item(
+        Key={
+            "PK": f"WAREHOUSE#{warehouse_id}",
+            "SK": f"ACCESS#{user_to_revoke}"
+        }
+    )
+    role_cache.invalidate(warehouse_id, user_to_revoke)
+    bump_access_version(warehouse_id)
+    return 200, {"message": f"Revoked access for user {user_to_revoke} in warehouse {warehouse_id}."}
+
+# ----------------------------------------------------------------------------
+# 3. ITEM MANAGEMENT (writes need owner or editor, reads any role)
+# ----------------------------------------------------------------------------
+# 3A) CREATE ITEM (POST /warehouses/{warehouseId}/items)
+def create_item(request):
+    warehouse_id = request.warehouse_id
+    item_id = request.body.get("itemId")
+    item_name = request.body.get("itemName", "")
+    quantity = Decimal(str(request.body.get("quantity", 0)))
+    threshold = request.body.get("reorderThreshold")
+
+    item = {
+        **item_key(warehouse_id, item_id, item_shards(warehouse_id)),
+        "itemName": item_name,
+        "quantity": quantity,
+        "version": 1,
+        "updatedAt": now_ms()
+    }
+    if threshold is not None:
+        item["reorderThreshold"] = Decimal(str(threshold))
+        if is_low_stock(quantity, item["reorderThreshold"]):
+            item["lowStockPK"] = f"WAREHOUSE#{warehouse_id}"
 
-            body = {
-                "message": f"Created warehouse {warehouse_id}.",
-                "warehouseId": warehouse_id
+    # The condition rejects an existing item without a separate read; the
+    # warehouse totals change in the same transaction
+    try:
+        write_item_with_totals(warehouse_id, {
+            "Put": {
+                "Item": item,
+                "ConditionExpression": "attribute_not_exists(PK)"
             }
+        }, 1, quantity)
+    except ClientError as e:
+        failed = failed_conditions(e)
+        if not failed:
+            raise
+        if 0 not in failed:
+            return 404, {"error": "Warehouse not found"}
+        return 400, {"error": f"Item {item_id} already exists in warehouse {warehouse_id}."}
+    return 200, {"message": f"Created item {item_id} in warehouse {warehouse_id}."}
 
-        # 1B) LIST WAREHOUSES (GET /warehouses)
-        elif route_key == "GET /warehouses":
-            # For demonstration, we do a table scan:
-            #  - find all PKs that start with "WAREHOUSE#",
-            #  - filter to those that have an ACCESS row for authorized_user_id
-            #  - then get the METADATA row for each to build a list
-            # Production: consider using a GSI to find all warehouse partitions
-            # that user_id has an access row in.
-            resp = table.scan()
-            items = resp.get("Items", [])
-
-            # Step 1: collect all warehouses user can access
-            user_warehouses = set()
-            for it in items:
-                if (it["SK"].startswith("ACCESS#") 
-                    and it["SK"] == f"ACCESS#{authorized_user_id}"
-                    and it["PK"].startswith("WAREHOUSE#")):
-                    # user has an ACCESS row here
-                    wh_id = it["PK"].replace("WAREHOUSE#", "")
-                    user_warehouses.add(wh_id)
-
-            # Step 2: get the METADATA items for those warehouses
-            results = []
-            for it in items:
-                if it["SK"] == "METADATA":
-                    wh_id = it["PK"].replace("WAREHOUSE#", "")
-                    if wh_id in user_warehouses:
-                        results.append({
-                            "warehouseId": wh_id,
-                            "warehouseName": it.get("warehouseName", ""),
-                            "createdAt": it.get("createdAt")
-                        })
-
-            body = results
-
-        # 1C) GET WAREHOUSE (GET /warehouses/{warehouseId})
-        elif route_key == "GET /warehouses/{warehouseId}":
-            warehouse_id = path_parameters.get("warehouseId")
-
-            # Check user has some role in this warehouse (owner, editor, viewer, etc)
-            try:
-                require_access(warehouse_id, authorized_user_id, allowed_roles=None)
-            except PermissionError as pe:
-                statusCode = 403
-                body = {"error": str(pe)}
-                return build_response(statusCode, body, headers)
-
-            # If user has access, retrieve the warehouse
-            resp = table.get_item(
-                Key={
-                    "PK": f"WAREHOUSE#{warehouse_id}",
-                    "SK": "METADATA"
-                }
-            )
-            item = resp.get("Item")
-            if not item:
-                statusCode = 404
-                body = {"error": "Warehouse not found"}
-            else:
-                body = {
-                    "warehouseId": warehouse_id,
-                    "warehouseName": item.get("warehouseName", ""),
-                    "createdAt": item.get("createdAt", "")
-                }
+# 3B) LIST ITEMS (GET /warehouses/{warehouseId}/items)
+def list_items(request):
+    if request.query.get("since") is not None:
+        return list_item_changes(request)
+    shards = item_shards(request.warehouse_id)
+    if shards > 1:
+        # One page merged in itemId order from all item shards
+        rows, next_cursor, _ = query_shards_page(request.warehouse_id, shards, {
+            "KeyConditionExpression": "PK = :pk AND begins_with(SK, :prefix)",
+            "ExpressionAttributeValues": {":prefix": "ITEM#"}
+        }, request.query, ("SK",), lambda r: r["SK"]["S"], sk_prefix="ITEM#")
+        return page_response(request, serialization.encode_item, rows, "items", next_cursor)
+    # Get one page of ITEM rows for this warehouse
+    rows, next_cursor = query_partition_page(
+        f"WAREHOUSE#{request.warehouse_id}", "ITEM#", request.query, records=True
+    )
+    return page_response(request, serialization.encode_item, rows, "items", next_cursor)
 
-        # 1D) UPDATE WAREHOUSE (PUT /warehouses/{warehouseId})
-        elif route_key == "PUT /warehouses/{warehouseId}":
-            warehouse_id = path_parameters.get("warehouseId")
-            new_name = request_body.get('warehouseName', '')
+# 3B) LIST ITEMS, DELTA SYNC (GET /warehouses/{warehouseId}/items?since=<epoch ms>)
+def list_item_changes(request):
+    """
+    Delta sync: the items written and deleted after `since`, from the
+    ItemChangesIndex GSI in order of change. The last page carries nextSince,
+    the value to send as `since` next time. Items changed again within
+    SYNC_LAG_MS of now may be sent twice; clients apply changes by updatedAt.
+    """
+    try:
+        since = int(request.query["since"])
+    except ValueError:
+        raise ValueError("since must be a timestamp in epoch milliseconds.")
+    now = now_ms()
+    if 0 < since < now - TOMBSTONE_TTL_SECONDS * 1000:
+        # Tombstones that old may be gone: the client must list everything again
+        return 410, {"error": "since is older than the deletion history; reload all items."}
+
+    pk = f"WAREHOUSE#{request.warehouse_id}"
+    query_kwargs = {
+        "IndexName": item_changes_index,
+        "KeyConditionExpression": "PK = :pk AND updatedAt > :since",
+        "ExpressionAttributeValues": {":pk": pk, ":since": since},
+        "Limit": parse_limit(request.query.get("limit"))
+    }
+    shards = item_shards(request.warehouse_id)
+    if shards > 1:
+        # The shards' changes merged in updatedAt order
+        del query_kwargs["ExpressionAttributeValues"][":pk"]
+        records, next_cursor, start_keys = query_shards_page(
+            request.warehouse_id, shards, query_kwargs, request.query,
+            ("SK", "updatedAt"), lambda r: int(r["updatedAt"]["N"]))
+    else:
+        start_key = decode_cursor(request.query.get("cursor"), PK=pk)
+        if start_key:
+            query_kwargs["ExclusiveStartKey"] = start_key
+        resp = dynamo.query_records(**query_kwargs)
+        records = resp.get("Items", [])
+        next_cursor = encode_cursor(resp.get("LastEvaluatedKey"))
+        start_keys = [start_key]
 
-            # Only owners (or possibly "admin") can update warehouse details
+    next_since = None
+    if not next_cursor:
+        # Rows come in updatedAt order: the last one (or the page before, via
+        # the cursor) is the newest change delivered
+        newest = since
+        if records:
+            newest = int(records[-1]["updatedAt"]["N"])
+        else:
+            newest = max([since] + [int(key.get("updatedAt", since)) for key in start_keys if key])
+        next_since = max(since, min(newest, now - SYNC_LAG_MS))
+
+    with instrumentation.timer("serialization"):
+        return 200, serialization.encode_changes(records, next_cursor, next_since)
+
+# 3C) GET SINGLE ITEM (GET /warehouses/{warehouseId}/items/{itemId})
+def get_item(request):
+    # Any valid role can read; access and item come back in one round trip
+    item = read_with_access(
+        request.warehouse_id, request.user_id, item_id=request.path.get('itemId'),
+        allowed_roles=ANY_ROLE, consistent=is_true(request.query.get("consistent"))
+    )
+    if not item:
+        return 404, {"error": "Item not found"}
+    tag = etag(item.get("version"))
+    if etag_matches(tag, request.if_none_match()):
+        return 304, serialization.Raw(""), {"ETag": tag}
+    return 200, {
+        "itemId": item["SK"].replace("ITEM#", ""),
+        "itemName": item.get("itemName"),
+        "quantity": item.get("quantity", 0),
+        "reorderThreshold": item.get("reorderThreshold")
+    }, {"ETag": tag}
+
+# 3D) UPDATE ITEM (PUT /warehouses/{warehouseId}/items/{itemId})
+def update_item(request):
+    warehouse_id = request.warehouse_id
+    item_id = request.path.get("itemId")
+    new_name = request.body.get("itemName")
+    new_quantity = request.body.get("quantity")
+    new_threshold = request.body.get("reorderThreshold")
+
+    if new_name is None and new_quantity is None and new_threshold is None:
+        return 200, {"message": "No fields to update."}
+    key = item_key(warehouse_id, item_id, item_shards(warehouse_id))
+
+    if_match = request.if_match()
+    for attempt in range(ITEM_WRITE_MAX_ATTEMPTS):
+        if new_quantity is None and new_threshold is None:
+            # A rename of an existing item leaves the totals and the stock
+            # level alone: one write
+            condition, condition_values = "attribute_exists(PK)", {}
+            if if_match is not None:
+                condition, condition_values = version_condition(if_match)
             try:
-                require_access(warehouse_id, authorized_user_id, allowed_roles=["owner"])
-            except PermissionError as pe:
-                statusCode = 403
-                body = {"error": str(pe)}
-                return build_response(statusCode, body, headers)
-
-            # Update the warehouse name
-            table.update_item(
-                Key={
-                    "PK": f"WAREHOUSE#{warehouse_id}",
-                    "SK": "METADATA"
-                },
-                UpdateExpression="SET warehouseName = :wn",
-                ExpressionAttributeValues={
-                    ":wn": new_name
+                resp = dynamo.update_item(
+                    Key=key,
+                    UpdateExpression="SET itemName = :nm, updatedAt = :now ADD version :one",
+                    ConditionExpression=condition,
+                    ExpressionAttributeValues=dict(condition_values, **{
+                        ":nm": new_name, ":now": now_ms(), ":one": 1
+                    }),
+                    ReturnValues="UPDATED_NEW"
+                )
+                return 200, {"message": f"Item {item_id} updated in warehouse {warehouse_id}."}, {
+                    "ETag": etag(resp["Attributes"]["version"])
                 }
-            )
-            body = {"message": f"Warehouse {warehouse_id} updated."}
+            except ClientError as e:
+                if not is_condition_failure(e):
+                    raise
+                if if_match is not None:
+                    raise PreconditionFailed(f"Item {item_id} has changed.")
+            old = None
+        else:
+            old = read_stock(key)
+            if if_match is not None and (old is None or not etag_matches(etag(old.get("version")), if_match)):
+                raise PreconditionFailed(f"Item {item_id} has changed.")
 
-        # 1E) DELETE WAREHOUSE (DELETE /warehouses/{warehouseId})
-        elif route_key == "DELETE /warehouses/{warehouseId}":
-            warehouse_id = path_parameters.get("warehouseId")
+        # The resulting quantity and threshold decide the low-stock flag
+        current = old or {}
+        quantity = Decimal(str(new_quantity)) if new_quantity is not None else current.get("quantity", 0)
+        threshold = Decimal(str(new_threshold)) if new_threshold is not None else current.get("reorderThreshold")
+        update_expr = ["updatedAt = :now"]
+        expression_values = {":now": now_ms()}
+        if new_name is not None:
+            update_expr.append("itemName = :nm")
+            expression_values[":nm"] = new_name
+        if new_quantity is not None or old is None:
+            update_expr.append("quantity = :qt")
+            expression_values[":qt"] = quantity
+        if new_threshold is not None:
+            update_expr.append("reorderThreshold = :rt")
+            expression_values[":rt"] = threshold
+        update_expression = "SET " + ", ".join(update_expr)
+        if is_low_stock(quantity, threshold):
+            update_expression += ", lowStockPK = :lsk"
+            expression_values[":lsk"] = f"WAREHOUSE#{warehouse_id}"
+        else:
+            update_expression += " REMOVE lowStockPK"
+        update_expression += " ADD version :one"
+        expression_values[":one"] = 1
 
-            # Only owners can delete the entire warehouse
-            try:
-                require_access(warehouse_id, authorized_user_id, allowed_roles=["owner"])
-            except PermissionError as pe:
-                statusCode = 403
-                body = {"error": str(pe)}
-                return build_response(statusCode, body, headers)
-
-            # Delete all items (METADATA, ACCESS#, ITEM#)
-            # In production: you might do a 'Query' on PK = WAREHOUSE#<id> and batch delete
-            scan_resp = table.scan()
-            items = scan_resp.get("Items", [])
-            for it in items:
-                if it["PK"] == f"WAREHOUSE#{warehouse_id}":
-                    table.delete_item(
-                        Key={
-                            "PK": it["PK"],
-                            "SK": it["SK"]
-                        }
-                    )
-
-            body = {"message": f"Warehouse {warehouse_id} and all related records deleted."}
-
-        # --------------------------------------------------------------------
-        # 2. WAREHOUSE ACCESS MANAGEMENT
-        # --------------------------------------------------------------------
-        # 2A) GRANT/UPDATE ACCESS (POST /warehouses/{warehouseId}/access)
-        elif route_key == "POST /warehouses/{warehouseId}/access":
-            warehouse_id = path_parameters.get("warehouseId")
-            user_to_grant = request_body.get("userId")
-            new_role = request_body.get("role")  # e.g. "editor", "viewer", etc.
-
-            # Only owner can grant or update roles
-            try:
-                require_access(warehouse_id, authorized_user_id, allowed_roles=["owner"])
-            except PermissionError as pe:
-                statusCode = 403
-                body = {"error": str(pe)}
-                return build_response(statusCode, body, headers)
-
-            # Insert or update the ACCESS row
-            now = int(time.time())
-            table.put_item(
-                Item={
-                    "PK": f"WAREHOUSE#{warehouse_id}",
-                    "SK": f"ACCESS#{user_to_grant}",
-                    "role": new_role,
-                    "addedAt": now
+        # PUT on a missing item creates it, so it is counted; otherwise the
+        # write only applies if the stock is still the one we read
+        if old is None:
+            item_delta, quantity_delta = 1, quantity
+            condition, condition_values = "attribute_not_exists(PK)", {}
+        else:
+            item_delta, quantity_delta = 0, quantity - old.get("quantity", 0)
+            condition, condition_values = stock_condition(old)
+        try:
+            write_item_with_totals(warehouse_id, {
+                "Update": {
+                    "Key": key,
+                    "UpdateExpression": update_expression,
+                    "ConditionExpression": condition,
+                    "ExpressionAttributeValues": dict(expression_values, **condition_values)
                 }
-            )
-            body = {"message": f"User {user_to_grant} given role '{new_role}' in warehouse {warehouse_id}."}
+            }, item_delta, quantity_delta)
+        except ClientError as e:
+            failed = failed_conditions(e)
+            if not failed:
+                raise
+            if 0 not in failed:
+                return 404, {"error": "Warehouse not found"}
+            continue  # the item changed since we read it
+        return 200, {"message": f"Item {item_id} updated in warehouse {warehouse_id}."}, {
+            "ETag": etag((old or {}).get("version", 0) + 1)
+        }
+    return retry_later(409, {"error": f"Item {item_id} is being modified concurrently, please retry."})
 
-        # 2B) LIST USERS WITH ACCESS (GET /warehouses/{warehouseId}/access)
-        elif route_key == "GET /warehouses/{warehouseId}/access":
-            warehouse_id = path_parameters.get("warehouseId")
+# 3E) DELETE ITEM (DELETE /warehouses/{warehouseId}/items/{itemId})
+def delete_item(request):
+    warehouse_id = request.warehouse_id
+    item_id = request.path.get("itemId")
+    key = item_key(warehouse_id, item_id, item_shards(warehouse_id))
 
-            # Only owner can see who else has access
-            try:
-                require_access(warehouse_id, authorized_user_id, allowed_roles=["owner"])
-            except PermissionError as pe:
-                statusCode = 403
-                body = {"error": str(pe)}
-                return build_response(statusCode, body, headers)
-
-            # Get all ACCESS rows for this warehouse
-            # Production: would use a Query with KeyConditionExpression
-            resp = table.scan()
-            items = resp.get("Items", [])
-            access_list = []
-            for it in items:
-                if it["PK"] == f"WAREHOUSE#{warehouse_id}" and it["SK"].startswith("ACCESS#"):
-                    access_list.append({
-                        "userId": it["SK"].replace("ACCESS#", ""),
-                        "role": it["role"]
-                    })
-            body = access_list
-
-        # 2C) REVOKE ACCESS (DELETE /warehouses/{warehouseId}/access/{userId})
-        elif route_key == "DELETE /warehouses/{warehouseId}/access/{userId}":
-            warehouse_id = path_parameters.get("warehouseId")
-            user_to_revoke = path_parameters.get("userId")
-
-            # Only owner can revoke access
-            try:
-                require_access(warehouse_id, authorized_user_id, allowed_roles=["owner"])
-            except PermissionError as pe:
-                statusCode = 403
-                body = {"error": str(pe)}
-                return build_response(statusCode, body, headers)
-
-            # Delete the ACCESS row for that user
-            table.delete_item(
-                Key={
-                    "PK": f"WAREHOUSE#{warehouse_id}",
-                    "SK": f"ACCESS#{user_to_revoke}"
+    if_match = request.if_match()
+    for attempt in range(ITEM_WRITE_MAX_ATTEMPTS):
+        old = read_stock(key)
+        if if_match is not None and (old is None or not etag_matches(etag(old.get("version")), if_match)):
+            raise PreconditionFailed(f"Item {item_id} has changed.")
+        if old is None:
+            break  # nothing to delete
+        # Only delete the row whose quantity we subtract from the totals; the
+        # tombstone tells delta-syncing clients about the deletion
+        condition, condition_values = stock_condition(old)
+        try:
+            write_item_with_totals(warehouse_id, {
+                "Delete": {
+                    "Key": key,
+                    "ConditionExpression": condition,
+                    "ExpressionAttributeValues": condition_values
                 }
+            }, -1, -old.get("quantity", 0), also=[{"Put": {"Item": tombstone(key)}}])
+        except ClientError as e:
+            failed = failed_conditions(e)
+            if not failed:
+                raise
+            if 0 in failed:
+                continue  # the item changed since we read it
+            # The warehouse itself is being deleted; drop the row without totals
+            dynamo.delete_item(Key=key)
+        break
+    else:
+        return retry_later(409, {"error": f"Item {item_id} is being modified concurrently, please retry."})
+    return 200, {"message": f"Deleted item {item_id} from warehouse {warehouse_id}."}
+
+# 3F) ADJUST ITEM QUANTITY (POST /warehouses/{warehouseId}/items/{itemId}/adjust)
+def adjust_item(request):
+    warehouse_id = request.warehouse_id
+    item_id = request.path.get("itemId")
+    delta = to_decimal(request.body.get("delta"), "delta")
+
+    key = item_key(warehouse_id, item_id, item_shards(warehouse_id))
+
+    # One atomic UpdateItem: concurrent adjustments never overwrite each
+    # other, the condition keeps the stock from going negative, and the new
+    # row is the stock this adjustment produced
+    try:
+        stock = dynamo.update_item(
+            Key=key,
+            UpdateExpression="SET updatedAt = :now ADD quantity :d, version :one",
+            ConditionExpression="attribute_exists(PK) AND quantity >= :min",
+            ExpressionAttributeValues={
+                ":d": delta,
+                ":min": -delta,
+                ":now": now_ms(),
+                ":one": 1
+            },
+            ReturnValues="ALL_NEW",
+            ReturnValuesOnConditionCheckFailure="ALL_OLD"
+        )["Attributes"]
+    except ClientError as e:
+        if not is_condition_failure(e):
+            raise
+        if "Item" not in e.response:
+            return 404, {"error": "Item not found"}
+        return 400, {"error": f"Insufficient stock for item {item_id}."}
+
+    # The totals follow in their own update rather than in a transaction with
+    # the item, so adjustments never cancel each other on the totals row. The
+    # adjustment has happened either way: a failed totals update is logged
+    # (recountWarehouse repairs the totals), not answered with an error that
+    # the client would retry
+    try:
+        update_totals(warehouse_id, 0, delta, key["PK"])
+    except ClientError as e:
+        instrumentation.log("warning", "Could not update the warehouse totals.", warehouseId=warehouse_id,
+                            error=str(e), errorType=type(e).__name__)
+    # Move the item in or out of the low-stock index if the adjustment
+    # crossed its threshold
+    sync_low_stock(warehouse_id, key, stock)
+    return 200, {
+        "itemId": item_id,
+        "quantity": stock.get("quantity", 0)
+    }, {"ETag": etag(stock.get("version"))}
+
+# 3G) BULK CREATE/REPLACE ITEMS (POST /warehouses/{warehouseId}/items/batch)
+def bulk_create_items(request):
+    warehouse_id = request.warehouse_id
+    new_items = request.body.get("items")
+
+    if not new_items:
+        raise ValueError("items must be a non-empty list.")
+    if len(new_items) > MAX_BULK_ITEMS:
+        raise ValueError(f"At most {MAX_BULK_ITEMS} items per request.")
+
+    # Validate everything up front; only valid rows are sent to DynamoDB.
+    # BatchWriteItem has no conditions, so existing items are replaced.
+    results = []
+    items = []
+    seen = set()
+    shards = item_shards(warehouse_id)
+    for position, it in enumerate(new_items):
+        item_id = it.get("itemId") if isinstance(it, dict) else None
+        result = {"index": position, "itemId": item_id}
+        results.append(result)
+        try:
+            item = item_row(warehouse_id, it, shards)
+            if item_id in seen:
+                raise ValueError("Duplicate itemId in request.")
+        except ValueError as ve:
+            result.update({"status": "failed", "error": str(ve)})
+            continue
+        seen.add(item_id)
+        result["status"] = "ok"
+        items.append(item)
+
+    unprocessed = put_items(warehouse_id, items)
+    for result in results:
+        if result["status"] == "ok" and f"ITEM#{result['itemId']}" in unprocessed:
+            result.update({"status": "failed", "error": "Throttled, please retry."})
+
+    failed = sum(1 for r in results if r["status"] == "failed")
+    return 200, {
+        "succeeded": len(results) - failed,
+        "failed": failed,
+        "results": results
+    }
+
+# 3H) FETCH MANY ITEMS BY ID (POST /warehouses/{warehouseId}/items/batch-get)
+def batch_get_warehouse_items(request):
+    item_ids = request.body.get("itemIds")
+    if not item_ids:
+        raise ValueError("itemIds must be a non-empty list.")
+    if len(item_ids) > MAX_BATCH_GET_ITEMS:
+        raise ValueError(f"At most {MAX_BATCH_GET_ITEMS} itemIds per request.")
+    if not all(isinstance(item_id, str) and item_id for item_id in item_ids):
+        raise ValueError("itemIds must be non-empty strings.")
+
+    # Access was checked once for the whole list (route roles); fetch every
+    # item with 100-key BatchGetItem calls in parallel
+    item_ids = list(dict.fromkeys(item_ids))
+    shards = item_shards(request.warehouse_id)
+    found = {
+        it["SK"]: it
+        for it in batch_get_items(
+            [item_key(request.warehouse_id, item_id, shards) for item_id in item_ids],
+            ConsistentRead=is_true(request.query.get("consistent")),
+            ProjectionExpression="SK, itemName, quantity, reorderThreshold, version"
+        )
+    }
+
+    items, missing = [], []
+    for item_id in item_ids:
+        item = found.get(f"ITEM#{item_id}")
+        if item is None:
+            missing.append(item_id)
+            continue
+        items.append({
+            "itemId": item_id,
+            "itemName": item.get("itemName"),
+            "quantity": item.get("quantity", 0),
+            "reorderThreshold": item.get("reorderThreshold"),
+            "etag": etag(item.get("version"))
+        })
+    return 200, {"items": items, "missing": missing}
+
+# 3I) MOVE STOCK TO ANOTHER WAREHOUSE (POST /warehouses/{warehouseId}/transfers)
+def transfer_items(request):
+    source_id = request.warehouse_id
+    target_id = request.body.get("toWarehouseId")
+    moves = request.body.get("items")
+    if target_id == source_id:
+        raise ValueError("toWarehouseId must be another warehouse.")
+    if not moves:
+        raise ValueError("items must be a non-empty list.")
+    if len(moves) > MAX_TRANSFER_ITEMS:
+        raise ValueError(f"At most {MAX_TRANSFER_ITEMS} items per transfer.")
+
+    # itemId -> quantity to move (repeated itemIds add up)
+    quantities = {}
+    for move in moves:
+        item_id = move.get("itemId") if isinstance(move, dict) else None
+        if not isinstance(item_id, str) or not item_id:
+            raise ValueError("Every item needs an itemId.")
+        quantity = dynamo.number(str(to_decimal(move.get("quantity"), "quantity")))
+        if quantity <= 0:
+            raise ValueError("quantity must be positive.")
+        quantities[item_id] = quantities.get(item_id, 0) + quantity
+
+    # The route checked the source warehouse; the caller must be able to write
+    # to the destination as well
+    with instrumentation.timer("auth"):
+        require_access(target_id, request.user_id, allowed_roles=EDITORS, fresh=True)
+
+    source_shards, target_shards = item_shards(source_id), item_shards(target_id)
+
+    def keys(item_id):
+        """(PK, SK) of the item's row in the source and in the destination."""
+        source, target = item_key(source_id, item_id, source_shards), item_key(target_id, item_id, target_shards)
+        return (source["PK"], source["SK"]), (target["PK"], target["SK"])
+
+    def read_rows(item_ids):
+        """Current source and destination rows of the items, by (PK, SK)."""
+        return {
+            (it["PK"], it["SK"]): it
+            for it in batch_get_items(
+                [{"PK": pk, "SK": sk} for item_id in item_ids for pk, sk in keys(item_id)], ConsistentRead=True,
+                ProjectionExpression="PK, SK, itemName, quantity, reorderThreshold, lowStockPK, version"
             )
-            body = {"message": f"Revoked access for user {user_to_revoke} in warehouse {warehouse_id}."}
-
-        # --------------------------------------------------------------------
-        # 3. ITEM MANAGEMENT (similar to previous example)
-        # --------------------------------------------------------------------
-        # 3A) CREATE ITEM (POST /warehouses/{warehouseId}/items)
-        elif route_key == "POST /warehouses/{warehouseId}/items":
-            warehouse_id = path_parameters.get("warehouseId")
-            item_id = request_body.get("itemId")
-            item_name = request_body.get("itemName", "")
-            quantity = request_body.get("quantity", 0)
-
-            # Suppose "owner" or "editor" can create items
+        }
+
+    def check_stock(item_ids, rows):
+        for item_id in item_ids:
+            source = rows.get(keys(item_id)[0])
+            if source is None:
+                raise LookupError(f"Item {item_id} not found in warehouse {source_id}.")
+            if source.get("quantity", 0) < quantities[item_id]:
+                raise ValueError(f"Insufficient stock for item {item_id}.")
+
+    # Reject the whole transfer up front if any item is missing or short
+    item_ids = list(quantities)
+    all_rows = read_rows(item_ids)
+    try:
+        check_stock(item_ids, all_rows)
+    except LookupError as le:
+        return 404, {"error": str(le)}
+
+    # Each batch is one transaction: decrement in the source, increment (or
+    # create) in the destination and move the totals, only if every row is
+    # still as read (stock_condition)
+    transferred = []
+    batch_size = TRANSFER_BATCH_ITEMS if source_shards == target_shards == 1 else SHARDED_TRANSFER_BATCH_ITEMS
+    batches = [item_ids[i:i + batch_size] for i in range(0, len(item_ids), batch_size)]
+    for batch in batches:
+        rows = all_rows
+        for attempt in range(ITEM_WRITE_MAX_ATTEMPTS):
+            if rows is None:
+                rows = read_rows(batch)
+                try:
+                    check_stock(batch, rows)
+                except (LookupError, ValueError) as e:
+                    return 409, {"error": f"{e} Transfer stopped.", "transferred": transferred}
+            # (warehouse, item PK) -> [item delta, quantity delta] of its totals row
+            actions, results, totals = [], [], {}
+            for item_id in batch:
+                quantity = quantities[item_id]
+                (source_pk, sk), (target_pk, _) = keys(item_id)
+                source = rows[(source_pk, sk)]
+                target = rows.get((target_pk, sk))
+                actions.append({"Update": stock_update(source_id, {"PK": source_pk, "SK": sk}, source,
+                                                       source.get("quantity", 0) - quantity)})
+                if target is None:
+                    actions.append({"Put": {
+                        "Item": {"PK": target_pk, "SK": sk, "itemName": source.get("itemName", ""),
+                                 "quantity": quantity, "version": 1, "updatedAt": now_ms()},
+                        "ConditionExpression": "attribute_not_exists(PK)"
+                    }})
+                else:
+                    actions.append({"Update": stock_update(target_id, {"PK": target_pk, "SK": sk}, target,
+                                                           target.get("quantity", 0) + quantity)})
+                totals.setdefault((source_id, source_pk), [0, 0])[1] -= quantity
+                target_totals = totals.setdefault((target_id, target_pk), [0, 0])
+                target_totals[0] += 1 if target is None else 0
+                target_totals[1] += quantity
+                results.append({
+                    "itemId": item_id,
+                    "quantity": quantity,
+                    "fromQuantity": source.get("quantity", 0) - quantity,
+                    "toQuantity": (target or {}).get("quantity", 0) + quantity
+                })
+            for (warehouse_id, item_pk), (item_delta, quantity_delta) in totals.items():
+                actions.append({"Update": totals_update(warehouse_id, item_delta, quantity_delta, item_pk)})
             try:
-                require_access(warehouse_id, authorized_user_id, allowed_roles=["owner", "editor"])
-            except PermissionError as pe:
-                statusCode = 403
-                body = {"error": str(pe)}
-                return build_response(statusCode, body, headers)
-
-            # Check if item already exists
-            resp = table.get_item(
-                Key={
-                    "PK": f"WAREHOUSE#{warehouse_id}",
-                    "SK": f"ITEM#{item_id}"
-                }
+                transact_items(actions)
+            except Throttled as te:
+                if not transferred:
+                    raise
+                # Earlier batches are committed: a final answer listing them, as
+                # repeating the whole request would move them again
+                return 409, {"error": f"{te} Transfer stopped.", "transferred": transferred}
+            except ClientError as e:
+                failed = failed_conditions(e)
+                if not failed:
+                    raise
+                if max(failed) >= 2 * len(batch):
+                    return 404, {"error": "Warehouse not found", "transferred": transferred}
+                rows = None  # an item changed since we read it
+                continue
+            transferred.extend(results)
+            break
+        else:
+            conflict = 409, {"error": "Items are being modified concurrently, please retry.",
+                             "transferred": transferred}
+            return conflict if transferred else retry_later(*conflict)
+
+    return 200, {
+        "message": f"Moved {len(transferred)} items from warehouse {source_id} to {target_id}.",
+        "transferred": transferred
+    }
+
+# ----------------------------------------------------------------------------
+# 4. STOCK REPORTS
+# ----------------------------------------------------------------------------
+# 4A) LOW STOCK IN ONE WAREHOUSE (GET /warehouses/{warehouseId}/low-stock)
+def list_low_stock(request):
+    # One page of the warehouse's partition of the sparse LowStockIndex
+    pk = f"WAREHOUSE#{request.warehouse_id}"
+    query_kwargs = {
+        "IndexName": low_stock_index,
+        "KeyConditionExpression": "lowStockPK = :pk",
+        "ExpressionAttributeValues": {":pk": pk},
+        "Limit": parse_limit(request.query.get("limit"))
+    }
+    start_key = decode_cursor(request.query.get("cursor"), lowStockPK=pk)
+    if start_key:
+        query_kwargs["ExclusiveStartKey"] = start_key
+    resp = dynamo.query_records(**query_kwargs)
+    return page_response(request, serialization.encode_low_stock, resp.get("Items", []), "items",
+                         encode_cursor(resp.get("LastEvaluatedKey")))
+
+# 4B) LOW STOCK ACROSS THE CALLER'S WAREHOUSES (GET /low-stock)
+def list_my_low_stock(request):
+    # Step 1: one page of the caller's warehouses from UserAccessIndex; the
+    # cursor pages over warehouses
+    query_kwargs = {
+        "IndexName": user_access_index,
+        "KeyConditionExpression": "userId = :uid",
+        "ExpressionAttributeValues": {":uid": request.user_id},
+        "ProjectionExpression": "PK",
+        "Limit": parse_limit(request.query.get("limit"))
+    }
+    start_key = decode_cursor(request.query.get("cursor"), userId=request.user_id)
+    if start_key:
+        query_kwargs["ExclusiveStartKey"] = start_key
+    resp = dynamo.query(**query_kwargs)
+    warehouse_pks = [it["PK"] for it in resp.get("Items", [])]
+
+    # Step 2: the low-stock partition of each of them, in parallel
+    def low_stock_rows(pk):
+        rows = []
+        index_kwargs = {
+            "IndexName": low_stock_index,
+            "KeyConditionExpression": "lowStockPK = :pk",
+            "ExpressionAttributeValues": {":pk": pk}
+        }
+        while True:
+            page = dynamo.query_records(**index_kwargs)
+            rows.extend(page.get("Items", []))
+            if "LastEvaluatedKey" not in page:
+                return rows
+            index_kwargs["ExclusiveStartKey"] = page["LastEvaluatedKey"]
+
+    records = []
+    if warehouse_pks:
+        with ThreadPoolExecutor(max_workers=min(PARALLEL_QUERY_WORKERS, len(warehouse_pks))) as pool:
+            for rows in pool.map(low_stock_rows, warehouse_pks):
+                records.extend(rows)
+    return page_response(request, serialization.encode_low_stock, records, "items",
+                         encode_cursor(resp.get("LastEvaluatedKey")))
+
+# ----------------------------------------------------------------------------
+# 5. EXPORTS AND IMPORTS
+# ----------------------------------------------------------------------------
+# 5A) START AN EXPORT (POST /warehouses/{warehouseId}/exports)
+def create_export(request):
+    export_format = request.body.get("format", "ndjson").lower()
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"format must be one of {', '.join(EXPORT_FORMATS)}.")
+    compress = request.body.get("gzip", False)
+    export_id = uuid.uuid4().hex
+    object_key = f"exports/{request.warehouse_id}/{export_id}.{export_format}" + (".gz" if compress else "")
+    content_type = "application/gzip" if compress else EXPORT_FORMATS[export_format][0]
+
+    now = int(time.time())
+    job = {
+        "PK": f"WAREHOUSE#{request.warehouse_id}",
+        "SK": f"EXPORT#{export_id}",
+        "status": "running",
+        "format": export_format,
+        "gzip": compress,
+        "objectKey": object_key,
+        "uploadId": storage.create_multipart_upload(object_key, content_type),
+        "parts": [],
+        "checkpoint": 0,
+        "itemCount": 0,
+        "bytes": 0,
+        "itemShards": item_shards(request.warehouse_id),
+        "requestedBy": request.user_id,
+        "createdAt": now,
+        "checkpointedAt": now
+    }
+    dynamo.put_item(Item=job)
+
+    # Small warehouses finish within the request; larger ones continue in the
+    # background and are polled with GET .../exports/{exportId}
+    run_export(job, request.context, deadline=time.monotonic() + JOB_INLINE_BUDGET_MS / 1000)
+    return export_response(job)
+
+# 5B) EXPORT STATUS (GET /warehouses/{warehouseId}/exports/{exportId})
+def get_export(request):
+    job = dynamo.get_item(
+        Key={"PK": f"WAREHOUSE#{request.warehouse_id}", "SK": f"EXPORT#{request.path.get('exportId')}"}
+    ).get("Item")
+    if not job:
+        return 404, {"error": "Export not found"}
+    return export_response(job)
+
+# 5C) START AN IMPORT (POST /warehouses/{warehouseId}/imports)
+def create_import(request):
+    object_key = request.body.get("objectKey")
+    prefix = f"imports/{request.warehouse_id}/"
+    if not object_key.startswith(prefix) or len(object_key) == len(prefix):
+        raise ValueError(f"objectKey must be an object under {prefix}")
+    import_format = request.body.get("format")
+    if import_format is None:
+        import_format = IMPORT_EXTENSIONS.get(os.path.splitext(object_key)[1].lower())
+        if import_format is None:
+            raise ValueError("format is required for this objectKey (ndjson or csv).")
+    elif import_format.lower() not in ("ndjson", "csv"):
+        raise ValueError("format must be one of ndjson, csv.")
+    found = storage.head(object_key)
+    if found is None:
+        return 404, {"error": f"Object {object_key} not found"}
+    size, object_etag = found
+
+    now = int(time.time())
+    job = {
+        "PK": f"WAREHOUSE#{request.warehouse_id}",
+        "SK": f"IMPORT#{uuid.uuid4().hex}",
+        "status": "running",
+        "format": import_format.lower(),
+        "objectKey": object_key,
+        "objectETag": object_etag,
+        "size": size,
+        "offset": 0,  # byte offset of the first line not yet imported
+        "lines": 0,
+        "imported": 0,
+        "failed": 0,
+        "errors": [],
+        "checkpoint": 0,
+        "itemShards": item_shards(request.warehouse_id),
+        "requestedBy": request.user_id,
+        "createdAt": now,
+        "checkpointedAt": now
+    }
+    dynamo.put_item(Item=job)
+
+    run_import(job, request.context, deadline=time.monotonic() + JOB_INLINE_BUDGET_MS / 1000)
+    return import_response(job)
+
+# 5D) IMPORT STATUS (GET /warehouses/{warehouseId}/imports/{importId})
+def get_import(request):
+    job = dynamo.get_item(
+        Key={"PK": f"WAREHOUSE#{request.warehouse_id}", "SK": f"IMPORT#{request.path.get('importId')}"}
+    ).get("Item")
+    if not job:
+        return 404, {"error": "Import not found"}
+    return import_response(job)
+
+class RoleCache:
+    """
+    Size-bounded LRU + TTL cache of (warehouse_id, user_id) -> role that lives
+    across warm invocations. The TTL is what bounds staleness: a grant change
+    made by another container is seen here when the entry expires. Entries
+    also remember the warehouse's accessVersion (bumped on the METADATA row by
+    grant/revoke/delete) they were filled under, and stop matching once a newer
+    version is observed; but the version is only observed when a request reads
+    METADATA anyway (GET of the warehouse, GET /warehouses, access changes made
+    in this container), never just to check an entry, so it can only end one early.
+    It also remembers each warehouse's item shard count for as long, which the
+    ACCESS rows carry and which only changes if the warehouse is deleted and
+    created again.
+    """
+
+    def __init__(self, max_size, ttl_seconds):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()  # (warehouse_id, user_id) -> (role, version, expires_at)
+        self._versions = OrderedDict()  # warehouse_id -> highest accessVersion seen
+        self._shards = OrderedDict()  # warehouse_id -> (itemShards, expires_at)
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, warehouse_id, user_id):
+        key = (warehouse_id, user_id)
+        entry = self._entries.get(key)
+        if entry is not None:
+            role, version, expires_at = entry
+            if expires_at > time.monotonic() and version == self._versions.get(warehouse_id):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return role
+            del self._entries[key]
+        self.misses += 1
+        return None
+
+    def put(self, warehouse_id, user_id, role):
+        key = (warehouse_id, user_id)
+        self._entries[key] = (role, self._versions.get(warehouse_id),
+                              time.monotonic() + self.ttl_seconds)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, warehouse_id, user_id):
+        self._entries.pop((warehouse_id, user_id), None)
+
+    def invalidate_warehouse(self, warehouse_id):
+        for key in [k for k in self._entries if k[0] == warehouse_id]:
+            del self._entries[key]
+        self._versions.pop(warehouse_id, None)
+        self._shards.pop(warehouse_id, None)
+
+    def observe_version(self, warehouse_id, version):
+        """
+        Records the accessVersion read from a METADATA row. A version we have not
+        seen before invalidates every cached role of that warehouse.
+        """
+        if version is None:
+            return
+        version = int(version)
+        known = self._versions.get(warehouse_id)
+        if known is None or version > known:
+            self._versions[warehouse_id] = version
+        self._versions.move_to_end(warehouse_id)
+        while len(self._versions) > self.max_size:
+            self._versions.popitem(last=False)
+
+    def observe_shards(self, warehouse_id, shards):
+        """Records the itemShards read from an ACCESS or METADATA row (1 when absent)."""
+        self._shards[warehouse_id] = (int(shards), time.monotonic() + self.ttl_seconds)
+        self._shards.move_to_end(warehouse_id)
+        while len(self._shards) > self.max_size:
+            self._shards.popitem(last=False)
+
+    def shards(self, warehouse_id):
+        """The warehouse's item shard count, None if not seen yet or expired."""
+        entry = self._shards.get(warehouse_id)
+        if entry is None:
+            return None
+        shards, expires_at = entry
+        if expires_at <= time.monotonic():
+            del self._shards[warehouse_id]
+            return None
+        return shards
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._entries)}
+
+role_cache = RoleCache(ROLE_CACHE_MAX_SIZE, ROLE_CACHE_TTL_SECONDS)
+
+class RateLimiter:
+    """
+    Token bucket per warehouse: `rate` requests per second on average, bursts of
+    up to `burst`. Buckets live in the container (LRU-bounded like RoleCache), so
+    the limit applies per concurrent execution environment; it keeps one busy
+    warehouse from using up the table's capacity for everyone else.
+    """
+
+    def __init__(self, rate, burst, max_size):
+        self.rate = rate
+        self.burst = max(burst, 1.0)
+        self.max_size = max_size
+        self._buckets = OrderedDict()  # warehouse_id -> (tokens, updated_at)
+
+    def acquire(self, warehouse_id, cost=1.0):
+        """Takes `cost` tokens; returns 0 if allowed, else the seconds until they are available."""
+        now = time.monotonic()
+        tokens, updated_at = self._buckets.get(warehouse_id, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - updated_at) * self.rate)
+        wait = 0.0
+        if tokens >= cost:
+            tokens -= cost
+        else:
+            wait = (cost - tokens) / self.rate
+        self._buckets[warehouse_id] = (tokens, now)
+        self._buckets.move_to_end(warehouse_id)
+        while len(self._buckets) > self.max_size:
+            self._buckets.popitem(last=False)
+        return wait
+
+rate_limiter = RateLimiter(WAREHOUSE_RATE_LIMIT, WAREHOUSE_BURST, ROLE_CACHE_MAX_SIZE)
+
+def charge_rate_limit(warehouse_id):
+    """
+    Takes a request from the warehouse's token bucket when warehouseRateLimit is
+    set, raising Throttled once it is empty. Only called after the caller's role
+    is checked, so users without access cannot use up a warehouse's budget.
+    """
+    if WAREHOUSE_RATE_LIMIT > 0:
+        wait = rate_limiter.acquire(warehouse_id)
+        if wait:
+            raise Throttled("Too many requests for this warehouse, please retry.", wait)
+
+def get_user_access_role(warehouse_id, user_id, fresh=False):
+    """
+    Returns the role (str) if user has an ACCESS row in that warehouse partition,
+    or None if no access row found. Positive answers are served from role_cache
+    unless fresh is set, which reads the row with ConsistentRead: role_cache
+    only learns of a revocation made by another container when it reads the
+    warehouse's METADATA row or its entry expires.
+    """
+    if not fresh:
+        role = role_cache.get(warehouse_id, user_id)
+        if role is not None:
+            return role
+    resp = dynamo.get_item(
+        Key={
+            "PK": f"WAREHOUSE#{warehouse_id}",
+            "SK": f"ACCESS#{user_id}"
+        },
+        ConsistentRead=fresh
+    )
+    item = resp.get("Item")
+    if item:
+        role_cache.put(warehouse_id, user_id, item.get("role"))
+        role_cache.observe_shards(warehouse_id, item.get("itemShards", 1))
+        return item.get("role")
+    role_cache.invalidate(warehouse_id, user_id)
+    return None
+
+def require_access(warehouse_id, user_id, allowed_roles=None, fresh=False):
+    """
+    Raises a 403 error if user_id does not have one of the allowed_roles in the warehouse.
+    If allowed_roles is None, any valid role is accepted. fresh skips role_cache
+    (see get_user_access_role); write and owner routes use it.
+    """
+    role = get_user_access_role(warehouse_id, user_id, fresh=fresh)
+    check_role(role, allowed_roles)
+    # If we get here, user has valid permission
+
+def check_role(role, allowed_roles=None):
+    """
+    Raises PermissionError unless role is set and (if given) one of allowed_roles.
+    """
+    if role is None:
+        raise PermissionError("No access to this warehouse.")
+    if allowed_roles and role not in allowed_roles:
+        raise PermissionError(f"Must have one of {allowed_roles} roles to perform this action.")
+
+def read_with_access(warehouse_id, user_id, sk=None, allowed_roles=None, consistent=False, item_id=None):
+    """
+    Authorizes user_id and reads the row (PK = WAREHOUSE#<warehouse_id>, SK = sk,
+    or with item_id the item's row in its shard) in a single DynamoDB round
+    trip: a plain GetItem when the role is cached, otherwise one BatchGetItem
+    for the ACCESS row and the target row, or TransactGetItems (a consistent
+    snapshot of both) when consistent is set. An item of a sharded warehouse
+    not seen before by this container takes a second read from its shard.
+    Raises PermissionError like require_access; returns the row or None.
+    """
+    pk = f"WAREHOUSE#{warehouse_id}"
+
+    def target_key(shards):
+        if item_id is None:
+            return {"PK": pk, "SK": sk}
+        return item_key(warehouse_id, item_id, shards)
+
+    role = None if consistent else role_cache.get(warehouse_id, user_id)
+    if role is not None:
+        check_role(role, allowed_roles)
+        charge_rate_limit(warehouse_id)
+        target = dynamo.get_item(Key=target_key(item_shards(warehouse_id))).get("Item")
+        if sk == "METADATA" and target:
+            role_cache.observe_version(warehouse_id, target.get("accessVersion"))
+        return target
+
+    # The ACCESS row tells the shard count; until then use the one seen last
+    access_key = {"PK": pk, "SK": f"ACCESS#{user_id}"}
+    guessed_key = target_key(role_cache.shards(warehouse_id) or 1)
+    if consistent:
+        access, target = dynamo.transact_get_items([access_key, guessed_key])
+    else:
+        rows = {(it["PK"], it["SK"]): it for it in batch_get_items([access_key, guessed_key])}
+        access = rows.get((access_key["PK"], access_key["SK"]))
+        target = rows.get((guessed_key["PK"], guessed_key["SK"]))
+
+    role = access.get("role") if access else None
+    check_role(role, allowed_roles)
+    charge_rate_limit(warehouse_id)
+    if sk == "METADATA" and target:
+        role_cache.observe_version(warehouse_id, target.get("accessVersion"))
+    role_cache.put(warehouse_id, user_id, role)
+    role_cache.observe_shards(warehouse_id, access.get("itemShards", 1))
+    key = target_key(role_cache.shards(warehouse_id))
+    if key != guessed_key:
+        target = dynamo.get_item(Key=key, ConsistentRead=consistent).get("Item")
+    return target
+
+def is_condition_failure(error):
+    """
+    True if a ClientError was caused by a failed ConditionExpression, either on a
+    single write or on one of the actions of a cancelled transaction.
+    """
+    return bool(failed_conditions(error))
+
+def is_throttling(error):
+    """True for a DynamoDB throttling error, also inside a cancelled transaction."""
+    if not isinstance(error, ClientError):
+        return False
+    if error.response.get("Error", {}).get("Code") in THROTTLING_ERRORS:
+        return True
+    return any(reason.get("Code") in THROTTLING_ERRORS
+               for reason in error.response.get("CancellationReasons", []))
+
+def is_transaction_conflict(error):
+    """
+    True for a write that lost against a concurrent transaction: a transaction
+    cancelled only by TransactionConflict reasons (failed conditions are the
+    caller's to handle), or a single write that met a transaction in progress.
+    """
+    if not isinstance(error, ClientError):
+        return False
+    code = error.response.get("Error", {}).get("Code")
+    if code == "TransactionConflictException":
+        return True
+    if code != "TransactionCanceledException":
+        return False
+    reasons = [r.get("Code") for r in error.response.get("CancellationReasons", [])]
+    return "TransactionConflict" in reasons and "ConditionalCheckFailed" not in reasons
+
+def failed_conditions(error):
+    """
+    Positions of the actions whose ConditionExpression failed: {0} for a single
+    write, the matching CancellationReasons for a transaction, else empty.
+    """
+    code = error.response.get("Error", {}).get("Code")
+    if code == "ConditionalCheckFailedException":
+        return {0}
+    if code == "TransactionCanceledException":
+        reasons = error.response.get("CancellationReasons", [])
+        return {i for i, r in enumerate(reasons) if r.get("Code") == "ConditionalCheckFailed"}
+    return set()
+
+def totals_update(warehouse_id, item_delta, quantity_delta, item_pk=None):
+    """
+    The UpdateItem parameters that add to the itemCount / totalQuantity counters
+    on the warehouse METADATA row (which must exist). For an item of a sharded
+    warehouse (item_pk is its shard partition) they go to that shard's TOTALS
+    row instead, so item writes do not all meet on one row.
+    """
+    pk = f"WAREHOUSE#{warehouse_id}"
+    return {
+        "Key": {"PK": pk, "SK": "METADATA"} if item_pk in (None, pk) else {"PK": item_pk, "SK": "TOTALS"},
+        "UpdateExpression": "ADD itemCount :n, totalQuantity :q, version :one",
+        "ConditionExpression": "attribute_exists(PK)",
+        "ExpressionAttributeValues": {":n": item_delta, ":q": quantity_delta, ":one": 1}
+    }
+
+def update_totals(warehouse_id, item_delta, quantity_delta, item_pk=None):
+    """Adds to the warehouse totals on their own; a deleted warehouse is skipped."""
+    try:
+        dynamo.update_item(**totals_update(warehouse_id, item_delta, quantity_delta, item_pk))
+    except ClientError as e:
+        if not is_condition_failure(e):
+            raise
+
+ITEM_WRITES = {"Put": dynamo.put_item, "Update": dynamo.update_item, "Delete": dynamo.delete_item}
+
+def write_item_with_totals(warehouse_id, action, item_delta, quantity_delta, also=()):
+    """
+    Applies an item write ({"Put"|"Update"|"Delete": params}) and the matching
+    change of the warehouse totals in one TransactWriteItems call; the item
+    action comes first, so failed_conditions() reports it as position 0 (the
+    totals are 1, then the actions in `also`). With nothing to add to the
+    totals (and nothing else to write) it is a plain single-item write.
+    """
+    (kind, params), = action.items()
+    if not item_delta and not quantity_delta and not also:
+        return ITEM_WRITES[kind](**params)
+    item_pk = params["Item" if kind == "Put" else "Key"]["PK"]
+    return transact_items([
+        action,
+        {"Update": totals_update(warehouse_id, item_delta, quantity_delta, item_pk)},
+        *also
+    ])
+
+def transact_items(actions):
+    """
+    TransactWriteItems for item writes that also move the warehouse totals.
+    All item writes of a warehouse update the same totals row (METADATA, or a
+    shard's TOTALS row), so concurrent ones cancel each other with
+    TransactionConflict, which the SDK does not retry. Retries those with
+    jittered exponential backoff, then raises Throttled (429 with Retry-After).
+    """
+    for attempt in range(TRANSACTION_CONFLICT_MAX_ATTEMPTS):
+        try:
+            return dynamo.transact_write_items(actions)
+        except ClientError as e:
+            if not is_transaction_conflict(e):
+                raise
+        if attempt + 1 < TRANSACTION_CONFLICT_MAX_ATTEMPTS:
+            time.sleep(random.uniform(0, 0.025 * (2 ** attempt)))
+    instrumentation.log("warning", "Transaction conflicts persisted.", attempts=TRANSACTION_CONFLICT_MAX_ATTEMPTS)
+    raise Throttled("Too many concurrent writes to this warehouse, please retry.")
+
+def read_stock(key):
+    """
+    Strongly consistent read of an item's stock attributes (quantity,
+    reorderThreshold, lowStockPK) and version; None if the item does not exist.
+    """
+    return dynamo.get_item(
+        Key=key,
+        ConsistentRead=True,
+        ProjectionExpression="PK, quantity, reorderThreshold, lowStockPK, version"
+    ).get("Item")
+
+def stock_condition(stock):
+    """
+    ConditionExpression (and its values) that holds while the item's quantity,
+    reorderThreshold and version are still the ones in `stock` from read_stock().
+    """
+    conditions = []
+    values = {}
+    for attribute, placeholder in (("quantity", ":oldqt"), ("reorderThreshold", ":oldrt"),
+                                   ("version", ":oldver")):
+        if attribute in stock:
+            conditions.append(f"{attribute} = {placeholder}")
+            values[placeholder] = stock[attribute]
+        else:
+            conditions.append(f"attribute_not_exists({attribute})")
+    return " AND ".join(conditions), values
+
+def stock_update(warehouse_id, key, stock, quantity):
+    """
+    The UpdateItem parameters that set an item's quantity (and its low-stock
+    flag) if its stock is still `stock` from read_stock().
+    """
+    condition, values = stock_condition(stock)
+    update_expression = "SET quantity = :qt, updatedAt = :now"
+    values.update({":qt": quantity, ":now": now_ms(), ":one": 1})
+    if is_low_stock(quantity, stock.get("reorderThreshold")):
+        update_expression += ", lowStockPK = :lsk"
+        values[":lsk"] = f"WAREHOUSE#{warehouse_id}"
+    else:
+        update_expression += " REMOVE lowStockPK"
+    return {
+        "Key": key,
+        "UpdateExpression": update_expression + " ADD version :one",
+        "ConditionExpression": condition,
+        "ExpressionAttributeValues": values
+    }
+
+def is_low_stock(quantity, threshold):
+    """
+    True if an item belongs in LowStockIndex (below its reorder threshold). Its
+    lowStockPK is the warehouse partition key, also for items in a shard.
+    """
+    return threshold is not None and (quantity or 0) < threshold
+
+def sync_low_stock(warehouse_id, key, stock):
+    """
+    Sets or removes lowStockPK after a write that could not compute it up front
+    (ADD adjustments). The conditions compare the stored attributes, so a write
+    racing with another one never leaves a wrong flag behind; if it fails, the
+    other writer's own sync has the final word.
+    """
+    low_stock = is_low_stock(stock.get("quantity"), stock.get("reorderThreshold"))
+    if not stock or low_stock == ("lowStockPK" in stock):
+        return
+    try:
+        if low_stock:
+            dynamo.update_item(
+                Key=key,
+                UpdateExpression="SET lowStockPK = :lsk",
+                ConditionExpression="quantity < reorderThreshold",
+                ExpressionAttributeValues={":lsk": f"WAREHOUSE#{warehouse_id}"}
             )
-            if "Item" in resp:
-                statusCode = 400
-                body = {"error": f"Item {item_id} already exists in warehouse {warehouse_id}."}
-                return build_response(statusCode, body, headers)
-
-            table.put_item(
-                Item={
-                    "PK": f"WAREHOUSE#{warehouse_id}",
-                    "SK": f"ITEM#{item_id}",
-                    "itemName": item_name,
-                    "quantity": Decimal(str(quantity))
-                }
+        else:
+            dynamo.update_item(
+                Key=key,
+                UpdateExpression="REMOVE lowStockPK",
+                ConditionExpression="attribute_not_exists(reorderThreshold) OR quantity >= reorderThreshold"
             )
-            body = {"message": f"Created item {item_id} in warehouse {warehouse_id}."}
+    except ClientError as e:
+        if not is_condition_failure(e):
+            raise
 
-        # 3B) LIST ITEMS (GET /warehouses/{warehouseId}/items)
-        elif route_key == "GET /warehouses/{warehouseId}/items":
-            warehouse_id = path_parameters.get("warehouseId")
+def recount_warehouse(warehouse_id):
+    """
+    Recomputes itemCount / totalQuantity from the ITEM rows and stores them on
+    METADATA, or per shard on the TOTALS rows of a sharded warehouse (shards
+    are counted in parallel). Used to backfill warehouses created before the
+    counters existed (invoke the function with {"task": "recountWarehouse",
+    "warehouseId": ...}).
+    """
+    pk = f"WAREHOUSE#{warehouse_id}"
+    pks = shard_pks(warehouse_id, item_shards(warehouse_id))
 
-            # Any valid role can read items
-            try:
-                require_access(warehouse_id, authorized_user_id, allowed_roles=None)
-            except PermissionError as pe:
-                statusCode = 403
-                body = {"error": str(pe)}
-                return build_response(statusCode, body, headers)
-
-            # In production: do a Query for PK = WAREHOUSE#warehouse_id, SK begins_with ITEM#
-            scan_resp = table.scan()
-            all_items = scan_resp.get("Items", [])
-            warehouse_items = []
-            for it in all_items:
-                if it["PK"] == f"WAREHOUSE#{warehouse_id}" and it["SK"].startswith("ITEM#"):
-                    warehouse_items.append({
-                        "itemId": it["SK"].replace("ITEM#", ""),
-                        "itemName": it.get("itemName"),
-                        "quantity": int(it.get("quantity", 0))
-                    })
-            body = warehouse_items
-
-        # 3C) GET SINGLE ITEM (GET /warehouses/{warehouseId}/items/{itemId})
-        elif route_key == "GET /warehouses/{warehouseId}/items/{itemId}":
-            warehouse_id = path_parameters.get("warehouseId")
-            item_id = path_parameters.get("itemId")
-
-            # Any valid role can read
-            try:
-                require_access(warehouse_id, authorized_user_id, allowed_roles=None)
-            except PermissionError as pe:
-                statusCode = 403
-                body = {"error": str(pe)}
-                return build_response(statusCode, body, headers)
-
-            resp = table.get_item(
-                Key={
-                    "PK": f"WAREHOUSE#{warehouse_id}",
-                    "SK": f"ITEM#{item_id}"
-                }
-            )
-            item = resp.get("Item")
-            if not item:
-                statusCode = 404
-                body = {"error": "Item not found"}
-            else:
-                body = {
-                    "itemId": item["SK"].replace("ITEM#", ""),
-                    "itemName": item.get("itemName"),
-                    "quantity": int(item.get("quantity", 0))
-                }
+    def recount(item_pk):
+        query_kwargs = {
+            "KeyConditionExpression": "PK = :pk AND begins_with(SK, :prefix)",
+            "ExpressionAttributeValues": {":pk": item_pk, ":prefix": "ITEM#"},
+            "ProjectionExpression": "quantity"
+        }
+        item_count, total_quantity = 0, 0
+        while True:
+            resp = dynamo.query(**query_kwargs)
+            for it in resp.get("Items", []):
+                item_count += 1
+                total_quantity += it.get("quantity", 0)
+            if "LastEvaluatedKey" not in resp:
+                break
+            query_kwargs["ExclusiveStartKey"] = resp["LastEvaluatedKey"]
+        dynamo.update_item(
+            Key={"PK": pk, "SK": "METADATA"} if item_pk == pk else {"PK": item_pk, "SK": "TOTALS"},
+            UpdateExpression="SET itemCount = :n, totalQuantity = :q ADD version :one",
+            ConditionExpression="attribute_exists(PK)",
+            ExpressionAttributeValues={":n": item_count, ":q": total_quantity, ":one": 1}
+        )
+        return item_count, total_quantity
 
-        # 3D) UPDATE ITEM (PUT /warehouses/{warehouseId}/items/{itemId})
-        elif route_key == "PUT /warehouses/{warehouseId}/items/{itemId}":
-            warehouse_id = path_parameters.get("warehouseId")
-            item_id = path_parameters.get("itemId")
-            new_name = request_body.get("itemName")
-            new_quantity = request_body.get("quantity")
+    if len(pks) == 1:
+        counts = [recount(pk)]
+    else:
+        with ThreadPoolExecutor(max_workers=min(PARALLEL_QUERY_WORKERS, len(pks))) as pool:
+            counts = list(pool.map(recount, pks))
+    return {"itemCount": sum(n for n, _ in counts), "totalQuantity": sum(q for _, q in counts)}
 
-            # Suppose "owner" or "editor" can update items
+def backfill_access_user_ids(context, start_key=None):
+    """
+    Stamps userId onto ACCESS rows written before the UserAccessIndex existed,
+    so their warehouses show up in GET /warehouses (invoke the function once
+    with {"task": "backfillAccessUserIds"}). Scans the table page by page; when
+    the Lambda budget runs low it schedules a continuation from the last page.
+    Returns (rows updated, whether the scan finished).
+    """
+    scan_kwargs = {
+        "FilterExpression": "begins_with(SK, :prefix) AND attribute_not_exists(userId)",
+        "ExpressionAttributeValues": {":prefix": "ACCESS#"},
+        "ProjectionExpression": "PK, SK",
+        "Limit": BACKFILL_PAGE_SIZE
+    }
+    if start_key:
+        scan_kwargs["ExclusiveStartKey"] = start_key
+    updated = 0
+    while True:
+        resp = dynamo.scan(**scan_kwargs)
+        for it in resp.get("Items", []):
             try:
-                require_access(warehouse_id, authorized_user_id, allowed_roles=["owner", "editor"])
-            except PermissionError as pe:
-                statusCode = 403
-                body = {"error": str(pe)}
-                return build_response(statusCode, body, headers)
-
-            update_expr = []
-            expression_values = {}
-            if new_name is not None:
-                update_expr.append("itemName = :nm")
-                expression_values[":nm"] = new_name
-            if new_quantity is not None:
-                update_expr.append("quantity = :qt")
-                expression_values[":qt"] = Decimal(str(new_quantity))
-
-            if update_expr:
-                table.update_item(
-                    Key={
-                        "PK": f"WAREHOUSE#{warehouse_id}",
-                        "SK": f"ITEM#{item_id}"
-                    },
-                    UpdateExpression="SET " + ", ".join(update_expr),
-                    ExpressionAttributeValues=expression_values
+                dynamo.update_item(
+                    Key={"PK": it["PK"], "SK": it["SK"]},
+                    UpdateExpression="SET userId = :uid",
+                    # Revoked in the meantime, or already stamped by a grant
+                    ConditionExpression="attribute_exists(PK) AND attribute_not_exists(userId)",
+                    ExpressionAttributeValues={":uid": it["SK"][len("ACCESS#"):]}
                 )
-                body = {"message": f"Item {item_id} updated in warehouse {warehouse_id}."}
-            else:
-                body = {"message": "No fields to update."}
+                updated += 1
+            except ClientError as e:
+                if not is_condition_failure(e):
+                    raise
+        if "LastEvaluatedKey" not in resp:
+            return updated, True
+        scan_kwargs["ExclusiveStartKey"] = resp["LastEvaluatedKey"]
+        if context is not None and context.get_remaining_time_in_millis() < DELETE_TIME_RESERVE_MS:
+            schedule_continuation(context, {"task": "backfillAccessUserIds",
+                                            "startKey": resp["LastEvaluatedKey"]})
+            return updated, False
 
-        # 3E) DELETE ITEM (DELETE /warehouses/{warehouseId}/items/{itemId})
-        elif route_key == "DELETE /warehouses/{warehouseId}/items/{itemId}":
-            warehouse_id = path_parameters.get("warehouseId")
-            item_id = path_parameters.get("itemId")
+def to_decimal(value, field):
+    """
+    Converts a JSON number (or numeric string) into a finite Decimal for DynamoDB,
+    raising ValueError naming the field otherwise.
+    """
+    if isinstance(value, bool):
+        raise ValueError(f"{field} must be a number.")
+    try:
+        number = Decimal(str(value))
+    except ArithmeticError:
+        raise ValueError(f"{field} must be a number.")
+    if not number.is_finite():
+        raise ValueError(f"{field} must be a finite number.")
+    return number
 
-            # Suppose "owner" or "editor" can delete items
-            try:
-                require_access(warehouse_id, authorized_user_id, allowed_roles=["owner", "editor"])
-            except PermissionError as pe:
-                statusCode = 403
-                body = {"error": str(pe)}
-                return build_response(statusCode, body, headers)
-
-            table.delete_item(
-                Key={
-                    "PK": f"WAREHOUSE#{warehouse_id}",
-                    "SK": f"ITEM#{item_id}"
-                }
-            )
-            body = {"message": f"Deleted item {item_id} from warehouse {warehouse_id}."}
+BODY_TYPES = {
+    "string": (str,),
+    "number": (int, float),
+    "boolean": (bool,),
+    "array": (list,),
+    "object": (dict,)
+}
 
-        # --------------------------------------------------------------------
-        # FALLBACK: No matching route
-        # --------------------------------------------------------------------
-        else:
-            statusCode = 400
-            body = {"error": f"Unsupported route: {route_key}"}
+def validate_body(body, schema):
+    """
+    Checks the request body against a route's {field: (type, required)} schema,
+    raising ValueError (400) on the first problem.
+    """
+    for field, (type_name, required) in schema.items():
+        value = body.get(field)
+        if value is None:
+            if required:
+                raise ValueError(f"{field} is required.")
+            continue
+        if (isinstance(value, bool) != (type_name == "boolean")
+                or not isinstance(value, BODY_TYPES[type_name])):
+            raise ValueError(f"{field} must be a {type_name}.")
 
-    except PermissionError as pe:
-        statusCode = 403
-        body = {"error": str(pe)}
-    except Exception as e:
-        print("ERROR:", e)
-        statusCode = 500
-        body = {"error": str(e)}
+def is_true(value):
+    """Interprets a query string flag such as ?consistent=true."""
+    return str(value).lower() in ("1", "true", "yes")
+
+def bump_access_version(warehouse_id, if_match=None):
+    """
+    Increments accessVersion on the warehouse METADATA row so that cached roles
+    filled under an older version are no longer used. With if_match (parsed
+    If-Match tags) raises PreconditionFailed unless the row's version matches.
+    """
+    condition, condition_values = "attribute_exists(PK)", {}
+    if if_match is not None:
+        condition, condition_values = version_condition(if_match)
+    try:
+        resp = dynamo.update_item(
+            Key={
+                "PK": f"WAREHOUSE#{warehouse_id}",
+                "SK": "METADATA"
+            },
+            UpdateExpression="ADD accessVersion :one",
+            ConditionExpression=condition,
+            ExpressionAttributeValues=dict(condition_values, **{":one": 1}),
+            ReturnValues="UPDATED_NEW"
+        )
+    except ClientError as e:
+        if not is_condition_failure(e):
+            raise
+        if if_match is not None:
+            raise PreconditionFailed(f"Warehouse {warehouse_id} has changed.")
+        return
+    role_cache.observe_version(warehouse_id, resp["Attributes"]["accessVersion"])
+
+def now_ms():
+    """The updatedAt stamp of an item write (epoch milliseconds)."""
+    return int(time.time() * 1000)
+
+def tombstone(key):
+    """The TOMBSTONE# row (next to the item's key) recording its deletion until TTL removes it."""
+    return {
+        "PK": key["PK"],
+        "SK": "TOMBSTONE#" + key["SK"][len("ITEM#"):],
+        "updatedAt": now_ms(),
+        "expiresAt": int(time.time()) + TOMBSTONE_TTL_SECONDS
+    }
+
+def etag(version, totals_version=None):
+    """
+    The strong ETag of a row version (rows written before versioning are 0).
+    A sharded warehouse adds the summed versions of its TOTALS rows; If-Match
+    compares the METADATA version in front of the dot.
+    """
+    if totals_version is not None:
+        return f'"{int(version or 0)}.{int(totals_version)}"'
+    return f'"{int(version or 0)}"'
 
-    return build_response(statusCode, body, headers)
+def parse_etags(header):
+    """
+    Parses an If-Match / If-None-Match header into "*" or a set of ETags;
+    None when the header is absent.
+    """
+    if header is None:
+        return None
+    if header.strip() == "*":
+        return "*"
+    # Weak tags (W/"3") name the same version; our ETags only change with it
+    return {tag.strip().replace("W/", "", 1) for tag in header.split(",") if tag.strip()}
+
+def etag_matches(tag, tags):
+    return tags is not None and (tags == "*" or tag in tags)
+
+def version_condition(tags):
+    """
+    ConditionExpression (and its values) requiring the row to exist and, unless
+    tags is "*", to have one of the versions of the parsed If-Match tags.
+    """
+    if tags == "*":
+        return "attribute_exists(PK)", {}
+    conditions = []
+    values = {}
+    for position, tag in enumerate(sorted(tags)):
+        try:
+            version = int(tag.strip('"').split(".")[0])
+        except ValueError:
+            continue  # not one of our ETags; can never match
+        if version == 0:
+            conditions.append("attribute_not_exists(version)")
+        else:
+            conditions.append(f"version = :ifm{position}")
+            values[f":ifm{position}"] = version
+    if not conditions:
+        raise PreconditionFailed("If-Match names no version of this resource.")
+    return "attribute_exists(PK) AND (" + " OR ".join(conditions) + ")", values
 
 class DecimalEncoder(json.JSONEncoder):
     def default(self, obj):
@@ -479,9 +1827,685 @@ class DecimalEncoder(json.JSONEncoder):
             return float(obj)
         return super(DecimalEncoder, self).default(obj)
 
+def parse_limit(value, default=DEFAULT_PAGE_SIZE, maximum=MAX_PAGE_SIZE):
+    """
+    Parses the `limit` query parameter into a page size between 1 and maximum.
+    """
+    if value is None or value == "":
+        return default
+    try:
+        limit = int(value)
+    except (TypeError, ValueError):
+        raise ValueError("limit must be an integer.")
+    if limit < 1:
+        raise ValueError("limit must be at least 1.")
+    return min(limit, maximum)
+
+def encode_cursor(last_evaluated_key):
+    """
+    Turns a DynamoDB LastEvaluatedKey into an opaque, URL-safe cursor string.
+    Returns None when there is no next page.
+    """
+    if not last_evaluated_key:
+        return None
+    raw = json.dumps(last_evaluated_key, cls=DecimalEncoder, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+def decode_cursor(cursor, **expected):
+    """
+    Turns a cursor from encode_cursor back into an ExclusiveStartKey.
+    Keyword arguments are key attributes the cursor must carry, so a client
+    cannot page into a partition it is not allowed to read.
+    """
+    if not cursor:
+        return None
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor.")
+    if not isinstance(key, dict):
+        raise ValueError("Invalid cursor.")
+    for name, value in expected.items():
+        if key.get(name) != value:
+            raise ValueError("Invalid cursor.")
+    return key
+
+def query_partition_page(pk, sk_prefix, query_parameters, records=False):
+    """
+    Reads one page of rows with PK = pk AND begins_with(SK, sk_prefix), honouring
+    the `limit` and `cursor` query parameters. Returns (items, next_cursor);
+    with records=True the items stay low-level DynamoDB records.
+    """
+    query_kwargs = {
+        "KeyConditionExpression": "PK = :pk AND begins_with(SK, :prefix)",
+        "ExpressionAttributeValues": {":pk": pk, ":prefix": sk_prefix},
+        "Limit": parse_limit(query_parameters.get("limit"))
+    }
+    start_key = decode_cursor(query_parameters.get("cursor"), PK=pk)
+    if start_key:
+        if not str(start_key.get("SK", "")).startswith(sk_prefix):
+            raise ValueError("Invalid cursor.")
+        query_kwargs["ExclusiveStartKey"] = start_key
+    query = dynamo.query_records if records else dynamo.query
+    resp = query(**query_kwargs)
+    return resp.get("Items", []), encode_cursor(resp.get("LastEvaluatedKey"))
+
+def item_shards(warehouse_id):
+    """
+    Number of partitions the warehouse's ITEM rows are spread over (1: they
+    live in the warehouse partition itself). Normally known from the request's
+    access check, since ACCESS rows carry it; otherwise read from METADATA.
+    """
+    shards = role_cache.shards(warehouse_id)
+    if shards is None:
+        meta = dynamo.get_item(
+            Key={"PK": f"WAREHOUSE#{warehouse_id}", "SK": "METADATA"},
+            ProjectionExpression="itemShards"
+        ).get("Item")
+        if meta is None:
+            return 1  # no such warehouse (yet): nothing to remember
+        shards = int(meta.get("itemShards", 1))
+        role_cache.observe_shards(warehouse_id, shards)
+    return shards
+
+def shard_pks(warehouse_id, shards):
+    """Partition keys of the warehouse's ITEM rows: its own, or WAREHOUSE#<id>#<n> per shard."""
+    pk = f"WAREHOUSE#{warehouse_id}"
+    if shards <= 1:
+        return [pk]
+    return [f"{pk}#{n}" for n in range(shards)]
+
+def item_key(warehouse_id, item_id, shards):
+    """Primary key of an ITEM row; in a sharded warehouse a hash of the itemId picks the shard."""
+    pk = f"WAREHOUSE#{warehouse_id}"
+    if shards > 1:
+        pk = f"{pk}#{zlib.crc32(item_id.encode('utf-8')) % shards}"
+    return {"PK": pk, "SK": f"ITEM#{item_id}"}
+
+def shard_totals(warehouse_shards):
+    """
+    Sums the TOTALS rows of sharded warehouses ({warehouse_id: shards}) with
+    one batch read: {warehouse_id: (itemCount, totalQuantity, summed versions)}.
+    """
+    rows = batch_get_items([
+        {"PK": pk, "SK": "TOTALS"}
+        for warehouse_id, shards in warehouse_shards.items() for pk in shard_pks(warehouse_id, shards)
+    ])
+    totals = {warehouse_id: (0, 0, 0) for warehouse_id in warehouse_shards}
+    for row in rows:
+        warehouse_id = row["PK"][len("WAREHOUSE#"):].rsplit("#", 1)[0]
+        item_count, total_quantity, version = totals[warehouse_id]
+        totals[warehouse_id] = (item_count + row.get("itemCount", 0),
+                                total_quantity + row.get("totalQuantity", 0),
+                                version + row.get("version", 0))
+    return totals
+
+def query_shards(pks, query_kwargs, key_attributes, order, start_keys):
+    """
+    Runs the same Query page (query_kwargs, with :pk bound to each partition
+    key) on every partition in parallel, each from its start key, and merges
+    the low-level records by order(record). A start key is None for the start
+    of a partition and False once it is exhausted. Every partition returns up
+    to Limit rows, so the first Limit merged rows skip none of them. Returns
+    those rows and the next page's start keys (built from PK and
+    key_attributes), or None for the keys when every partition is done.
+    """
+    limit = query_kwargs["Limit"]
+
+    def query(position):
+        if start_keys[position] is False:
+            return [], None
+        kwargs = dict(query_kwargs, ExpressionAttributeValues=dict(
+            query_kwargs["ExpressionAttributeValues"], **{":pk": pks[position]}))
+        if start_keys[position]:
+            kwargs["ExclusiveStartKey"] = start_keys[position]
+        resp = dynamo.query_records(**kwargs)
+        return resp.get("Items", []), resp.get("LastEvaluatedKey")
+
+    if len(pks) == 1:
+        pages = [query(0)]
+    else:
+        with ThreadPoolExecutor(max_workers=min(PARALLEL_QUERY_WORKERS, len(pks))) as pool:
+            pages = list(pool.map(query, range(len(pks))))
+
+    merged = heapq.merge(*[[(position, r) for r in rows] for position, (rows, _) in enumerate(pages)],
+                         key=lambda entry: order(entry[1]))
+    records, taken = [], [0] * len(pks)
+    for position, record in merged:
+        if len(records) == limit:
+            break
+        records.append(record)
+        taken[position] += 1
+
+    next_keys = []
+    for position, (rows, last_key) in enumerate(pages):
+        if taken[position] < len(rows):
+            # Go on after the last row taken from this partition
+            next_keys.append(start_keys[position] if not taken[position] else dict(
+                {"PK": pks[position]},
+                **{name: dynamo.deserialize(rows[taken[position] - 1][name]) for name in key_attributes}))
+        else:
+            next_keys.append(last_key or False)
+    if not any(key is not False for key in next_keys):
+        return records, None
+    return records, next_keys
+
+def query_shards_page(warehouse_id, shards, query_kwargs, query_parameters, key_attributes, order,
+                      sk_prefix=None):
+    """
+    One page of a sharded warehouse's item rows merged from all shards (see
+    query_shards), honouring the `limit` and `cursor` query parameters. The
+    cursor holds every shard's start key. Returns (records, next_cursor,
+    the start keys this page began at).
+    """
+    pk = f"WAREHOUSE#{warehouse_id}"
+    pks = shard_pks(warehouse_id, shards)
+    start_keys = [None] * len(pks)
+    cursor = decode_cursor(query_parameters.get("cursor"), PK=pk)
+    if cursor:
+        start_keys = cursor.get("shards")
+        if not isinstance(start_keys, list) or len(start_keys) != len(pks):
+            raise ValueError("Invalid cursor.")
+        for key, shard_pk in zip(start_keys, pks):
+            if key is None or key is False:
+                continue
+            if (not isinstance(key, dict) or key.get("PK") != shard_pk
+                    or not str(key.get("SK", "")).startswith(sk_prefix or "")):
+                raise ValueError("Invalid cursor.")
+    query_kwargs = dict(query_kwargs, Limit=parse_limit(query_parameters.get("limit")))
+    records, next_keys = query_shards(pks, query_kwargs, key_attributes, order, start_keys)
+    next_cursor = encode_cursor({"PK": pk, "shards": next_keys}) if next_keys else None
+    return records, next_cursor, [key for key in start_keys if key]
+
+def item_row(warehouse_id, entry, shards=1):
+    """
+    Validates one {"itemId", "itemName", "quantity", "reorderThreshold"} entry of
+    a bulk write and returns its ITEM row (in its shard when the warehouse has
+    `shards`); raises ValueError naming the problem.
+    """
+    item_id = entry.get("itemId") if isinstance(entry, dict) else None
+    if not isinstance(item_id, str) or not item_id:
+        raise ValueError("itemId must be a non-empty string.")
+    if not isinstance(entry.get("itemName", ""), str):
+        raise ValueError("itemName must be a string.")
+    quantity = to_decimal(entry.get("quantity", 0), "quantity")
+    threshold = entry.get("reorderThreshold")
+    if threshold is not None:
+        threshold = to_decimal(threshold, "reorderThreshold")
+    item = {
+        **item_key(warehouse_id, item_id, shards),
+        "itemName": entry.get("itemName", ""),
+        "quantity": quantity,
+        "updatedAt": now_ms()
+    }
+    if threshold is not None:
+        item["reorderThreshold"] = threshold
+        if is_low_stock(quantity, threshold):
+            item["lowStockPK"] = f"WAREHOUSE#{warehouse_id}"
+    return item
+
+def put_items(warehouse_id, items):
+    """
+    Writes ITEM rows (unique keys) with parallel BatchWriteItem calls, replacing
+    existing rows, and keeps versions and the warehouse totals in step. Returns
+    the SKs that were still unprocessed (throttled) after the retries.
+    """
+    # BatchWriteItem cannot join a transaction: look up the rows being
+    # replaced, write, then apply the net change to the totals in one update
+    existing = {
+        it["SK"]: it
+        for it in batch_get_items([{"PK": item["PK"], "SK": item["SK"]} for item in items])
+    }
+    for item in items:
+        item["version"] = existing.get(item["SK"], {}).get("version", 0) + 1
+    unprocessed = {
+        r["PutRequest"]["Item"]["SK"]
+        for r in batch_write_requests([{"PutRequest": {"Item": item}} for item in items])
+    }
+    # item PK -> [item delta, quantity delta]: one totals row per shard
+    deltas = {}
+    for item in items:
+        if item["SK"] in unprocessed:
+            continue
+        delta = deltas.setdefault(item["PK"], [0, 0])
+        delta[0] += 0 if item["SK"] in existing else 1
+        delta[1] += item["quantity"] - existing.get(item["SK"], {}).get("quantity", 0)
+    for item_pk, (item_delta, quantity_delta) in deltas.items():
+        if item_delta or quantity_delta:
+            update_totals(warehouse_id, item_delta, quantity_delta, item_pk)
+    return unprocessed
+
+def batch_get_items(keys, max_attempts=5, **kwargs):
+    """
+    Fetches the given primary keys with BatchGetItem (100 keys per call, chunks
+    in parallel on a thread pool), retrying UnprocessedKeys with jittered
+    exponential backoff. kwargs (ConsistentRead, ProjectionExpression, ...) are
+    passed to every call. Returns the found items; missing keys are silently skipped.
+    """
+    def get_chunk(chunk):
+        found, pending = [], chunk
+        attempt = 0
+        while pending:
+            items, pending = dynamo.batch_get_item(pending, **kwargs)
+            found.extend(items)
+            if pending:
+                attempt += 1
+                if attempt >= max_attempts:
+                    raise Throttled("BatchGetItem did not complete; table is throttled.")
+                time.sleep(random.uniform(0, 0.05 * (2 ** attempt)))
+        return found
+
+    chunks = [keys[i:i + MAX_PAGE_SIZE] for i in range(0, len(keys), MAX_PAGE_SIZE)]
+    if len(chunks) <= 1:
+        return get_chunk(chunks[0]) if chunks else []
+    found = []
+    with ThreadPoolExecutor(max_workers=min(BATCH_WRITE_WORKERS, len(chunks))) as pool:
+        for items in pool.map(get_chunk, chunks):
+            found.extend(items)
+    return found
+
+def batch_write_requests(requests, max_attempts=BATCH_MAX_ATTEMPTS):
+    """
+    Sends WriteRequests ({"PutRequest": ...} / {"DeleteRequest": ...}) in
+    25-request BatchWriteItem chunks on a thread pool. UnprocessedItems are
+    retried with jittered exponential backoff. Returns the requests that were
+    still unprocessed after max_attempts.
+    """
+    def write_chunk(chunk):
+        pending = chunk
+        for attempt in range(max_attempts):
+            if attempt:
+                time.sleep(random.uniform(0, 0.05 * (2 ** attempt)))
+            pending = dynamo.batch_write_item(pending)
+            if not pending:
+                break
+        return pending
+
+    chunks = [requests[i:i + BATCH_WRITE_SIZE] for i in range(0, len(requests), BATCH_WRITE_SIZE)]
+    if not chunks:
+        return []
+    unprocessed = []
+    with ThreadPoolExecutor(max_workers=min(BATCH_WRITE_WORKERS, len(chunks))) as pool:
+        for leftover in pool.map(write_chunk, chunks):
+            unprocessed.extend(leftover)
+    return unprocessed
+
+def delete_warehouse_partition(warehouse_id, context):
+    """
+    Deletes every row of the warehouse partition: the item shards (in
+    parallel) and child rows (ITEM#, ...) first, then ACCESS# rows, then
+    METADATA, so an interrupted run keeps the owner's access and the METADATA
+    tombstone. Returns True once the partition is gone.
+    If the Lambda budget runs low, marks METADATA as "deleting", schedules a
+    continuation invocation and returns False. Calling it again resumes.
+    """
+    pk = f"WAREHOUSE#{warehouse_id}"
+    shards = item_shards(warehouse_id)
+
+    def out_of_time():
+        return context is not None and context.get_remaining_time_in_millis() < DELETE_TIME_RESERVE_MS
+
+    def delete_rows(key_condition, values, skip):
+        """Deletes matching rows page by page; returns False if it had to stop early."""
+        query_kwargs = {
+            "KeyConditionExpression": key_condition,
+            "ExpressionAttributeValues": values,
+            "ProjectionExpression": "PK, SK",
+            "Limit": DELETE_PAGE_SIZE
+        }
+        while True:
+            resp = dynamo.query(**query_kwargs)
+            requests = [
+                {"DeleteRequest": {"Key": {"PK": it["PK"], "SK": it["SK"]}}}
+                for it in resp.get("Items", []) if not skip(it["SK"])
+            ]
+            if batch_write_requests(requests):
+                return False  # still throttled; the next pass picks the leftovers up
+            if "LastEvaluatedKey" not in resp:
+                return True
+            if out_of_time():
+                return False
+            query_kwargs["ExclusiveStartKey"] = resp["LastEvaluatedKey"]
+
+    def delete_shard(shard_pk):
+        return delete_rows("PK = :pk", {":pk": shard_pk}, lambda sk: False)
+
+    shards_deleted = True
+    if shards > 1:
+        with ThreadPoolExecutor(max_workers=min(PARALLEL_QUERY_WORKERS, shards)) as pool:
+            shards_deleted = all(list(pool.map(delete_shard, shard_pks(warehouse_id, shards))))
+    complete = (
+        shards_deleted
+        and delete_rows("PK = :pk", {":pk": pk},
+                        lambda sk: sk == "METADATA" or sk.startswith("ACCESS#"))
+        and not out_of_time()
+        and delete_rows("PK = :pk AND begins_with(SK, :prefix)", {":pk": pk, ":prefix": "ACCESS#"},
+                        lambda sk: False)
+    )
+    if complete:
+        dynamo.delete_item(Key={"PK": pk, "SK": "METADATA"})
+        role_cache.invalidate_warehouse(warehouse_id)
+        return True
+
+    # Leave a tombstone on METADATA and continue in a later invocation
+    try:
+        dynamo.update_item(
+            Key={"PK": pk, "SK": "METADATA"},
+            UpdateExpression="SET deletionStatus = :st, deletionUpdatedAt = :now",
+            ConditionExpression="attribute_exists(PK)",
+            ExpressionAttributeValues={":st": "deleting", ":now": int(time.time())}
+        )
+    except ClientError as e:
+        if not is_condition_failure(e):
+            raise
+    schedule_continuation(context, {"task": "deleteWarehouse", "warehouseId": warehouse_id})
+    return False
+
+def run_export(job, context, deadline=None):
+    """
+    Streams the warehouse's ITEM rows into the job's multipart upload in parts of
+    about EXPORT_PART_SIZE bytes, so memory stays bounded by one part; the
+    shards of a sharded warehouse are read in parallel and merged in itemId
+    order. After each part the job row is checkpointed (uploaded parts, SK of
+    the last exported row). When time runs out (the Lambda budget or `deadline`, a time.monotonic()
+    value) the rows after the checkpoint are left to a continuation invocation
+    and False is returned. Completes the upload and returns True at the end.
+    """
+    _, header, encode_line = EXPORT_FORMATS[job["format"]]
+    pk = job["PK"]
+    continuation = {
+        "task": "exportWarehouse", "warehouseId": pk[len("WAREHOUSE#"):], "exportId": job["SK"][len("EXPORT#"):]
+    }
+
+    def out_of_time():
+        if deadline is not None and time.monotonic() > deadline:
+            return True
+        return context is not None and context.get_remaining_time_in_millis() < JOB_TIME_RESERVE_MS
+
+    def new_part():
+        part = storage.PartBuffer(compress=job["gzip"])
+        if header and not job["parts"]:
+            part.write(header)
+        return part
+
+    def upload(part, rows, last_sk):
+        data = part.finish()
+        part_number = len(job["parts"]) + 1
+        tag = storage.upload_part(job["objectKey"], job["uploadId"], part_number, data)
+        job["parts"].append({"PartNumber": part_number, "ETag": tag})
+        job["itemCount"] += rows
+        job["bytes"] += len(data)
+        if last_sk is not None:
+            job["cursor"] = last_sk
+
+    query_kwargs = {
+        "KeyConditionExpression": "PK = :pk AND begins_with(SK, :prefix)",
+        "ExpressionAttributeValues": {":prefix": "ITEM#"},
+        "ProjectionExpression": "SK, itemName, quantity, reorderThreshold",
+        "Limit": EXPORT_PAGE_SIZE
+    }
+    # Every shard goes on after the last exported itemId (SKs are unique across shards)
+    pks = shard_pks(pk[len("WAREHOUSE#"):], job.get("itemShards", 1))
+    start_keys = [{"PK": shard_pk, "SK": job["cursor"]} if job.get("cursor") else None for shard_pk in pks]
+    try:
+        part, rows, last_sk = new_part(), 0, None
+        while True:
+            records, start_keys = query_shards(pks, query_kwargs, ("SK",), lambda r: r["SK"]["S"], start_keys)
+            for record in records:
+                part.write(encode_line(record))
+                rows, last_sk = rows + 1, record["SK"]["S"]
+                if part.size >= EXPORT_PART_SIZE:
+                    upload(part, rows, last_sk)
+                    if not save_job(job):
+                        return False
+                    part, rows = new_part(), 0
+            if start_keys is None:
+                break
+            if out_of_time():
+                # Rows buffered since the last checkpoint are read again next time
+                schedule_continuation(context, continuation)
+                return False
+
+        if rows or not job["parts"]:  # an export always has at least one part
+            upload(part, rows, last_sk)
+        storage.complete_multipart_upload(job["objectKey"], job["uploadId"], job["parts"])
+        job["status"] = "complete"
+        save_job(job)
+        return True
+    except Exception as e:
+        if isinstance(e, Throttled) or is_throttling(e):
+            # Not a failure: go on from the last checkpoint in a later invocation
+            schedule_continuation(context, continuation)
+            return False
+        instrumentation.log_exception("Export failed", e)
+        job["status"] = "failed"
+        job["error"] = str(e)
+        save_job(job)
+        try:
+            storage.abort_multipart_upload(job["objectKey"], job["uploadId"])
+        except Exception:
+            pass  # the bucket's lifecycle rule removes abandoned uploads
+        raise
+
+def save_job(job):
+    """
+    Writes the progress of an export or import job. The checkpoint counter makes a duplicate
+    continuation (async events can be delivered twice) stop instead of
+    overwriting newer progress; returns False when that happened.
+    """
+    expected = job["checkpoint"]
+    job["checkpoint"] = expected + 1
+    job["checkpointedAt"] = int(time.time())
+    try:
+        dynamo.put_item(
+            Item=job,
+            ConditionExpression="checkpoint = :expected",
+            ExpressionAttributeValues={":expected": expected}
+        )
+    except ClientError as e:
+        if not is_condition_failure(e):
+            raise
+        instrumentation.log("warning", "Job superseded by another invocation.", objectKey=job["objectKey"])
+        return False
+    return True
+
+def run_import(job, context, deadline=None):
+    """
+    Streams the job's object from its checkpointed byte offset, parses and
+    validates IMPORT_BATCH_SIZE rows at a time and writes each batch with
+    parallel BatchWriteItem calls (put_items). The offset is checkpointed after
+    every batch; when time runs out (or writes stay throttled) a continuation
+    invocation resumes from it and False is returned. Rows are puts, so a batch
+    that is written twice gives the same result. Returns True when done.
+    """
+    warehouse_id = job["PK"][len("WAREHOUSE#"):]
+    continuation = {"task": "importItems", "warehouseId": warehouse_id, "importId": job["SK"][len("IMPORT#"):]}
+
+    def out_of_time():
+        if deadline is not None and time.monotonic() > deadline:
+            return True
+        return context is not None and context.get_remaining_time_in_millis() < JOB_TIME_RESERVE_MS
+
+    def parse(line):
+        """One line -> an item entry dict, or None for a line without data."""
+        if len(line) > IMPORT_MAX_LINE_BYTES:
+            raise ValueError(f"Line is longer than {IMPORT_MAX_LINE_BYTES} bytes.")
+        text = line.decode("utf-8-sig" if job["lines"] == 1 else "utf-8").strip()
+        if not text:
+            return None
+        if job["format"] == "ndjson":
+            try:
+                entry = json.loads(text, parse_float=Decimal)
+            except json.JSONDecodeError:
+                raise ValueError("Not a JSON object.")
+            if not isinstance(entry, dict):
+                raise ValueError("Not a JSON object.")
+            return entry
+        values = next(csv.reader([text]))
+        if "columns" not in job:  # the first CSV line names the columns
+            if "itemId" not in values:
+                raise JobFailed("The CSV header has no itemId column.")
+            job["columns"] = values
+            return None
+        if len(values) != len(job["columns"]):
+            raise ValueError(f"Expected {len(job['columns'])} fields, got {len(values)}.")
+        # Empty CSV fields count as missing
+        return {column: value for column, value in zip(job["columns"], values) if value != ""}
+
+    try:
+        while job["offset"] < job["size"]:
+            seen, rejected, end = {}, [], job["offset"]
+            lines = storage.iter_lines(job["objectKey"], job["offset"], if_match=job["objectETag"])
+            for line, end in lines:
+                job["lines"] += 1
+                try:
+                    entry = parse(line)
+                    if entry is None:
+                        continue
+                    item = item_row(warehouse_id, entry, job.get("itemShards", 1))
+                except (ValueError, UnicodeDecodeError) as e:
+                    rejected.append({"line": job["lines"], "error": str(e)})
+                    continue
+                # A later row for the same item replaces an earlier one (a
+                # BatchWriteItem call must not repeat a key)
+                seen[item["SK"]] = item
+                if len(seen) >= IMPORT_BATCH_SIZE:
+                    break
+            lines.close()
+            items = list(seen.values())
+
+            if put_items(warehouse_id, items):
+                # Still throttled: leave this batch to a later invocation
+                schedule_continuation(context, continuation)
+                return False
+            job["offset"] = end
+            job["imported"] += len(items)
+            job["failed"] += len(rejected)
+            job["errors"] = (job["errors"] + rejected)[:IMPORT_MAX_ERRORS]
+            if job["offset"] >= job["size"]:
+                break
+            if not save_job(job):
+                return False
+            if out_of_time():
+                schedule_continuation(context, continuation)
+                return False
+
+        job["status"] = "complete"
+        save_job(job)
+        return True
+    except Exception as e:
+        if isinstance(e, Throttled) or is_throttling(e):
+            schedule_continuation(context, continuation)
+            return False
+        if isinstance(e, ClientError) and e.response.get("Error", {}).get("Code") == "PreconditionFailed":
+            e = JobFailed("The object was replaced during the import.")
+        job["status"] = "failed"
+        job["error"] = str(e)
+        save_job(job)
+        if isinstance(e, JobFailed):
+            return True  # a problem with the object itself: the job fails, the request does not
+        instrumentation.log_exception("Import failed", e)
+        raise
+
+def import_response(job):
+    """Progress of an import job; 202 while it runs, 200 once it has finished."""
+    body = {
+        "importId": job["SK"][len("IMPORT#"):],
+        "status": job["status"],
+        "format": job["format"],
+        "objectKey": job["objectKey"],
+        "bytesRead": job["offset"],
+        "size": job["size"],
+        "imported": job["imported"],
+        "failed": job["failed"],
+        "errors": job["errors"],
+        "createdAt": job["createdAt"]
+    }
+    if job["status"] == "failed":
+        body["error"] = job.get("error")
+    return (202 if job["status"] == "running" else 200), body
+
+def export_response(job):
+    """Status of an export job; 200 with a download URL once complete, 202 while running."""
+    body = {
+        "exportId": job["SK"][len("EXPORT#"):],
+        "status": job["status"],
+        "format": job["format"],
+        "gzip": job["gzip"],
+        "createdAt": job["createdAt"]
+    }
+    if job["status"] == "running":
+        return 202, body
+    body["itemCount"] = job["itemCount"]
+    body["bytes"] = job["bytes"]
+    if job["status"] == "complete":
+        body["url"] = storage.presigned_get_url(job["objectKey"], EXPORT_URL_TTL_SECONDS)
+        body["expiresIn"] = EXPORT_URL_TTL_SECONDS
+    else:
+        body["error"] = job.get("error")
+    return 200, body
+
+def schedule_continuation(context, payload):
+    """
+    Asynchronously re-invokes this function with an internal task payload.
+    Failures are only logged: repeating the original request also resumes the work.
+    Always invokes the unqualified function ($LATEST), which is what the role may
+    invoke, also when the API called an alias (":live" in the invoked ARN).
+    """
+    function_arn = getattr(context, "invoked_function_arn", None)
+    if not function_arn:
+        return
+    # arn:aws:lambda:<region>:<account>:function:<name>[:<version or alias>]
+    function_arn = ":".join(function_arn.split(":")[:7])
+    try:
+        clients.client("lambda").invoke(
+            FunctionName=function_arn,
+            InvocationType="Event",
+            Payload=json.dumps(payload).encode("utf-8")
+        )
+    except Exception as e:
+        instrumentation.log("error", "Could not schedule continuation.", error=str(e), task=payload.get("task"))
+
+def retry_later(status_code, body):
+    """
+    A response that asks the client to repeat the request (e.g. a lost race),
+    marked with Retry-After; idempotency.py does not store such responses.
+    """
+    return status_code, body, {"Retry-After": str(THROTTLED_RETRY_AFTER_SECONDS)}
+
+def page_response(request, encode, records, list_name, next_cursor):
+    """
+    Renders a page of low-level records with a precompiled row encoder, as NDJSON
+    when the client sends `Accept: application/x-ndjson`, otherwise as
+    {"<list_name>": [...], "nextCursor": ...}.
+    """
+    with instrumentation.timer("serialization"):
+        if serialization.wants_ndjson(request.event.get("headers")):
+            return 200, serialization.encode_ndjson(encode, records, next_cursor), {
+                "Content-Type": serialization.NDJSON_CONTENT_TYPE
+            }
+        return 200, serialization.encode_page(encode, records, list_name, next_cursor)
+
 def build_response(status_code, body, headers):
+    if not isinstance(body, serialization.Raw):
+        body = json.dumps(body, cls=DecimalEncoder)
     return {
         "statusCode": status_code,
         "headers": headers,
-        "body": json.dumps(body, cls=DecimalEncoder)
+        "body": body
     }
+
+# Internal task name -> handler(event, context)
+TASKS = {
+    "deleteWarehouse": delete_warehouse_task,
+    "recountWarehouse": recount_warehouse_task,
+    "backfillAccessUserIds": backfill_access_user_ids_task,
+    "exportWarehouse": export_warehouse_task,
+    "importItems": import_items_task
+}
+
+# Route key -> (handler function, Route), built once per container
+ROUTE_TABLE = {
+    route_key: (globals()[route.handler], route)
+    for route_key, route in routes.ROUTES.items()
+}
@@ -0,0 +1,199 @@
+"""
+Per-request timers, DynamoDB call accounting and structured log output.
+
+handler() opens one RequestMetrics per API request. While it is open, every
+DynamoDB call made through dynamo.py is timed and its ConsumedCapacity and
+returned item count are added to it, and the handler times the access check
+and the response serialization. When the request ends one CloudWatch Embedded
+Metric Format (EMF) line is printed: CloudWatch turns it into per-route metrics
+from the log stream, so nothing is sent over the network from the hot path.
+
+Full request details (path parameters, per-operation breakdown, role cache
+counters) are only added to a sampled fraction of those lines, and always to
+failed requests. The event itself, including the JWT claims, is never logged.
+"""
+import json
+import os
+import random
+import threading
+import time
+import traceback
+
+METRICS_NAMESPACE = os.environ.get('metricsNamespace', 'ServerlessBackend')
+LOG_SAMPLE_RATE = float(os.environ.get('logSampleRate', '0.05'))
+
+_lock = threading.Lock()  # batch writes and parallel queries report from worker threads
+_current = None
+
+
+class RequestMetrics:
+    """Timings and DynamoDB usage collected for one request."""
+
+    def __init__(self, route, request_id):
+        self.route = route
+        self.request_id = request_id
+        self.started = time.perf_counter()
+        self.phases = {}  # phase -> milliseconds ("auth", "dynamodb", "serialization")
+        self.operations = {}  # DynamoDB operation -> call count
+        self.dynamodb_calls = 0
+        self._in_flight = 0  # DynamoDB calls currently running (parallel queries, batch writes)
+        self._busy_since = None
+        self.capacity_units = 0.0
+        self.items_read = 0
+
+    def add_time(self, phase, seconds):
+        with _lock:
+            self.phases[phase] = self.phases.get(phase, 0.0) + seconds * 1000
+
+    def dynamodb_call_started(self):
+        with _lock:
+            if not self._in_flight:
+                self._busy_since = time.perf_counter()
+            self._in_flight += 1
+
+    def add_dynamodb_call(self, operation, consumed_capacity, items_read):
+        """
+        Counts a finished call. The "dynamodb" phase is the wall-clock time with
+        at least one call in flight, so parallel calls are not counted twice.
+        """
+        with _lock:
+            self._in_flight -= 1
+            if not self._in_flight:
+                busy = time.perf_counter() - self._busy_since
+                self.phases["dynamodb"] = self.phases.get("dynamodb", 0.0) + busy * 1000
+            self.operations[operation] = self.operations.get(operation, 0) + 1
+            self.dynamodb_calls += 1
+            self.capacity_units += capacity_units(consumed_capacity)
+            self.items_read += items_read
+
+
+def capacity_units(consumed_capacity):
+    """Sums CapacityUnits over a ConsumedCapacity entry or list of entries."""
+    if not consumed_capacity:
+        return 0.0
+    if isinstance(consumed_capacity, dict):
+        consumed_capacity = [consumed_capacity]
+    return float(sum(c.get("CapacityUnits", 0) for c in consumed_capacity))
+
+
+def start_request(route, context=None):
+    """Begins collecting metrics for a request; returns its RequestMetrics."""
+    global _current
+    _current = RequestMetrics(route, getattr(context, "aws_request_id", None))
+    return _current
+
+
+def current():
+    """The RequestMetrics of the request in progress, or None."""
+    return _current
+
+
+class timer:
+    """Context manager adding the time spent in its block to a phase."""
+
+    def __init__(self, phase):
+        self.phase = phase
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        if _current is not None:
+            _current.add_time(self.phase, time.perf_counter() - self.started)
+        return False
+
+
+def dynamodb_call_started():
+    """Called by dynamo.py before every table call; returns the request it belongs to."""
+    metrics = _current
+    if metrics is not None:
+        metrics.dynamodb_call_started()
+    return metrics
+
+
+def record_dynamodb_call(metrics, operation, response):
+    """
+    Called by dynamo.py after every table call (also failed ones, with an empty
+    response), with the value dynamodb_call_started() returned.
+    """
+    if metrics is None:
+        return
+    if "Items" in response:
+        items_read = len(response["Items"])
+    elif "Item" in response:
+        items_read = 1
+    elif "Responses" in response:
+        responses = response["Responses"]
+        if isinstance(responses, dict):  # BatchGetItem: table name -> rows
+            items_read = sum(len(rows) for rows in responses.values())
+        else:  # TransactGetItems: one entry per key
+            items_read = sum(1 for r in responses if "Item" in r)
+    else:
+        items_read = 0
+    metrics.add_dynamodb_call(operation, response.get("ConsumedCapacity"), items_read)
+
+
+def finish_request(status_code, extra=None):
+    """
+    Ends the current request and prints its EMF line. Details are included for
+    a LOG_SAMPLE_RATE fraction of requests and for every 5xx response.
+    """
+    global _current
+    metrics, _current = _current, None
+    if metrics is None:
+        return None
+    duration_ms = (time.perf_counter() - metrics.started) * 1000
+    record = {
+        "_aws": {
+            "Timestamp": int(time.time() * 1000),
+            "CloudWatchMetrics": [{
+                "Namespace": METRICS_NAMESPACE,
+                "Dimensions": [["Route"]],
+                "Metrics": [
+                    {"Name": "Latency", "Unit": "Milliseconds"},
+                    {"Name": "AuthLatency", "Unit": "Milliseconds"},
+                    {"Name": "DynamoDbLatency", "Unit": "Milliseconds"},
+                    {"Name": "SerializationLatency", "Unit": "Milliseconds"},
+                    {"Name": "DynamoDbCalls", "Unit": "Count"},
+                    {"Name": "ConsumedCapacity", "Unit": "Count"},
+                    {"Name": "ServerErrors", "Unit": "Count"},
+                    {"Name": "Throttles", "Unit": "Count"}
+                ]
+            }]
+        },
+        "Route": metrics.route,
+        "Latency": round(duration_ms, 3),
+        "AuthLatency": round(metrics.phases.get("auth", 0.0), 3),
+        "DynamoDbLatency": round(metrics.phases.get("dynamodb", 0.0), 3),
+        "SerializationLatency": round(metrics.phases.get("serialization", 0.0), 3),
+        "DynamoDbCalls": metrics.dynamodb_calls,
+        "ConsumedCapacity": metrics.capacity_units,
+        "ServerErrors": 1 if status_code >= 500 else 0,
+        "Throttles": 1 if status_code == 429 else 0,
+        "statusCode": status_code,
+        "requestId": metrics.request_id
+    }
+    if status_code >= 500 or random.random() < LOG_SAMPLE_RATE:
+        record["sampled"] = True
+        record["dynamoDbOperations"] = metrics.operations
+        record["itemsRead"] = metrics.items_read
+        record.update(extra or {})
+    print(json.dumps(record, separators=(",", ":"), default=str))
+    return metrics
+
+
+def log(level, message, **fields):
+    """Prints one structured log line."""
+    record = {"level": level, "message": message}
+    if _current is not None:
+        record["route"] = _current.route
+        record["requestId"] = _current.request_id
+    record.update(fields)
+    print(json.dumps(record, separators=(",", ":"), default=str))
+
+
+def log_exception(message, error):
+    """Structured error line with the traceback of the exception being handled."""
+    log("error", message, error=str(error), errorType=type(error).__name__,
+        traceback=traceback.format_exc())
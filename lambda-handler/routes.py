@@ -0,0 +1,115 @@
+"""
+Route registry shared by the Lambda handler (index.py) and the CDK stack.
+
+Every HTTP API route is declared once here. index.py resolves `handler` to its
+module-level function at import time and dispatches on the route key with a
+dict lookup; ServerlessBackendStack creates one API Gateway route per entry.
+This module must stay free of AWS SDK imports so the stack can load it.
+"""
+from collections import namedtuple
+
+# handler: name of the function in index.py
+# roles:   None  -> no warehouse check (route is not warehouse-scoped)
+#          ()    -> any role in the warehouse (owner, editor, viewer, ...)
+#          tuple -> one of these roles in the warehouse
+# body:    {field: (type, required)} checked before the handler runs,
+#          type is one of "string", "number", "boolean", "array", "object"
+# inline_auth: the handler authorizes itself (e.g. combined auth + read)
+# idempotent:  honours an Idempotency-Key header; retries with the key get the
+#              first response back instead of running again (idempotency.py)
+Route = namedtuple("Route", ["handler", "roles", "body", "inline_auth", "idempotent"])
+Route.__new__.__defaults__ = (None, None, False, False)
+
+ANY_ROLE = ()
+OWNER = ("owner",)
+EDITORS = ("owner", "editor")
+
+ROUTES = {
+    # ------------------------------------------------------------------------
+    # 1. WAREHOUSE MANAGEMENT
+    # ------------------------------------------------------------------------
+    "POST /warehouses": Route(
+        "create_warehouse",
+        body={"warehouseId": ("string", True), "warehouseName": ("string", False),
+              "itemShards": ("number", False)},
+        idempotent=True
+    ),
+    "GET /warehouses": Route("list_warehouses"),
+    "GET /warehouses/{warehouseId}": Route("get_warehouse", roles=ANY_ROLE, inline_auth=True),
+    "PUT /warehouses/{warehouseId}": Route(
+        "update_warehouse", roles=OWNER,
+        body={"warehouseName": ("string", False)}
+    ),
+    "DELETE /warehouses/{warehouseId}": Route("delete_warehouse", roles=OWNER),
+
+    # ------------------------------------------------------------------------
+    # 2. WAREHOUSE ACCESS MANAGEMENT
+    # ------------------------------------------------------------------------
+    "POST /warehouses/{warehouseId}/access": Route(
+        "grant_access", roles=OWNER,
+        body={"userId": ("string", True), "role": ("string", True)}
+    ),
+    "GET /warehouses/{warehouseId}/access": Route("list_access", roles=OWNER),
+    "DELETE /warehouses/{warehouseId}/access/{userId}": Route("revoke_access", roles=OWNER),
+
+    # ------------------------------------------------------------------------
+    # 3. ITEM MANAGEMENT
+    # ------------------------------------------------------------------------
+    "POST /warehouses/{warehouseId}/items": Route(
+        "create_item", roles=EDITORS,
+        body={"itemId": ("string", True), "itemName": ("string", False), "quantity": ("number", False),
+              "reorderThreshold": ("number", False)},
+        idempotent=True
+    ),
+    "GET /warehouses/{warehouseId}/items": Route("list_items", roles=ANY_ROLE),
+    "GET /warehouses/{warehouseId}/items/{itemId}": Route("get_item", roles=ANY_ROLE, inline_auth=True),
+    "PUT /warehouses/{warehouseId}/items/{itemId}": Route(
+        "update_item", roles=EDITORS,
+        body={"itemName": ("string", False), "quantity": ("number", False),
+              "reorderThreshold": ("number", False)},
+        idempotent=True
+    ),
+    "DELETE /warehouses/{warehouseId}/items/{itemId}": Route("delete_item", roles=EDITORS),
+    "POST /warehouses/{warehouseId}/items/{itemId}/adjust": Route(
+        "adjust_item", roles=EDITORS,
+        body={"delta": ("number", True)},
+        idempotent=True
+    ),
+    "POST /warehouses/{warehouseId}/items/batch": Route(
+        "bulk_create_items", roles=EDITORS,
+        body={"items": ("array", True)},
+        idempotent=True
+    ),
+    "POST /warehouses/{warehouseId}/items/batch-get": Route(
+        "batch_get_warehouse_items", roles=ANY_ROLE,
+        body={"itemIds": ("array", True)}
+    ),
+    # Needs owner or editor in the destination warehouse too
+    "POST /warehouses/{warehouseId}/transfers": Route(
+        "transfer_items", roles=EDITORS,
+        body={"toWarehouseId": ("string", True), "items": ("array", True)},
+        idempotent=True
+    ),
+
+    # ------------------------------------------------------------------------
+    # 4. STOCK REPORTS
+    # ------------------------------------------------------------------------
+    "GET /warehouses/{warehouseId}/low-stock": Route("list_low_stock", roles=ANY_ROLE),
+    # Across every warehouse the caller has access to
+    "GET /low-stock": Route("list_my_low_stock"),
+
+    # ------------------------------------------------------------------------
+    # 5. EXPORTS AND IMPORTS
+    # ------------------------------------------------------------------------
+    "POST /warehouses/{warehouseId}/exports": Route(
+        "create_export", roles=ANY_ROLE,
+        body={"format": ("string", False), "gzip": ("boolean", False)}
+    ),
+    "GET /warehouses/{warehouseId}/exports/{exportId}": Route("get_export", roles=ANY_ROLE),
+    # Loads an uploaded CSV/NDJSON object from imports/<warehouseId>/ in the bucket
+    "POST /warehouses/{warehouseId}/imports": Route(
+        "create_import", roles=EDITORS,
+        body={"objectKey": ("string", True), "format": ("string", False)}
+    ),
+    "GET /warehouses/{warehouseId}/imports/{importId}": Route("get_import", roles=ANY_ROLE),
+}
@@ -0,0 +1,162 @@
+"""
+Fast JSON encoding of list responses straight from low-level DynamoDB records.
+
+build_response() runs json.dumps over dicts we first build from every row.
+For list routes that is most of the request's CPU. Here each row shape gets an
+encoder function generated once at import time: it reads the attribute values
+straight from the record ({"S": ...} / {"N": ...}), escapes strings with the C
+encoder json.dumps itself uses and copies DynamoDB's number text through as-is,
+so no dict, int or Decimal is created per row.
+
+Pages can be rendered as one JSON document or as NDJSON (one row per line and
+a final {"nextCursor": ...} line) for very large pages. Warehouse exports write
+the same NDJSON rows, or CSV lines, to S3.
+"""
+from json.encoder import encode_basestring_ascii
+
+NDJSON_CONTENT_TYPE = "application/x-ndjson"
+CSV_CONTENT_TYPE = "text/csv; charset=utf-8"
+
+
+class Raw(str):
+    """A response body that is already encoded; build_response sends it as-is."""
+
+
+def compile_shape(fields):
+    """
+    Builds an encoder record -> JSON object text for a fixed row shape.
+    fields is a list of (json_name, attribute, kind, arg) where kind is
+      "prefix": string attribute with the prefix `arg` stripped (e.g. SK "ITEM#")
+      "S":      string attribute, `arg` (or null) when missing
+      "N":      number attribute, `arg` (or null) when missing
+    """
+    lines = ["def encode(r):"]
+    parts = []
+    for position, (json_name, attribute, kind, arg) in enumerate(fields):
+        name = encode_basestring_ascii(json_name)
+        separator = "{" if position == 0 else ","
+        if kind == "prefix":
+            value = f"_s(r[{attribute!r}]['S'][{len(arg)}:])"
+        elif kind == "S":
+            missing = "null" if arg is None else encode_basestring_ascii(arg)
+            lines.append(f"    v{position} = r.get({attribute!r})")
+            value = f"(_s(v{position}['S']) if v{position} is not None and 'S' in v{position} else {missing!r})"
+        elif kind == "N":
+            missing = "null" if arg is None else str(arg)
+            lines.append(f"    v{position} = r.get({attribute!r})")
+            value = f"(v{position}['N'] if v{position} is not None and 'N' in v{position} else {missing!r})"
+        else:
+            raise ValueError(f"Unknown field kind {kind!r}.")
+        parts.append(f"{separator + name + ':'!r} + {value}")
+    lines.append("    return " + " + ".join(parts) + " + '}'")
+    namespace = {"_s": encode_basestring_ascii}
+    exec("\n".join(lines), namespace)
+    return namespace["encode"]
+
+
+# Row shapes of the list routes
+encode_item = compile_shape([
+    ("itemId", "SK", "prefix", "ITEM#"),
+    ("itemName", "itemName", "S", None),
+    ("quantity", "quantity", "N", 0),
+    ("reorderThreshold", "reorderThreshold", "N", None),
+])
+encode_low_stock = compile_shape([
+    ("warehouseId", "lowStockPK", "prefix", "WAREHOUSE#"),  # PK is an item shard's in sharded warehouses
+    ("itemId", "SK", "prefix", "ITEM#"),
+    ("itemName", "itemName", "S", None),
+    ("quantity", "quantity", "N", 0),
+    ("reorderThreshold", "reorderThreshold", "N", None),
+])
+# Delta sync (GET .../items?since=): changed items and deletion tombstones
+encode_item_change = compile_shape([
+    ("itemId", "SK", "prefix", "ITEM#"),
+    ("itemName", "itemName", "S", None),
+    ("quantity", "quantity", "N", 0),
+    ("reorderThreshold", "reorderThreshold", "N", None),
+    ("updatedAt", "updatedAt", "N", None),
+])
+encode_tombstone = compile_shape([
+    ("itemId", "SK", "prefix", "TOMBSTONE#"),
+    ("deletedAt", "updatedAt", "N", None),
+])
+encode_access = compile_shape([
+    ("userId", "SK", "prefix", "ACCESS#"),
+    ("role", "role", "S", None),
+])
+
+
+def csv_field(text):
+    """Quotes a CSV field (RFC 4180) when it contains a separator, quote or line break."""
+    if any(c in text for c in ',"\r\n'):
+        return '"' + text.replace('"', '""') + '"'
+    return text
+
+
+def _csv_value(attribute):
+    if attribute is None:
+        return ""
+    if "N" in attribute:
+        return attribute["N"]
+    return csv_field(attribute.get("S", ""))
+
+
+# CSV rendering of encode_item's row shape
+CSV_ITEM_HEADER = "itemId,itemName,quantity,reorderThreshold\r\n"
+
+
+def encode_item_csv(r):
+    """One CSV line (with line break) for an ITEM record."""
+    quantity = r.get("quantity")
+    return (
+        csv_field(r["SK"]["S"][len("ITEM#"):]) + "," + _csv_value(r.get("itemName")) + "," +
+        (quantity["N"] if quantity is not None and "N" in quantity else "0") + "," +
+        _csv_value(r.get("reorderThreshold")) + "\r\n"
+    )
+
+
+def _cursor(next_cursor):
+    return encode_basestring_ascii(next_cursor) if next_cursor else "null"
+
+
+def encode_page(encode, records, list_name, next_cursor):
+    """{"<list_name>": [rows...], "nextCursor": ...} as one JSON document."""
+    return Raw(
+        '{' + encode_basestring_ascii(list_name) + ':[' + ','.join(map(encode, records)) +
+        '],"nextCursor":' + _cursor(next_cursor) + '}'
+    )
+
+
+def encode_changes(records, next_cursor, next_since):
+    """
+    {"items": [...], "deleted": [...], "nextCursor": ..., "nextSince": ...} for
+    a page of ItemChangesIndex rows (ITEM# rows and TOMBSTONE# rows).
+    """
+    items, deleted = [], []
+    for r in records:
+        if r["SK"]["S"].startswith("TOMBSTONE#"):
+            deleted.append(encode_tombstone(r))
+        else:
+            items.append(encode_item_change(r))
+    return Raw(
+        '{"items":[' + ','.join(items) + '],"deleted":[' + ','.join(deleted) +
+        '],"nextCursor":' + _cursor(next_cursor) +
+        ',"nextSince":' + ("null" if next_since is None else str(int(next_since))) + '}'
+    )
+
+
+def iter_ndjson(encode, records, next_cursor=None, trailer=True):
+    """Yields one NDJSON line per record, then a {"nextCursor": ...} line."""
+    for record in records:
+        yield encode(record) + "\n"
+    if trailer:
+        yield '{"nextCursor":' + _cursor(next_cursor) + '}\n'
+
+
+def encode_ndjson(encode, records, next_cursor):
+    return Raw("".join(iter_ndjson(encode, records, next_cursor)))
+
+
+def wants_ndjson(headers):
+    """True if the client asked for NDJSON via the Accept header."""
+    return NDJSON_CONTENT_TYPE in (headers or {}).get("accept", "")
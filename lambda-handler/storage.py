@@ -0,0 +1,119 @@
+"""
+S3 access for the export and import jobs, on the shared lazily created client
+(clients.py). Objects live in the stack's bucket (the `bucket` env var).
+"""
+import os
+import zlib
+
+from botocore.exceptions import ClientError
+
+import clients
+
+BUCKET_NAME = os.environ.get('bucket')
+
+
+def client():
+    return clients.client('s3')
+
+
+# ----------------------------------------------------------------------------
+# Reading
+# ----------------------------------------------------------------------------
+def head(key):
+    """(size, ETag) of an object, or None if it does not exist."""
+    try:
+        resp = client().head_object(Bucket=BUCKET_NAME, Key=key)
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+            return None
+        raise
+    return resp["ContentLength"], resp["ETag"]
+
+
+def iter_lines(key, start=0, if_match=None, chunk_size=1024 * 1024):
+    """
+    Streams the object from byte offset `start` and yields (line, end_offset)
+    for every line, without its line break; end_offset is where the next line
+    starts, i.e. a position to resume from. With if_match (an ETag) the read
+    fails if the object was replaced in the meantime.
+    """
+    kwargs = {"Bucket": BUCKET_NAME, "Key": key, "Range": f"bytes={start}-"}
+    if if_match:
+        kwargs["IfMatch"] = if_match
+    body = client().get_object(**kwargs)["Body"]
+    try:
+        offset, pending = start, b""
+        for chunk in body.iter_chunks(chunk_size):
+            lines = (pending + chunk).split(b"\n")
+            pending = lines.pop()
+            for line in lines:
+                offset += len(line) + 1
+                yield line.rstrip(b"\r"), offset
+        if pending:
+            yield pending.rstrip(b"\r"), offset + len(pending)
+    finally:
+        body.close()
+
+
+# ----------------------------------------------------------------------------
+# Multipart uploads (all parts but the last must be at least 5 MiB)
+# ----------------------------------------------------------------------------
+def create_multipart_upload(key, content_type):
+    """Starts a multipart upload; returns its UploadId."""
+    return client().create_multipart_upload(
+        Bucket=BUCKET_NAME, Key=key, ContentType=content_type
+    )["UploadId"]
+
+
+def upload_part(key, upload_id, part_number, data):
+    """Uploads one part; returns its ETag."""
+    return client().upload_part(
+        Bucket=BUCKET_NAME, Key=key, UploadId=upload_id, PartNumber=part_number, Body=data
+    )["ETag"]
+
+
+def complete_multipart_upload(key, upload_id, parts):
+    """parts: [{"PartNumber": n, "ETag": etag}, ...] in order."""
+    client().complete_multipart_upload(
+        Bucket=BUCKET_NAME, Key=key, UploadId=upload_id,
+        MultipartUpload={"Parts": [{"PartNumber": int(p["PartNumber"]), "ETag": p["ETag"]} for p in parts]}
+    )
+
+
+def abort_multipart_upload(key, upload_id):
+    client().abort_multipart_upload(Bucket=BUCKET_NAME, Key=key, UploadId=upload_id)
+
+
+def presigned_get_url(key, expires_in):
+    """A time-limited URL for downloading the object without credentials."""
+    return client().generate_presigned_url(
+        "get_object", Params={"Bucket": BUCKET_NAME, "Key": key}, ExpiresIn=expires_in
+    )
+
+
+class PartBuffer:
+    """
+    Collects the bytes of one upload part from text chunks. With compress=True
+    every part is a complete gzip member: a concatenation of gzip members is a
+    valid gzip file, so parts can be written by different invocations without
+    carrying compressor state between them.
+    """
+
+    def __init__(self, compress=False):
+        self._chunks = []
+        self.size = 0
+        self._compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+
+    def write(self, text):
+        data = text.encode("utf-8")
+        if self._compressor is not None:
+            data = self._compressor.compress(data)
+        if data:
+            self._chunks.append(data)
+            self.size += len(data)
+
+    def finish(self):
+        """Returns the part's bytes (closing the gzip member)."""
+        if self._compressor is not None:
+            self._chunks.append(self._compressor.flush())
+        return b"".join(self._chunks)
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Microbenchmarks for rendering an item list page (GET .../items) from DynamoDB
+query results, comparing:
+
+  resource + DecimalEncoder  the original path: boto3's TypeDeserializer
+                             (what the resource layer runs), a dict per row with
+                             int(quantity), json.dumps(cls=DecimalEncoder)
+  data layer + json.dumps    dynamo.deserialize_item rows, a dict per row,
+                             json.dumps(cls=DecimalEncoder)
+  serialization.encode_page  precompiled encoder straight from the records
+  serialization NDJSON       the same encoder, NDJSON output
+
+Pure CPU, no AWS calls. Requires boto3 (dev requirements).
+
+    python scripts/bench_serialization.py --rows 1000
+"""
+import argparse
+import json
+import os
+import sys
+import timeit
+
+from boto3.dynamodb.types import TypeDeserializer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "lambda-handler"))
+os.environ.setdefault("table", "benchmark")
+
+import dynamo  # noqa: E402
+import serialization  # noqa: E402
+from index import DecimalEncoder  # noqa: E402
+
+
+def make_records(rows):
+    return [{
+        "PK": {"S": "WAREHOUSE#bench"},
+        "SK": {"S": f"ITEM#item-{i:06d}"},
+        "itemName": {"S": f"Pallet of widgets #{i}"},
+        "quantity": {"N": str(i * 7 % 1000)}
+    } for i in range(rows)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1000, help="rows per page")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    records = make_records(args.rows)
+    deserializer = TypeDeserializer()
+    cursor = "eyJQSyI6IldBUkVIT1VTRSNiZW5jaCJ9"
+
+    def resource_decimal_encoder():
+        resource_rows = [{k: deserializer.deserialize(v) for k, v in r.items()} for r in records]
+        items = [{
+            "itemId": it["SK"].replace("ITEM#", ""),
+            "itemName": it.get("itemName"),
+            "quantity": int(it.get("quantity", 0)),
+            "reorderThreshold": it.get("reorderThreshold")
+        } for it in resource_rows]
+        return json.dumps({"items": items, "nextCursor": cursor}, cls=DecimalEncoder)
+
+    def data_layer_json_dumps():
+        rows = [dynamo.deserialize_item(r) for r in records]
+        items = [{
+            "itemId": it["SK"].replace("ITEM#", ""),
+            "itemName": it.get("itemName"),
+            "quantity": int(it.get("quantity", 0)),
+            "reorderThreshold": it.get("reorderThreshold")
+        } for it in rows]
+        return json.dumps({"items": items, "nextCursor": cursor}, cls=DecimalEncoder)
+
+    def precompiled_page():
+        return serialization.encode_page(serialization.encode_item, records, "items", cursor)
+
+    def precompiled_ndjson():
+        return serialization.encode_ndjson(serialization.encode_item, records, cursor)
+
+    # All JSON variants must produce the same document
+    assert json.loads(precompiled_page()) == json.loads(resource_decimal_encoder())
+    assert json.loads(precompiled_page()) == json.loads(data_layer_json_dumps())
+
+    cases = [
+        ("resource + DecimalEncoder", resource_decimal_encoder),
+        ("data layer + json.dumps", data_layer_json_dumps),
+        ("serialization.encode_page", precompiled_page),
+        ("serialization NDJSON", precompiled_ndjson),
+    ]
+    baseline = None
+    print(f"{args.rows} rows per page, best of {args.repeat}")
+    for name, func in cases:
+        number = max(1, 20000 // args.rows)
+        best = min(timeit.repeat(func, number=number, repeat=args.repeat)) / number
+        baseline = baseline or best
+        print(f"{name:<28} {best * 1000:8.3f} ms/page  {baseline / best:5.2f}x")
+
+
+if __name__ == "__main__":
+    main()
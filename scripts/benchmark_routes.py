@@ -0,0 +1,492 @@
+#!/usr/bin/env python3
+"""
+Drives every route in lambda-handler/routes.py through index.handler against an
+in-memory DynamoDB and S3 (moto) seeded with a synthetic data set:
+
+  --warehouses N   warehouses, all owned by user-0
+  --items M        items per warehouse
+  --users K        users with access to every warehouse (editors and viewers)
+
+plus half as many (rounded up) warehouses created with itemShards=4, holding as
+many items spread over their shards.
+
+Each route gets --requests API Gateway (HTTP API v2) events, rotating over
+warehouses, items and users so role cache hits and misses both occur. Routes that
+behave differently on a sharded warehouse, or with an Idempotency-Key (the first
+request and its replay), get further scenarios labelled "<route key> [variant]".
+Per scenario it reports latency percentiles, DynamoDB calls (counted at the
+botocore layer, so calls that bypass dynamo.py are seen too), rows read and
+consumed capacity.
+moto's own request handling dominates the wall-clock latency, so the latency
+budget applies to the handler's time outside DynamoDB calls ("handler ms"; for
+the export routes that includes moto's S3).
+
+The results are checked against scripts/benchmark_thresholds.json: the maximum
+DynamoDB calls and rows read per request, a p95 handler-time budget, and operations
+that no route may use (Scan). Every scenario must have an entry. Responses must
+have a 2xx status and the top-level body fields in RESPONSE_FIELDS; replays must
+carry Idempotent-Replayed. Exits non-zero on any violation. Requires the dev
+requirements.
+
+moto copies the whole table for every transaction, so item writes slow down as
+the data set grows; the defaults finish in about two and a half minutes.
+
+    python scripts/benchmark_routes.py --warehouses 10 --items 100 --users 5 --requests 20
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+THRESHOLDS = os.path.join(REPO_ROOT, "scripts", "benchmark_thresholds.json")
+TABLE = "warehousedata"
+BUCKET = "benchmark"
+OWNER = "user-0"
+DOOMED_ITEMS = 20  # items in each warehouse the DELETE /warehouses route removes
+LOW_STOCK_EVERY = 25  # every n-th seeded item is below its reorder threshold
+SEED_UPDATED_AT = int(time.time() * 1000) - 3600 * 1000  # seeded items changed an hour ago
+IMPORT_ROWS = 50  # rows of the CSV object uploaded for each warehouse's import
+ITEM_SHARDS = 4  # itemShards of the sharded warehouses
+# Top-level fields every 2xx response of a route must have
+RESPONSE_FIELDS = {
+    "POST /warehouses": ["warehouseId"],
+    "GET /warehouses": ["warehouses", "nextCursor"],
+    "GET /warehouses/{warehouseId}": ["warehouseId", "warehouseName", "itemCount", "totalQuantity", "itemShards"],
+    "GET /warehouses/{warehouseId}/access": ["access", "nextCursor"],
+    "GET /warehouses/{warehouseId}/items": ["items", "nextCursor"],
+    "GET /warehouses/{warehouseId}/items/{itemId}": ["itemId", "itemName", "quantity"],
+    "POST /warehouses/{warehouseId}/items/{itemId}/adjust": ["itemId", "quantity"],
+    "POST /warehouses/{warehouseId}/items/batch": ["succeeded", "failed", "results"],
+    "POST /warehouses/{warehouseId}/items/batch-get": ["items", "missing"],
+    "POST /warehouses/{warehouseId}/transfers": ["transferred"],
+    "GET /warehouses/{warehouseId}/low-stock": ["items", "nextCursor"],
+    "GET /low-stock": ["items", "nextCursor"],
+    "POST /warehouses/{warehouseId}/exports": ["exportId", "status"],
+    "GET /warehouses/{warehouseId}/exports/{exportId}": ["exportId", "status"],
+    "POST /warehouses/{warehouseId}/imports": ["importId", "status"],
+    "GET /warehouses/{warehouseId}/imports/{importId}": ["importId", "status"],
+}
+# The call limits assume role cache entries filled earlier in the run are still
+# there: a run takes minutes against moto, longer than the 30 s default TTL, so
+# the TTL is pinned to keep the results independent of timing
+LOCAL_AWS_ENV = {"AWS_DEFAULT_REGION": "us-east-1",
+                 "AWS_ACCESS_KEY_ID": "testing", "AWS_SECRET_ACCESS_KEY": "testing",
+                 "table": TABLE, "bucket": BUCKET, "roleCacheTtlSeconds": "86400"}
+
+
+class Context:
+    """The parts of the Lambda context object the handler uses."""
+    invoked_function_arn = "arn:aws:lambda:us-east-1:123456789012:function:formlambda"
+
+    def __init__(self, request_id):
+        self.aws_request_id = request_id
+
+    def get_remaining_time_in_millis(self):
+        return 300000
+
+
+def event(route_key, path_parameters=None, user=OWNER, body=None, query=None, headers=None):
+    """
+    An HTTP API v2 event as API Gateway delivers it after the JWT authorizer
+    (header names in lower case).
+    """
+    method, path = route_key.split(" ", 1)
+    for name, value in (path_parameters or {}).items():
+        path = path.replace("{%s}" % name, value)
+    return {
+        "version": "2.0",
+        "routeKey": route_key,
+        "rawPath": path,
+        "rawQueryString": "&".join(f"{k}={v}" for k, v in (query or {}).items()),
+        "headers": dict({"accept": "application/json", "content-type": "application/json",
+                         "authorization": "Bearer eyJ..."},
+                        **{name.lower(): value for name, value in (headers or {}).items()}),
+        "queryStringParameters": query,
+        "pathParameters": path_parameters,
+        "requestContext": {
+            "http": {"method": method, "path": path, "protocol": "HTTP/1.1"},
+            "authorizer": {"jwt": {"claims": {"cognito:username": user, "token_use": "id"},
+                                   "scopes": None}},
+            "routeKey": route_key,
+            "stage": "$default"
+        },
+        "body": json.dumps(body) if body is not None else None,
+        "isBase64Encoded": False
+    }
+
+
+def create_resources():
+    """The table (with its GSIs) and the bucket the stack provisions."""
+    import boto3
+    boto3.client("s3").create_bucket(Bucket=BUCKET)
+    boto3.client("dynamodb").create_table(
+        TableName=TABLE, BillingMode="PAY_PER_REQUEST",
+        AttributeDefinitions=[{"AttributeName": n, "AttributeType": "S"}
+                              for n in ("PK", "SK", "userId", "lowStockPK")] +
+                             [{"AttributeName": "updatedAt", "AttributeType": "N"}],
+        KeySchema=[{"AttributeName": "PK", "KeyType": "HASH"}, {"AttributeName": "SK", "KeyType": "RANGE"}],
+        GlobalSecondaryIndexes=[{
+            "IndexName": "UserAccessIndex",
+            "KeySchema": [{"AttributeName": "userId", "KeyType": "HASH"}, {"AttributeName": "PK", "KeyType": "RANGE"}],
+            "Projection": {"ProjectionType": "INCLUDE", "NonKeyAttributes": ["role"]}
+        }, {
+            "IndexName": "LowStockIndex",
+            "KeySchema": [{"AttributeName": "lowStockPK", "KeyType": "HASH"}, {"AttributeName": "SK", "KeyType": "RANGE"}],
+            "Projection": {"ProjectionType": "INCLUDE",
+                           "NonKeyAttributes": ["itemName", "quantity", "reorderThreshold"]}
+        }, {
+            "IndexName": "ItemChangesIndex",
+            "KeySchema": [{"AttributeName": "PK", "KeyType": "HASH"}, {"AttributeName": "updatedAt", "KeyType": "RANGE"}],
+            "Projection": {"ProjectionType": "INCLUDE",
+                           "NonKeyAttributes": ["itemName", "quantity", "reorderThreshold"]}
+        }]
+    )
+
+
+def seed(warehouses, items, users, doomed):
+    """Writes the synthetic data set; returns the role of every user."""
+    import boto3
+    from index import item_key, shard_pks
+    roles = {f"user-{k}": "owner" if k == 0 else ("editor" if k % 2 else "viewer") for k in range(users)}
+    table = boto3.resource("dynamodb").Table(TABLE)
+    with table.batch_writer() as writer:
+        for w in range(warehouses):
+            pk = f"WAREHOUSE#wh-{w}"
+            writer.put_item(Item={"PK": pk, "SK": "METADATA", "warehouseName": f"Warehouse {w}", "createdAt": 0})
+            for user, role in roles.items():
+                writer.put_item(Item={"PK": pk, "SK": f"ACCESS#{user}", "userId": user, "role": role, "addedAt": 0})
+            for i in range(items):
+                item = {"PK": pk, "SK": f"ITEM#item-{i}", "itemName": f"Item {i}", "quantity": 1000,
+                        "reorderThreshold": 100, "updatedAt": SEED_UPDATED_AT + i}
+                if i % LOW_STOCK_EVERY == 0:  # a few items below their threshold
+                    item.update(quantity=50, lowStockPK=pk)
+                writer.put_item(Item=item)
+        for w in range(sharded_warehouses(warehouses)):
+            # As POST /warehouses with itemShards writes them: the shard count on
+            # METADATA and the ACCESS rows, the totals on one TOTALS row per shard
+            pk = f"WAREHOUSE#sharded-{w}"
+            writer.put_item(Item={"PK": pk, "SK": "METADATA", "warehouseName": f"Sharded {w}", "createdAt": 0,
+                                  "itemShards": ITEM_SHARDS, "version": 1})
+            for user, role in roles.items():
+                writer.put_item(Item={"PK": pk, "SK": f"ACCESS#{user}", "userId": user, "role": role, "addedAt": 0,
+                                      "itemShards": ITEM_SHARDS})
+            totals = {shard_pk: [0, 0] for shard_pk in shard_pks(f"sharded-{w}", ITEM_SHARDS)}
+            for i in range(items):
+                item = dict(item_key(f"sharded-{w}", f"item-{i}", ITEM_SHARDS), itemName=f"Item {i}",
+                            quantity=1000, reorderThreshold=100, updatedAt=SEED_UPDATED_AT + i)
+                totals[item["PK"]][0] += 1
+                totals[item["PK"]][1] += item["quantity"]
+                writer.put_item(Item=item)
+            for shard_pk, (item_count, total_quantity) in totals.items():
+                writer.put_item(Item={"PK": shard_pk, "SK": "TOTALS", "itemCount": item_count,
+                                      "totalQuantity": total_quantity, "version": 1})
+        for w in range(warehouses):
+            rows = "".join(f"item-{i},Imported {i},{i}\n" for i in range(IMPORT_ROWS))
+            boto3.client("s3").put_object(Bucket=BUCKET, Key=f"imports/wh-{w}/inventory.csv",
+                                          Body=("itemId,itemName,quantity\n" + rows).encode())
+        for d in range(doomed):
+            pk = f"WAREHOUSE#doomed-{d}"
+            writer.put_item(Item={"PK": pk, "SK": "METADATA", "warehouseName": f"Doomed {d}", "createdAt": 0})
+            writer.put_item(Item={"PK": pk, "SK": f"ACCESS#{OWNER}", "userId": OWNER, "role": "owner", "addedAt": 0})
+            for i in range(DOOMED_ITEMS):
+                writer.put_item(Item={"PK": pk, "SK": f"ITEM#item-{i}", "itemName": f"Item {i}", "quantity": 1})
+    return roles
+
+
+def sharded_warehouses(warehouses):
+    return (warehouses + 1) // 2
+
+
+def route_of(label):
+    """The route key of a scenario label ("<route key>" or "<route key> [variant]")."""
+    return label.split(" [", 1)[0]
+
+
+def scenarios(warehouses, items, users):
+    """
+    Scenario label -> function(i) returning the i-th event. Routes that need
+    state created by another route (revoke after grant, delete after create,
+    a replay after the first request) come after it; dict order is the run order.
+    """
+    def wh(i):
+        return f"wh-{i % warehouses}"
+
+    def sharded(i):
+        return f"sharded-{i % sharded_warehouses(warehouses)}"
+
+    def reader(i):
+        return f"user-{i % users}"
+
+    def item(i):
+        return f"item-{(i * 7) % items}"
+
+    def job(i, kind):
+        # One of the jobs (EXPORT, IMPORT) a POST scenario started (read before the clock starts)
+        import boto3
+        from boto3.dynamodb.conditions import Key
+        rows = boto3.resource("dynamodb").Table(TABLE).query(
+            KeyConditionExpression=Key("PK").eq(f"WAREHOUSE#{wh(i)}") & Key("SK").begins_with(kind + "#")
+        )["Items"]
+        return rows[i % len(rows)]["SK"][len(kind) + 1:]
+
+    def adjust_once(i):
+        # The same request (user, body and key) for the i-th first use and its replay
+        return event(
+            "POST /warehouses/{warehouseId}/items/{itemId}/adjust", {"warehouseId": wh(i), "itemId": item(i)},
+            body={"delta": -1}, headers={"Idempotency-Key": f"benchmark-{i}"})
+
+    return {
+        "POST /warehouses": lambda i: event(
+            "POST /warehouses", body={"warehouseId": f"new-{i}", "warehouseName": f"New {i}"}),
+        "GET /warehouses": lambda i: event(
+            "GET /warehouses", user=reader(i), query={"limit": "50"}),
+        "GET /warehouses/{warehouseId}": lambda i: event(
+            "GET /warehouses/{warehouseId}", {"warehouseId": wh(i)}, user=reader(i)),
+        "PUT /warehouses/{warehouseId}": lambda i: event(
+            "PUT /warehouses/{warehouseId}", {"warehouseId": wh(i)}, body={"warehouseName": f"Renamed {i}"}),
+        "POST /warehouses/{warehouseId}/access": lambda i: event(
+            "POST /warehouses/{warehouseId}/access", {"warehouseId": wh(i)},
+            body={"userId": f"guest-{i}", "role": "viewer"}),
+        "GET /warehouses/{warehouseId}/access": lambda i: event(
+            "GET /warehouses/{warehouseId}/access", {"warehouseId": wh(i)}),
+        "DELETE /warehouses/{warehouseId}/access/{userId}": lambda i: event(
+            "DELETE /warehouses/{warehouseId}/access/{userId}", {"warehouseId": wh(i), "userId": f"guest-{i}"}),
+        "POST /warehouses/{warehouseId}/items": lambda i: event(
+            "POST /warehouses/{warehouseId}/items", {"warehouseId": wh(i)},
+            body={"itemId": f"new-item-{i}", "itemName": f"New item {i}", "quantity": 5}),
+        # every other request is a delta sync (?since=) over the last half of the items
+        "GET /warehouses/{warehouseId}/items": lambda i: event(
+            "GET /warehouses/{warehouseId}/items", {"warehouseId": wh(i)}, user=reader(i),
+            query={"limit": "100", "since": str(SEED_UPDATED_AT + items // 2)} if i % 2 else {"limit": "100"}),
+        "GET /warehouses/{warehouseId}/items/{itemId}": lambda i: event(
+            "GET /warehouses/{warehouseId}/items/{itemId}", {"warehouseId": wh(i), "itemId": item(i)},
+            user=reader(i)),
+        "PUT /warehouses/{warehouseId}/items/{itemId}": lambda i: event(
+            "PUT /warehouses/{warehouseId}/items/{itemId}", {"warehouseId": wh(i), "itemId": item(i)},
+            body={"itemName": f"Updated {i}"}),
+        "POST /warehouses/{warehouseId}/items/{itemId}/adjust": lambda i: event(
+            "POST /warehouses/{warehouseId}/items/{itemId}/adjust", {"warehouseId": wh(i), "itemId": item(i)},
+            body={"delta": -1}),
+        "POST /warehouses/{warehouseId}/items/{itemId}/adjust [Idempotency-Key]": adjust_once,
+        "POST /warehouses/{warehouseId}/items/{itemId}/adjust [replay]": adjust_once,
+        "GET /warehouses/{warehouseId} [sharded]": lambda i: event(
+            "GET /warehouses/{warehouseId}", {"warehouseId": sharded(i)}, user=reader(i)),
+        "GET /warehouses/{warehouseId}/items [sharded]": lambda i: event(
+            "GET /warehouses/{warehouseId}/items", {"warehouseId": sharded(i)}, user=reader(i),
+            query={"limit": "100", "since": str(SEED_UPDATED_AT + items // 2)} if i % 2 else {"limit": "100"}),
+        "GET /warehouses/{warehouseId}/items/{itemId} [sharded]": lambda i: event(
+            "GET /warehouses/{warehouseId}/items/{itemId}", {"warehouseId": sharded(i), "itemId": item(i)},
+            user=reader(i)),
+        "PUT /warehouses/{warehouseId}/items/{itemId} [sharded]": lambda i: event(
+            "PUT /warehouses/{warehouseId}/items/{itemId}", {"warehouseId": sharded(i), "itemId": item(i)},
+            body={"quantity": 900 + i}),
+        "POST /warehouses/{warehouseId}/items/{itemId}/adjust [sharded]": lambda i: event(
+            "POST /warehouses/{warehouseId}/items/{itemId}/adjust", {"warehouseId": sharded(i), "itemId": item(i)},
+            body={"delta": -1}),
+        "POST /warehouses/{warehouseId}/items/batch": lambda i: event(
+            "POST /warehouses/{warehouseId}/items/batch", {"warehouseId": wh(i)},
+            body={"items": [{"itemId": f"bulk-{i}-{n}", "itemName": f"Bulk {n}", "quantity": n}
+                            for n in range(25)]}),
+        "POST /warehouses/{warehouseId}/items/batch-get": lambda i: event(
+            "POST /warehouses/{warehouseId}/items/batch-get", {"warehouseId": wh(i)}, user=reader(i),
+            body={"itemIds": [item(i + n) for n in range(150)] + [f"missing-{i}"]}),
+        "POST /warehouses/{warehouseId}/transfers": lambda i: event(
+            "POST /warehouses/{warehouseId}/transfers", {"warehouseId": wh(i)},
+            body={"toWarehouseId": wh(i + 1), "items": [{"itemId": item(i + n), "quantity": 1} for n in range(10)]}),
+        "GET /warehouses/{warehouseId}/low-stock": lambda i: event(
+            "GET /warehouses/{warehouseId}/low-stock", {"warehouseId": wh(i)}, user=reader(i)),
+        "GET /low-stock": lambda i: event(
+            "GET /low-stock", user=reader(i), query={"limit": "20"}),
+        "POST /warehouses/{warehouseId}/exports": lambda i: event(
+            "POST /warehouses/{warehouseId}/exports", {"warehouseId": wh(i)}, user=reader(i),
+            body={"format": "csv" if i % 2 else "ndjson", "gzip": i % 3 == 0}),
+        "GET /warehouses/{warehouseId}/exports/{exportId}": lambda i: event(
+            "GET /warehouses/{warehouseId}/exports/{exportId}", {"warehouseId": wh(i), "exportId": job(i, "EXPORT")},
+            user=reader(i)),
+        "POST /warehouses/{warehouseId}/imports": lambda i: event(
+            "POST /warehouses/{warehouseId}/imports", {"warehouseId": wh(i)},
+            body={"objectKey": f"imports/{wh(i)}/inventory.csv"}),
+        "GET /warehouses/{warehouseId}/imports/{importId}": lambda i: event(
+            "GET /warehouses/{warehouseId}/imports/{importId}", {"warehouseId": wh(i), "importId": job(i, "IMPORT")},
+            user=reader(i)),
+        "DELETE /warehouses/{warehouseId}/items/{itemId}": lambda i: event(
+            "DELETE /warehouses/{warehouseId}/items/{itemId}", {"warehouseId": wh(i), "itemId": f"new-item-{i}"}),
+        "DELETE /warehouses/{warehouseId}": lambda i: event(
+            "DELETE /warehouses/{warehouseId}", {"warehouseId": f"doomed-{i}"}),
+    }
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p / 100.0 * (len(ordered) - 1))))]
+
+
+def response_fields(response):
+    """Top-level fields of a JSON object body (none for an empty or other body)."""
+    try:
+        body = json.loads(response.get("body") or "null")
+    except ValueError:
+        return []
+    return sorted(body) if isinstance(body, dict) else []
+
+
+def run(requests, warehouses, items, users):
+    """Runs every scenario; returns scenario label -> list of per-request samples."""
+    import clients
+    import index
+    import instrumentation
+    import routes
+
+    calls = []
+    clients.client("dynamodb").meta.events.register(
+        "before-call.dynamodb", lambda model, **kwargs: calls.append(model.name))
+
+    finished = []
+    finish_request = instrumentation.finish_request
+
+    def capture(status_code, extra=None):
+        finished.append(finish_request(status_code, extra))
+    instrumentation.finish_request = capture
+
+    plan = scenarios(warehouses, items, users)
+    missing = set(routes.ROUTES) - {route_of(label) for label in plan}
+    if missing:
+        raise SystemExit(f"No benchmark scenario for: {', '.join(sorted(missing))}")
+
+    samples = {}
+    sink = io.StringIO()
+    for label, make_event in plan.items():
+        samples[label] = []
+        for i in range(requests):
+            ev = make_event(i)
+            del calls[:], finished[:]
+            sink.seek(0)
+            sink.truncate()
+            with contextlib.redirect_stdout(sink):
+                started = time.perf_counter()
+                response = index.handler(ev, Context(f"{label}-{i}"))
+                elapsed_ms = (time.perf_counter() - started) * 1000
+            metrics = finished[-1]
+            samples[label].append({
+                "ms": elapsed_ms,
+                "handler_ms": elapsed_ms - metrics.phases.get("dynamodb", 0.0),
+                "status": response["statusCode"],
+                "fields": response_fields(response),
+                "headers": sorted(response.get("headers", {})),
+                "calls": len(calls),
+                "operations": list(calls),
+                "items_read": metrics.items_read,
+                "capacity": metrics.capacity_units
+            })
+    instrumentation.finish_request = finish_request
+    return samples
+
+
+def summarize(samples):
+    summary = {}
+    for label, rows in samples.items():
+        latencies = [r["ms"] for r in rows]
+        handler_latencies = [r["handler_ms"] for r in rows]
+        summary[label] = {
+            "requests": len(rows),
+            "p50Ms": percentile(latencies, 50),
+            "p95Ms": percentile(latencies, 95),
+            "p99Ms": percentile(latencies, 99),
+            "p50HandlerMs": percentile(handler_latencies, 50),
+            "p95HandlerMs": percentile(handler_latencies, 95),
+            "avgDynamoDbCalls": sum(r["calls"] for r in rows) / len(rows),
+            "maxDynamoDbCalls": max(r["calls"] for r in rows),
+            "avgItemsRead": sum(r["items_read"] for r in rows) / len(rows),
+            "maxItemsRead": max(r["items_read"] for r in rows),
+            "avgCapacity": sum(r["capacity"] for r in rows) / len(rows),
+            "operations": sorted({op for r in rows for op in r["operations"]}),
+            "statuses": sorted({r["status"] for r in rows}),
+            # Present in every response
+            "fields": sorted(set.intersection(*(set(r["fields"]) for r in rows))),
+            "headers": sorted(set.intersection(*(set(r["headers"]) for r in rows)))
+        }
+    return summary
+
+
+def check(summary, thresholds, check_latency):
+    """Returns a list of threshold and response violations."""
+    failures = []
+    forbidden = set(thresholds.get("forbiddenOperations", []))
+    for label, s in summary.items():
+        limits = thresholds["routes"].get(label)
+        if limits is None:
+            failures.append(f"{label}: no entry in {os.path.basename(THRESHOLDS)}")
+            continue
+        bad_statuses = [code for code in s["statuses"] if not 200 <= code < 300]
+        if bad_statuses:
+            failures.append(f"{label}: unexpected status codes {bad_statuses}")
+        missing_fields = set(RESPONSE_FIELDS.get(route_of(label), ())) - set(s["fields"])
+        if missing_fields:
+            failures.append(f"{label}: responses without {', '.join(sorted(missing_fields))}")
+        if label.endswith("[replay]") and "Idempotent-Replayed" not in s["headers"]:
+            failures.append(f"{label}: responses without Idempotent-Replayed")
+        used = forbidden.intersection(s["operations"])
+        if used:
+            failures.append(f"{label}: uses {', '.join(sorted(used))}")
+        if s["maxDynamoDbCalls"] > limits["maxDynamoDbCalls"]:
+            failures.append(f"{label}: {s['maxDynamoDbCalls']} DynamoDB calls > {limits['maxDynamoDbCalls']}")
+        if s["maxItemsRead"] > limits["maxItemsRead"]:
+            failures.append(f"{label}: {s['maxItemsRead']} rows read > {limits['maxItemsRead']}")
+        if check_latency and s["p95HandlerMs"] > limits["p95HandlerMs"]:
+            failures.append(f"{label}: p95 handler time {s['p95HandlerMs']:.2f} ms > {limits['p95HandlerMs']} ms")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--warehouses", type=int, default=10)
+    parser.add_argument("--items", type=int, default=100, help="items per warehouse")
+    parser.add_argument("--users", type=int, default=5)
+    parser.add_argument("--requests", type=int, default=20, help="requests per route")
+    parser.add_argument("--no-latency-check", action="store_true",
+                        help="report but do not enforce p95 budgets (e.g. on a noisy CI runner)")
+    parser.add_argument("--json", help="also write the summary to this file")
+    args = parser.parse_args()
+    if args.users < 2 or args.items < 1 or args.warehouses < 1:
+        parser.error("need at least 1 warehouse, 1 item and 2 users")
+
+    os.environ.update(LOCAL_AWS_ENV)
+    os.environ.setdefault("logSampleRate", "0")
+    sys.path.insert(0, os.path.join(REPO_ROOT, "lambda-handler"))
+
+    from moto import mock_aws
+    with mock_aws():
+        create_resources()
+        seed(args.warehouses, args.items, args.users, doomed=args.requests)
+        summary = summarize(run(args.requests, args.warehouses, args.items, args.users))
+
+    print(f"{args.warehouses} warehouses x {args.items} items, {args.users} users, "
+          f"{args.requests} requests per route")
+    print(f"{'scenario':<72}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'handler p50':>12}{'p95':>7}"
+          f"{'calls':>8}{'max':>6}{'rows':>8}{'max':>6}{'RCU/WCU':>9}")
+    for label, s in summary.items():
+        print(f"{label:<72}{s['p50Ms']:>9.2f}{s['p95Ms']:>9.2f}{s['p99Ms']:>9.2f}"
+              f"{s['p50HandlerMs']:>12.2f}{s['p95HandlerMs']:>7.2f}"
+              f"{s['avgDynamoDbCalls']:>8.2f}{s['maxDynamoDbCalls']:>6}"
+              f"{s['avgItemsRead']:>8.1f}{s['maxItemsRead']:>6}{s['avgCapacity']:>9.2f}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(summary, f, indent=2)
+
+    with open(THRESHOLDS) as f:
+        thresholds = json.load(f)
+    failures = check(summary, thresholds, not args.no_latency_check)
+    if failures:
+        print("\nThreshold violations:")
+        for failure in failures:
+            print("  " + failure)
+        sys.exit(1)
+    print("\nAll routes within thresholds.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Measures the Lambda handler's init duration and per-request CPU time, for the
+current lambda-handler/ and (optionally) the one at another git revision.
+
+DynamoDB is served by a local moto server, so the handler runs its real AWS SDK
+code path; each variant is measured in a fresh Python process to get a true
+cold import. Requires the dev requirements (boto3, moto[server]).
+
+    python scripts/measure_cold_start.py --ref baseline --requests 200
+"""
+import argparse
+import io
+import json
+import logging
+import os
+import subprocess
+import sys
+import tarfile
+import tempfile
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TABLE = "warehousedata"
+USER = "bench-user"
+WAREHOUSE = "bench"
+ITEMS = 200
+# Credentials and region for the local moto server only
+LOCAL_AWS_ENV = {"AWS_DEFAULT_REGION": "us-east-1",
+                 "AWS_ACCESS_KEY_ID": "testing", "AWS_SECRET_ACCESS_KEY": "testing"}
+
+# Runs inside the child process: argv = [handler_dir, requests]
+CHILD = r'''
+import contextlib, io, json, sys, time
+handler_dir, requests = sys.argv[1], int(sys.argv[2])
+sys.path.insert(0, handler_dir)
+
+def event(route_key, path, path_parameters):
+    return {
+        "routeKey": route_key, "rawPath": path, "pathParameters": path_parameters,
+        "queryStringParameters": None, "headers": {}, "body": None,
+        "requestContext": {"http": {"method": route_key.split()[0], "path": path},
+                           "authorizer": {"jwt": {"claims": {"cognito:username": "%(user)s"}}}}
+    }
+
+events = {
+    "GET item": event("GET /warehouses/{warehouseId}/items/{itemId}", "/warehouses/%(wh)s/items/item-7",
+                      {"warehouseId": "%(wh)s", "itemId": "item-7"}),
+    "GET warehouse": event("GET /warehouses/{warehouseId}", "/warehouses/%(wh)s", {"warehouseId": "%(wh)s"}),
+    "GET items": event("GET /warehouses/{warehouseId}/items", "/warehouses/%(wh)s/items", {"warehouseId": "%(wh)s"}),
+}
+
+sink = io.StringIO()
+with contextlib.redirect_stdout(sink):
+    start = time.perf_counter()
+    cpu = time.process_time()
+    import index
+    init_ms = (time.perf_counter() - start) * 1000
+    init_cpu_ms = (time.process_time() - cpu) * 1000
+
+    start = time.perf_counter()
+    cpu = time.process_time()
+    first = index.handler(events["GET item"], None)
+    first_ms = (time.perf_counter() - start) * 1000
+    first_cpu_ms = (time.process_time() - cpu) * 1000
+    assert first["statusCode"] == 200, first
+
+    per_request = {}
+    for name, ev in events.items():
+        cpu = time.process_time()
+        for _ in range(requests):
+            sink.seek(0)
+            sink.truncate()
+            index.handler(ev, None)
+        per_request[name] = (time.process_time() - cpu) * 1000 / requests
+
+print(json.dumps({
+    "init_ms": init_ms, "init_cpu_ms": init_cpu_ms,
+    "first_request_ms": first_ms, "first_request_cpu_ms": first_cpu_ms,
+    "cpu_ms_per_request": per_request
+}))
+''' % {"user": USER, "wh": WAREHOUSE}
+
+
+def seed(endpoint):
+    import boto3
+    ddb = boto3.client("dynamodb", endpoint_url=endpoint)
+    ddb.create_table(
+        TableName=TABLE, BillingMode="PAY_PER_REQUEST",
+        AttributeDefinitions=[{"AttributeName": n, "AttributeType": "S"} for n in ("PK", "SK", "userId")],
+        KeySchema=[{"AttributeName": "PK", "KeyType": "HASH"}, {"AttributeName": "SK", "KeyType": "RANGE"}],
+        GlobalSecondaryIndexes=[{
+            "IndexName": "UserAccessIndex",
+            "KeySchema": [{"AttributeName": "userId", "KeyType": "HASH"}, {"AttributeName": "PK", "KeyType": "RANGE"}],
+            "Projection": {"ProjectionType": "ALL"}
+        }]
+    )
+    table = boto3.resource("dynamodb", endpoint_url=endpoint).Table(TABLE)
+    with table.batch_writer() as writer:
+        writer.put_item(Item={"PK": f"WAREHOUSE#{WAREHOUSE}", "SK": "METADATA",
+                              "warehouseName": "Benchmark", "createdAt": 0})
+        writer.put_item(Item={"PK": f"WAREHOUSE#{WAREHOUSE}", "SK": f"ACCESS#{USER}",
+                              "userId": USER, "role": "owner", "addedAt": 0})
+        for i in range(ITEMS):
+            writer.put_item(Item={"PK": f"WAREHOUSE#{WAREHOUSE}", "SK": f"ITEM#item-{i}",
+                                  "itemName": f"Item {i}", "quantity": i})
+
+
+def checkout(ref, target):
+    """Extracts lambda-handler/ at the given git revision into target."""
+    archive = subprocess.run(["git", "archive", ref, "lambda-handler"], cwd=REPO_ROOT,
+                             check=True, stdout=subprocess.PIPE).stdout
+    with tarfile.open(fileobj=io.BytesIO(archive)) as tar:
+        tar.extractall(target)
+    return os.path.join(target, "lambda-handler")
+
+
+def measure(handler_dir, endpoint, requests):
+    env = dict(os.environ, table=TABLE, bucket="unused", AWS_ENDPOINT_URL=endpoint, **LOCAL_AWS_ENV)
+    out = subprocess.run([sys.executable, "-c", CHILD, handler_dir, str(requests)],
+                         env=env, check=True, stdout=subprocess.PIPE).stdout
+    return json.loads(out.decode().strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--ref", help="git revision to compare against (e.g. a commit before the change)")
+    parser.add_argument("--requests", type=int, default=100, help="warm requests per route")
+    args = parser.parse_args()
+    os.environ.update(LOCAL_AWS_ENV)
+
+    from moto.server import ThreadedMotoServer
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    server = ThreadedMotoServer(port=0, verbose=False)
+    server.start()
+    host, port = server.get_host_and_port()
+    endpoint = f"http://{host}:{port}"
+    try:
+        seed(endpoint)
+        results = {}
+        with tempfile.TemporaryDirectory() as tmp:
+            if args.ref:
+                results[args.ref] = measure(checkout(args.ref, tmp), endpoint, args.requests)
+            results["working tree"] = measure(os.path.join(REPO_ROOT, "lambda-handler"), endpoint, args.requests)
+    finally:
+        server.stop()
+
+    rows = [("init (import index)", "init_ms"), ("init CPU", "init_cpu_ms"),
+            ("first request", "first_request_ms"), ("first request CPU", "first_request_cpu_ms")]
+    print(f"{'ms':<32}" + "".join(f"{name:>16}" for name in results))
+    for label, key in rows:
+        print(f"{label:<32}" + "".join(f"{r[key]:>16.2f}" for r in results.values()))
+    for route in next(iter(results.values()))["cpu_ms_per_request"]:
+        print(f"{'CPU/request ' + route:<32}" +
+              "".join(f"{r['cpu_ms_per_request'][route]:>16.2f}" for r in results.values()))
+
+
+if __name__ == "__main__":
+    main()
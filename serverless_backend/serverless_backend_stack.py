@@ -1,9 +1,12 @@
 from aws_cdk import (
     Stack,
+    ArnFormat,
+    Duration,
     CfnParameter as _cfnParameter,
     aws_cognito as _cognito,
     aws_s3 as _s3,
     aws_dynamodb as _dynamodb,
+    aws_iam as _iam,
     aws_lambda as _lambda,
     aws_apigateway as _apigateway,
     aws_apigatewayv2 as _apigatewayv2,
@@ -12,13 +15,78 @@ from aws_cdk import (
 
 )
 from constructs import Construct
+import importlib.util
+import json
 import os
 
+# Performance settings of the function and the table. Override any of them with
+# the "performanceProfile" context value, in cdk.json or on the command line:
+#   cdk deploy -c performanceProfile='{"memorySize": 2048, "provisionedConcurrencyMax": 10}'
+DEFAULT_PERFORMANCE_PROFILE = {
+    'architecture': 'arm64',            # or 'x86_64'
+    'memorySize': 1024,                 # MB; CPU share grows with memory
+    'timeoutSeconds': 30,               # background jobs plan their work around this
+    'reservedConcurrency': None,        # cap on concurrent executions, None = unreserved
+    # Provisioned concurrency on the "live" alias the API invokes: min..max
+    # environments, scaled to keep this fraction of them busy. 0 = no alias.
+    'provisionedConcurrencyMin': 0,
+    'provisionedConcurrencyMax': 0,
+    'provisionedConcurrencyUtilization': 0.7,
+    # 'PROVISIONED' (read/write capacity autoscaled between min and max for the
+    # table and every index) or 'PAY_PER_REQUEST' (on-demand, capacity unused)
+    'billingMode': 'PROVISIONED',
+    'readCapacityMin': 5,
+    'readCapacityMax': 50,
+    'writeCapacityMin': 5,
+    'writeCapacityMax': 50,
+    'capacityUtilizationPercent': 70,
+}
+
+# The table's global secondary indexes, in the order they were introduced.
+# CloudFormation creates at most one new index per stack update, so a table
+# deployed before them gets them over several deploys with the "tableIndexes"
+# context value (how many of them, from the first, the stack defines):
+#   cdk deploy -c tableIndexes=1 ...   then 2, then without it (all of them)
+TABLE_INDEXES = [
+    # Inverted index over the ACCESS rows (userId -> WAREHOUSE#<id>), so a user's
+    # warehouses can be listed with a Query instead of a full table scan.
+    # Only ACCESS rows carry userId, which keeps the index sparse.
+    dict(
+        index_name='UserAccessIndex',
+        partition_key=_dynamodb.Attribute(name='userId', type=_dynamodb.AttributeType.STRING),
+        sort_key=_dynamodb.Attribute(name='PK', type=_dynamodb.AttributeType.STRING),
+        projection_type=_dynamodb.ProjectionType.INCLUDE,
+        non_key_attributes=['role']
+    ),
+    # Sparse index of the items that are below their reorder threshold: the item
+    # write paths set lowStockPK (= the item's PK) only while
+    # quantity < reorderThreshold and remove it otherwise.
+    dict(
+        index_name='LowStockIndex',
+        partition_key=_dynamodb.Attribute(name='lowStockPK', type=_dynamodb.AttributeType.STRING),
+        sort_key=_dynamodb.Attribute(name='SK', type=_dynamodb.AttributeType.STRING),
+        projection_type=_dynamodb.ProjectionType.INCLUDE,
+        non_key_attributes=['itemName', 'quantity', 'reorderThreshold']
+    ),
+    # Delta sync: the ITEM rows and TOMBSTONE rows of a warehouse in order of
+    # their last change. Only those rows carry updatedAt.
+    dict(
+        index_name='ItemChangesIndex',
+        partition_key=_dynamodb.Attribute(name='PK', type=_dynamodb.AttributeType.STRING),
+        sort_key=_dynamodb.Attribute(name='updatedAt', type=_dynamodb.AttributeType.NUMBER),
+        projection_type=_dynamodb.ProjectionType.INCLUDE,
+        non_key_attributes=['itemName', 'quantity', 'reorderThreshold']
+    ),
+]
+
 
 class ServerlessBackendStack(Stack):
 
     def __init__(self, scope: Construct, construct_id: str, **kwargs) -> None:
         super().__init__(scope, construct_id, **kwargs)
+        profile = performance_profile(self.node.try_get_context('performanceProfile'))
+        indexes = table_indexes(self.node.try_get_context('tableIndexes'))
+        provisioned_table = profile['billingMode'] == 'PROVISIONED'
         bucket_name = _cfnParameter(self, "uploadBucketName", type="String",
                                     description="The name of the Amazon S3 bucket where uploaded images will be stored.")
         user_pool = _cognito.UserPool(self, "UserPool")
@@ -34,21 +102,59 @@ class ServerlessBackendStack(Stack):
         my_table = _dynamodb.Table(self, 'dynamoTable',
         table_name='warehousedata',
         partition_key=_dynamodb.Attribute(name='PK', type=_dynamodb.AttributeType.STRING),
-        sort_key=_dynamodb.Attribute(name='SK', type=_dynamodb.AttributeType.STRING)
+        sort_key=_dynamodb.Attribute(name='SK', type=_dynamodb.AttributeType.STRING),
+        billing_mode=_dynamodb.BillingMode(profile['billingMode']),
+        read_capacity=profile['readCapacityMin'] if provisioned_table else None,
+        write_capacity=profile['writeCapacityMin'] if provisioned_table else None,
+        # Deletion tombstones of the delta sync expire on their own
+        time_to_live_attribute='expiresAt'
         )
+        index_capacity = dict(read_capacity=profile['readCapacityMin'],
+                              write_capacity=profile['writeCapacityMin']) if provisioned_table else {}
+        for index in indexes:
+            my_table.add_global_secondary_index(**index_capacity, **index)
+        if provisioned_table:
+            autoscale_capacity(my_table, [index['index_name'] for index in indexes], profile)
+        # Warehouse exports are only kept for download; uploads abandoned by a
+        # failed export are cleaned up as well
         my_bucket = _s3.Bucket(self, id='s3bucket',
-                               bucket_name=bucket_name.value_as_string)
+                               bucket_name=bucket_name.value_as_string,
+                               lifecycle_rules=[_s3.LifecycleRule(
+                                   prefix='exports/',
+                                   expiration=Duration.days(7),
+                                   abort_incomplete_multipart_upload_after=Duration.days(1)
+                               )])
         my_lambda = _lambda.Function(self, id='lambdafunction', function_name="formlambda", runtime=_lambda.Runtime.PYTHON_3_12,
                                      handler='index.handler',
                                      code=_lambda.Code.from_asset(
                                          os.path.join("./", "lambda-handler")),
+                                     architecture=_lambda.Architecture.ARM_64 if profile['architecture'] == 'arm64'
+                                     else _lambda.Architecture.X86_64,
+                                     memory_size=profile['memorySize'],
+                                     # Background jobs (exports, deletions) must fit a whole
+                                     # 5 MiB export part into one invocation; API requests
+                                     # stay bounded by API Gateway's own 30 s limit
+                                     timeout=Duration.seconds(profile['timeoutSeconds']),
+                                     reserved_concurrent_executions=profile['reservedConcurrency'],
                                      environment={
                                          'bucket': my_bucket.bucket_name,
-                                         'table': my_table.table_name
+                                         'table': my_table.table_name,
+                                         'userAccessIndex': 'UserAccessIndex',
+                                         'lowStockIndex': 'LowStockIndex',
+                                         'itemChangesIndex': 'ItemChangesIndex'
                                      }
                                      )
         my_bucket.grant_read_write(my_lambda)
         my_table.grant_read_write_data(my_lambda)
+        # Long-running jobs (e.g. warehouse deletion) continue by invoking the function
+        # asynchronously. The ARN is built from the fixed name to avoid a
+        # function -> role policy -> function dependency cycle.
+        my_lambda.add_to_role_policy(_iam.PolicyStatement(
+            actions=['lambda:InvokeFunction'],
+            resources=[self.format_arn(service='lambda', resource='function',
+                                       resource_name='formlambda',
+                                       arn_format=ArnFormat.COLON_RESOURCE_NAME)]
+        ))
         tim_authorizer = _apigatewayv2_authorizers.HttpUserPoolAuthorizer(
             id='user-pool-authorizer', pool=user_pool, user_pool_clients=[user_pool_client]
         )
@@ -64,69 +170,108 @@ class ServerlessBackendStack(Stack):
         #     authorizer=tim_authorizer
         # )
 
-        routes = [
-            {
-                "path": "/warehouses",
-                "methods": [_apigatewayv2.HttpMethod.POST]
-            },
-            {
-                "path": "/warehouses",
-                "methods": [_apigatewayv2.HttpMethod.GET]
-            },
-            {
-                "path": "/warehouses/{warehouseId}",
-                "methods": [_apigatewayv2.HttpMethod.GET]
-            },
-            {
-                "path": "/warehouses/{warehouseId}",
-                "methods": [_apigatewayv2.HttpMethod.PUT]
-            },
-            {
-                "path": "/warehouses/{warehouseId}",
-                "methods": [_apigatewayv2.HttpMethod.DELETE]
-            },
-            {
-                "path": "/warehouses/{warehouseId}/items",
-                "methods": [_apigatewayv2.HttpMethod.POST]
-            },
-            {
-                "path": "/warehouses/{warehouseId}/items",
-                "methods": [_apigatewayv2.HttpMethod.GET]
-            },
-            {
-                "path": "/warehouses/{warehouseId}/items/{itemId}",
-                "methods": [_apigatewayv2.HttpMethod.GET]
-            },
-            {
-                "path": "/warehouses/{warehouseId}/items/{itemId}",
-                "methods": [_apigatewayv2.HttpMethod.PUT]
-            },
-            {
-                "path": "/warehouses/{warehouseId}/items/{itemId}",
-                "methods": [_apigatewayv2.HttpMethod.DELETE]
-            },
-            {
-                "path": "/warehouses/{warehouseId}/access",
-                "methods": [_apigatewayv2.HttpMethod.POST]
-            },
-            {
-                "path": "/warehouses/{warehouseId}/access",
-                "methods": [_apigatewayv2.HttpMethod.GET]
-            },
-            {
-                "path": "/warehouses/{warehouseId}/access/{userId}",
-                "methods": [_apigatewayv2.HttpMethod.DELETE]
-            }
-        ]
-
-        for i, route_info in enumerate(routes):
+        # One integration for every route; the routes themselves come from the
+        # registry the Lambda handler dispatches on (lambda-handler/routes.py)
+        tim_integration = _apigatewayv2_integrations.HttpLambdaIntegration(
+            id='tim-integration',
+            handler=provisioned_alias(self, my_lambda, profile) or my_lambda
+        )
+        for route_key in load_route_registry():
+            method, path = route_key.split(" ", 1)
             tim_api.add_routes(
-                path=route_info["path"],
-                methods=route_info["methods"],
-                # Use a unique id for each integration
-                integration=_apigatewayv2_integrations.HttpLambdaIntegration(
-                    id=f"tim-integration-{i}",
-                    handler=my_lambda
-                ),
+                path=path,
+                methods=[_apigatewayv2.HttpMethod(method)],
+                integration=tim_integration,
                 authorizer=tim_authorizer
-            )
\ No newline at end of file
+            )
+
+
+def performance_profile(overrides):
+    """
+    DEFAULT_PERFORMANCE_PROFILE with the given overrides (a dict from cdk.json, or
+    a JSON string from `cdk -c`) applied. Raises ValueError on unknown keys and
+    inconsistent values, so a typo fails the synth instead of being ignored.
+    """
+    if isinstance(overrides, str):
+        overrides = json.loads(overrides)
+    overrides = overrides or {}
+    unknown = set(overrides) - set(DEFAULT_PERFORMANCE_PROFILE)
+    if unknown:
+        raise ValueError(f"Unknown performanceProfile keys: {', '.join(sorted(unknown))}.")
+    profile = dict(DEFAULT_PERFORMANCE_PROFILE, **overrides)
+    if profile['architecture'] not in ('arm64', 'x86_64'):
+        raise ValueError("performanceProfile architecture must be 'arm64' or 'x86_64'.")
+    if profile['billingMode'] not in ('PROVISIONED', 'PAY_PER_REQUEST'):
+        raise ValueError("performanceProfile billingMode must be 'PROVISIONED' or 'PAY_PER_REQUEST'.")
+    if not 128 <= profile['memorySize'] <= 10240:
+        raise ValueError("performanceProfile memorySize must be between 128 and 10240 MB.")
+    if not 1 <= profile['timeoutSeconds'] <= 900:
+        raise ValueError("performanceProfile timeoutSeconds must be between 1 and 900.")
+    if not 0 <= profile['provisionedConcurrencyMin'] <= profile['provisionedConcurrencyMax']:
+        raise ValueError("performanceProfile needs 0 <= provisionedConcurrencyMin <= provisionedConcurrencyMax.")
+    if not 0 < profile['provisionedConcurrencyUtilization'] <= 1:
+        raise ValueError("performanceProfile provisionedConcurrencyUtilization must be in (0, 1].")
+    for capacity in ('readCapacity', 'writeCapacity'):
+        if not 1 <= profile[capacity + 'Min'] <= profile[capacity + 'Max']:
+            raise ValueError(f"performanceProfile needs 1 <= {capacity}Min <= {capacity}Max.")
+    if not 10 <= profile['capacityUtilizationPercent'] <= 90:
+        raise ValueError("performanceProfile capacityUtilizationPercent must be between 10 and 90.")
+    return profile
+
+
+def table_indexes(count):
+    """
+    The first count entries of TABLE_INDEXES (an int from cdk.json, or a string
+    from `cdk -c`), all of them when count is None. Raises ValueError outside
+    0..len(TABLE_INDEXES).
+    """
+    if count is None:
+        return TABLE_INDEXES
+    if isinstance(count, str) and count.strip().isdigit():
+        count = int(count)
+    if isinstance(count, bool) or not isinstance(count, int) or not 0 <= count <= len(TABLE_INDEXES):
+        raise ValueError(f"tableIndexes must be an integer from 0 to {len(TABLE_INDEXES)}.")
+    return TABLE_INDEXES[:count]
+
+
+def autoscale_capacity(table, index_names, profile):
+    """Target-tracking autoscaling of read and write capacity for the table and its indexes."""
+    target = profile['capacityUtilizationPercent']
+    read = dict(min_capacity=profile['readCapacityMin'], max_capacity=profile['readCapacityMax'])
+    write = dict(min_capacity=profile['writeCapacityMin'], max_capacity=profile['writeCapacityMax'])
+    table.auto_scale_read_capacity(**read).scale_on_utilization(target_utilization_percent=target)
+    table.auto_scale_write_capacity(**write).scale_on_utilization(target_utilization_percent=target)
+    for index_name in index_names:
+        table.auto_scale_global_secondary_index_read_capacity(index_name, **read).scale_on_utilization(
+            target_utilization_percent=target)
+        table.auto_scale_global_secondary_index_write_capacity(index_name, **write).scale_on_utilization(
+            target_utilization_percent=target)
+
+
+def provisioned_alias(scope, function, profile):
+    """
+    The "live" alias with provisioned concurrency autoscaled on utilization, or
+    None when the profile has none. Background jobs invoke the function by name
+    ($LATEST), so only API requests use the provisioned environments.
+    """
+    if not profile['provisionedConcurrencyMax']:
+        return None
+    alias = _lambda.Alias(scope, 'liveAlias', alias_name='live', version=function.current_version,
+                          provisioned_concurrent_executions=profile['provisionedConcurrencyMin'] or None)
+    scaling = alias.add_auto_scaling(min_capacity=profile['provisionedConcurrencyMin'],
+                                     max_capacity=profile['provisionedConcurrencyMax'])
+    scaling.scale_on_utilization(utilization_target=profile['provisionedConcurrencyUtilization'])
+    return alias
+
+
+def load_route_registry():
+    """
+    Loads ROUTES from lambda-handler/routes.py. The directory is not a Python
+    package (and the handler's own dependencies are not needed here), so the
+    module is loaded straight from its file.
+    """
+    spec = importlib.util.spec_from_file_location(
+        "routes", os.path.join("./", "lambda-handler", "routes.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.ROUTES
@@ -0,0 +1,87 @@
+"""
+Fixtures of the handler tests: lambda-handler/index.py runs against an
+in-memory DynamoDB and S3 (moto) with the table, indexes and bucket the route
+benchmark creates (scripts/benchmark_routes.py). Needs the dev requirements;
+the CDK template tests do not use these fixtures.
+"""
+import json
+import os
+import sys
+import threading
+
+import pytest
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.join(REPO_ROOT, "scripts"))
+sys.path.insert(0, os.path.join(REPO_ROOT, "lambda-handler"))
+
+import benchmark_routes  # noqa: E402
+
+# The handler modules read their settings at import
+os.environ.update(benchmark_routes.LOCAL_AWS_ENV)
+os.environ.setdefault("logSampleRate", "0")
+
+OWNER = benchmark_routes.OWNER
+
+
+class Api:
+    """Sends HTTP API events through index.handler and decodes the responses."""
+
+    def __init__(self, index):
+        self.index = index
+        self.requests = 0
+
+    def event(self, route_key, path=None, user=OWNER, body=None, query=None, headers=None):
+        return benchmark_routes.event(route_key, path, user=user, body=body, query=query, headers=headers)
+
+    def call(self, route_key, path=None, user=OWNER, body=None, query=None, headers=None):
+        """Returns (statusCode, decoded JSON body or None when empty, headers)."""
+        self.requests += 1
+        response = self.index.handler(self.event(route_key, path, user, body, query, headers),
+                                      benchmark_routes.Context(f"test-{self.requests}"))
+        body = json.loads(response["body"]) if response["body"] else None
+        return response["statusCode"], body, response["headers"]
+
+    def create_warehouse(self, warehouse_id, user=OWNER, **fields):
+        status, body, _ = self.call("POST /warehouses", user=user,
+                                    body=dict({"warehouseId": warehouse_id, "warehouseName": warehouse_id}, **fields))
+        assert status == 200, body
+
+    def create_item(self, warehouse_id, item_id, quantity=10, user=OWNER, **fields):
+        status, body, _ = self.call("POST /warehouses/{warehouseId}/items", {"warehouseId": warehouse_id}, user=user,
+                                    body=dict({"itemId": item_id, "itemName": item_id, "quantity": quantity}, **fields))
+        assert status == 200, body
+
+
+@pytest.fixture
+def index(monkeypatch):
+    """The handler module inside a fresh moto account, with an empty role cache."""
+    from moto import mock_aws
+    from moto.core.botocore_stubber import BotocoreStubber
+
+    # DynamoDB applies every request atomically; moto does not when requests
+    # arrive from several threads at once (an ADD can be lost), so they take turns
+    handle, lock = BotocoreStubber.__call__, threading.Lock()
+
+    def atomic(self, *args, **kwargs):
+        with lock:
+            return handle(self, *args, **kwargs)
+    monkeypatch.setattr(BotocoreStubber, "__call__", atomic)
+    with mock_aws():
+        benchmark_routes.create_resources()
+        import index
+        monkeypatch.setattr(index, "role_cache",
+                            index.RoleCache(index.ROLE_CACHE_MAX_SIZE, index.ROLE_CACHE_TTL_SECONDS))
+        yield index
+
+
+@pytest.fixture
+def api(index):
+    return Api(index)
+
+
+@pytest.fixture
+def table(index):
+    """The moto table, for reading rows the API does not return."""
+    import boto3
+    return boto3.resource("dynamodb").Table(benchmark_routes.TABLE)
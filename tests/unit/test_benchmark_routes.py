@@ -0,0 +1,21 @@
+"""
+scripts/benchmark_routes.py on a small data set: every scenario within its
+DynamoDB call and row limits, with 2xx responses of the expected shape. The
+latency budgets are left to full runs on a quiet machine.
+"""
+import os
+import subprocess
+import sys
+
+SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+                      "scripts", "benchmark_routes.py")
+
+
+def test_routes_within_thresholds():
+    result = subprocess.run(
+        [sys.executable, SCRIPT, "--warehouses", "2", "--items", "30", "--users", "3", "--requests", "3",
+         "--no-latency-check"],
+        stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True, timeout=300
+    )
+    assert result.returncode == 0, result.stdout
+    assert "All routes within thresholds." in result.stdout
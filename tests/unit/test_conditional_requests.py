@@ -0,0 +1,94 @@
+"""
+ETags, If-None-Match (304) and If-Match (412) on warehouses and items, against moto.
+"""
+WAREHOUSE = "GET /warehouses/{warehouseId}"
+ITEM = "GET /warehouses/{warehouseId}/items/{itemId}"
+PUT_ITEM = "PUT /warehouses/{warehouseId}/items/{itemId}"
+DELETE_ITEM = "DELETE /warehouses/{warehouseId}/items/{itemId}"
+WH = {"warehouseId": "wh"}
+BOLTS = {"warehouseId": "wh", "itemId": "bolts"}
+
+
+def test_matching_if_none_match_answers_304(api):
+    api.create_warehouse("wh")
+    api.create_item("wh", "bolts")
+    for route_key, path in [(WAREHOUSE, WH), (ITEM, BOLTS)]:
+        status, _, headers = api.call(route_key, path)
+        assert status == 200
+        tag = headers["ETag"]
+
+        status, body, headers = api.call(route_key, path, headers={"If-None-Match": tag})
+        assert (status, body, headers["ETag"]) == (304, None, tag)
+        status, _, _ = api.call(route_key, path, headers={"If-None-Match": f'"999", W/{tag}'})
+        assert status == 304
+        status, _, _ = api.call(route_key, path, headers={"If-None-Match": '"999"'})
+        assert status == 200
+
+
+def test_item_etag_changes_with_each_write(api):
+    api.create_warehouse("wh")
+    api.create_item("wh", "bolts")
+    _, _, headers = api.call(ITEM, BOLTS)
+    before = headers["ETag"]
+
+    status, _, headers = api.call(PUT_ITEM, BOLTS, body={"itemName": "Bolts"}, headers={"If-Match": before})
+    assert status == 200 and headers["ETag"] != before
+    status, _, _ = api.call(ITEM, BOLTS, headers={"If-None-Match": before})
+    assert status == 200
+    status, _, _ = api.call(ITEM, BOLTS, headers={"If-None-Match": headers["ETag"]})
+    assert status == 304
+
+
+def test_stale_if_match_answers_412(api):
+    api.create_warehouse("wh")
+    api.create_item("wh", "bolts", quantity=5)
+    _, _, headers = api.call(ITEM, BOLTS)
+    stale = headers["ETag"]
+    api.call(PUT_ITEM, BOLTS, body={"quantity": 6})
+
+    # A rename (one conditional write) and a quantity change (read, then transaction)
+    for body in ({"itemName": "Bolts"}, {"quantity": 7}):
+        status, _, _ = api.call(PUT_ITEM, BOLTS, body=body, headers={"If-Match": stale})
+        assert status == 412
+    status, _, _ = api.call(DELETE_ITEM, BOLTS, headers={"If-Match": stale})
+    assert status == 412
+    status, item, _ = api.call(ITEM, BOLTS)
+    assert (status, item["itemName"], item["quantity"]) == (200, "bolts", 6)
+
+    _, _, headers = api.call(WAREHOUSE, WH)
+    api.call("PUT /warehouses/{warehouseId}", WH, body={"warehouseName": "Main"})
+    status, _, _ = api.call("PUT /warehouses/{warehouseId}", WH, body={"warehouseName": "Other"},
+                            headers={"If-Match": headers["ETag"]})
+    assert status == 412
+
+    # The current ETag still deletes
+    _, _, headers = api.call(ITEM, BOLTS)
+    status, _, _ = api.call(DELETE_ITEM, BOLTS, headers={"If-Match": headers["ETag"]})
+    assert status == 200
+    status, _, _ = api.call(DELETE_ITEM, BOLTS, headers={"If-Match": "*"})
+    assert status == 412
+
+
+def test_sharded_warehouse_etag_follows_the_totals(api):
+    api.create_warehouse("wh", itemShards=4)
+    status, _, headers = api.call(WAREHOUSE, WH)
+    tag = headers["ETag"]
+    assert status == 200 and "." in tag  # "version.totals"
+
+    # Item writes change only the TOTALS rows, not METADATA
+    for write in (lambda: api.create_item("wh", "bolts", quantity=5),
+                  lambda: api.call("POST /warehouses/{warehouseId}/items/{itemId}/adjust", BOLTS,
+                                   body={"delta": 2})):
+        write()
+        status, warehouse, headers = api.call(WAREHOUSE, WH, headers={"If-None-Match": tag})
+        assert status == 200 and headers["ETag"] != tag
+        assert tag.split(".")[0] == headers["ETag"].split(".")[0]
+        tag = headers["ETag"]
+    assert (warehouse["itemCount"], warehouse["totalQuantity"]) == (1, 7)
+    status, _, _ = api.call(WAREHOUSE, WH, headers={"If-None-Match": tag})
+    assert status == 304
+
+    # If-Match compares the METADATA version, so a totals change does not fail it
+    status, _, _ = api.call("PUT /warehouses/{warehouseId}", WH, body={"warehouseName": "Main"},
+                            headers={"If-Match": tag})
+    assert status == 200
@@ -0,0 +1,109 @@
+"""
+Idempotency-Key handling (idempotency.py) through the handler, against moto.
+"""
+import time
+
+import pytest
+
+ADJUST = "POST /warehouses/{warehouseId}/items/{itemId}/adjust"
+ITEM = {"warehouseId": "wh", "itemId": "bolts"}
+KEY = {"Idempotency-Key": "3f6c1a52-adjust"}
+
+
+@pytest.fixture
+def warehouse(api):
+    api.create_warehouse("wh")
+    api.create_item("wh", "bolts", quantity=10)
+    status, _, _ = api.call("POST /warehouses/{warehouseId}/access", {"warehouseId": "wh"},
+                            body={"userId": "user-1", "role": "editor"})
+    assert status == 200
+    return api
+
+
+def quantity(api):
+    _, item, _ = api.call("GET /warehouses/{warehouseId}/items/{itemId}", ITEM, query={"consistent": "true"})
+    return item["quantity"]
+
+
+def idempotency_row(index, table, user_id, key):
+    claim = index.idempotency.Claim(user_id, key, None)
+    return table.get_item(Key=claim.key, ConsistentRead=True).get("Item")
+
+
+def test_replay_returns_the_stored_response(warehouse):
+    status, body, headers = warehouse.call(ADJUST, ITEM, body={"delta": -3}, headers=KEY)
+    assert (status, body["quantity"]) == (200, 7)
+    assert "Idempotent-Replayed" not in headers
+
+    replay_status, replay_body, replay_headers = warehouse.call(ADJUST, ITEM, body={"delta": -3}, headers=KEY)
+    assert (replay_status, replay_body) == (status, body)
+    assert replay_headers == dict(headers, **{"Idempotent-Replayed": "true"})
+    assert quantity(warehouse) == 7  # adjusted once
+
+
+def test_same_key_with_another_body_rejected(warehouse):
+    warehouse.call(ADJUST, ITEM, body={"delta": -3}, headers=KEY)
+    status, body, _ = warehouse.call(ADJUST, ITEM, body={"delta": -4}, headers=KEY)
+    assert status == 400 and "different request" in body["error"]
+    assert quantity(warehouse) == 7
+
+
+def test_keys_are_scoped_to_the_user(warehouse):
+    for user in ("user-0", "user-1"):
+        status, _, headers = warehouse.call(ADJUST, ITEM, user=user, body={"delta": -1}, headers=KEY)
+        assert status == 200 and "Idempotent-Replayed" not in headers
+    assert quantity(warehouse) == 8
+
+
+def test_key_in_progress_answers_409_and_is_not_stored(warehouse, index, table, monkeypatch):
+    monkeypatch.setattr(index.idempotency, "WAIT_SECONDS", 0.3)
+    body = {"delta": -2}
+    # A first request with the key that is still running (its claim is held)
+    claim = index.idempotency.Claim("user-0", KEY["Idempotency-Key"],
+                                    index.idempotency.fingerprint(ADJUST, ITEM, body))
+    assert claim.acquire() is None
+
+    status, response, headers = warehouse.call(ADJUST, ITEM, body=body, headers=KEY)
+    assert status == 409 and "still in progress" in response["error"]
+    assert headers["Retry-After"] == "1"
+    row = idempotency_row(index, table, "user-0", KEY["Idempotency-Key"])
+    assert (row["status"], row["token"]) == ("running", claim.token)
+    assert quantity(warehouse) == 10
+
+    # Once the first request's deadline has passed, a retry runs the route
+    table.update_item(Key=claim.key, UpdateExpression="SET lockedUntil = :past",
+                      ExpressionAttributeValues={":past": int(time.time()) - 1})
+    status, response, headers = warehouse.call(ADJUST, ITEM, body=body, headers=KEY)
+    assert (status, response["quantity"]) == (200, 8)
+    assert "Idempotent-Replayed" not in headers
+
+
+def test_retryable_responses_release_the_claim(index, table):
+    # 5xx, and any response that asks for a retry with Retry-After (429, a
+    # lost race's 409), leave nothing behind for the key
+    for n, (status, headers) in enumerate([(500, {}), (503, {}), (429, {"Retry-After": "1"}),
+                                           (409, {"Retry-After": "1"})]):
+        claim = index.idempotency.Claim("user-0", f"key-{n}", "fingerprint")
+        assert claim.acquire() is None
+        claim.finish(status, '{"error": "retry"}', dict(headers, **{"Content-Type": "application/json"}))
+        assert idempotency_row(index, table, "user-0", f"key-{n}") is None
+
+    # A final 409 (e.g. a transfer that stopped after some batches) is stored
+    claim = index.idempotency.Claim("user-0", "key-final", "fingerprint")
+    assert claim.acquire() is None
+    claim.finish(409, '{"error": "stopped"}', {"Content-Type": "application/json"})
+    assert idempotency_row(index, table, "user-0", "key-final")["status"] == "completed"
+
+
+def test_server_error_releases_the_claim(warehouse, index, monkeypatch):
+    def fail(request):
+        raise RuntimeError("boom")
+    route = index.ROUTE_TABLE[ADJUST]
+    monkeypatch.setitem(index.ROUTE_TABLE, ADJUST, (fail, route[1]))
+    status, _, _ = warehouse.call(ADJUST, ITEM, body={"delta": -3}, headers=KEY)
+    assert status == 500
+
+    monkeypatch.setitem(index.ROUTE_TABLE, ADJUST, route)
+    status, body, headers = warehouse.call(ADJUST, ITEM, body={"delta": -3}, headers=KEY)
+    assert (status, body["quantity"]) == (200, 7)
+    assert "Idempotent-Replayed" not in headers
@@ -0,0 +1,56 @@
+"""
+POST /warehouses/{warehouseId}/items/{itemId}/adjust against moto.
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+ADJUST = "POST /warehouses/{warehouseId}/items/{itemId}/adjust"
+ITEM = {"warehouseId": "wh", "itemId": "bolts"}
+
+
+def test_concurrent_adjustments_return_their_own_quantity(api, index):
+    api.create_warehouse("wh")
+    api.create_item("wh", "bolts", quantity=0)
+    adjustments = 20
+
+    def adjust(n):
+        # The route handler itself, so the requests really overlap
+        return index.adjust_item(index.Request(api.event(ADJUST, ITEM, body={"delta": 1}), None))
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(adjust, range(adjustments)))
+
+    assert [status for status, _, _ in results] == [200] * adjustments
+    # Every caller gets the quantity and version its own ADD produced
+    assert sorted(body["quantity"] for _, body, _ in results) == list(range(1, adjustments + 1))
+    assert len({headers["ETag"] for _, _, headers in results}) == adjustments
+    _, item, headers = api.call("GET /warehouses/{warehouseId}/items/{itemId}", ITEM)
+    assert item["quantity"] == adjustments
+    assert headers["ETag"] == f'"{adjustments + 1}"'
+    _, warehouse, _ = api.call("GET /warehouses/{warehouseId}", {"warehouseId": "wh"})
+    assert warehouse["totalQuantity"] == adjustments
+
+
+def test_adjustment_crossing_the_reorder_threshold(api):
+    api.create_warehouse("wh")
+    api.create_item("wh", "bolts", quantity=12, reorderThreshold=10)
+
+    status, body, _ = api.call(ADJUST, ITEM, body={"delta": -5})
+    assert (status, body["quantity"]) == (200, 7)
+    _, low_stock, _ = api.call("GET /warehouses/{warehouseId}/low-stock", {"warehouseId": "wh"})
+    assert [it["itemId"] for it in low_stock["items"]] == ["bolts"]
+
+    api.call(ADJUST, ITEM, body={"delta": 5})
+    _, low_stock, _ = api.call("GET /warehouses/{warehouseId}/low-stock", {"warehouseId": "wh"})
+    assert low_stock["items"] == []
+
+
+def test_adjustment_rejected(api):
+    api.create_warehouse("wh")
+    api.create_item("wh", "bolts", quantity=3)
+
+    status, body, _ = api.call(ADJUST, ITEM, body={"delta": -4})
+    assert status == 400 and "Insufficient stock" in body["error"]
+    status, _, _ = api.call(ADJUST, {"warehouseId": "wh", "itemId": "nuts"}, body={"delta": 1})
+    assert status == 404
+    _, warehouse, _ = api.call("GET /warehouses/{warehouseId}", {"warehouseId": "wh"})
+    assert warehouse["totalQuantity"] == 3
@@ -0,0 +1,50 @@
+"""
+RoleCache (index.py): roles and shard counts are bounded by the TTL; an
+observed accessVersion only ends entries early.
+"""
+import pytest
+
+
+@pytest.fixture
+def clock(index, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(index.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_roles_and_shards_expire(index, clock):
+    cache = index.RoleCache(max_size=10, ttl_seconds=30)
+    cache.put("wh", "user-1", "viewer")
+    cache.observe_shards("wh", 4)
+
+    clock[0] += 29
+    assert (cache.get("wh", "user-1"), cache.shards("wh")) == ("viewer", 4)
+    clock[0] += 1
+    assert (cache.get("wh", "user-1"), cache.shards("wh")) == (None, None)
+
+
+def test_newer_access_version_ends_entries_early(index, clock):
+    cache = index.RoleCache(max_size=10, ttl_seconds=30)
+    cache.observe_version("wh", 3)
+    cache.put("wh", "user-1", "viewer")
+    cache.put("other", "user-1", "viewer")
+
+    # Without a newer version the entry lasts until the TTL
+    cache.observe_version("wh", 3)
+    clock[0] += 10
+    assert cache.get("wh", "user-1") == "viewer"
+    cache.observe_version("wh", 4)
+    assert cache.get("wh", "user-1") is None
+    assert cache.get("other", "user-1") == "viewer"
+
+
+def test_recreated_warehouse_shards_seen_after_the_ttl(api, index, clock):
+    # Another container deleted "wh" and created it again with other shards;
+    # this one still has the old count. Background jobs look it up without an
+    # access check (which would read the ACCESS row's count)
+    api.create_warehouse("wh", itemShards=4)
+    index.role_cache.observe_shards("wh", 1)
+    assert index.item_shards("wh") == 1
+
+    clock[0] += index.role_cache.ttl_seconds
+    assert index.item_shards("wh") == 4
@@ -0,0 +1,158 @@
+"""
+Synthesizes ServerlessBackendStack with the default performance profile and
+with overridden ones, and checks the Lambda function, its alias, the table and
+the autoscaling resources in the CloudFormation templates. Needs the CDK
+requirements (aws-cdk-lib) and Node.js; nothing is deployed.
+"""
+import json
+import os
+
+import aws_cdk as cdk
+import pytest
+from aws_cdk.assertions import Match, Template
+
+from serverless_backend.serverless_backend_stack import (
+    DEFAULT_PERFORMANCE_PROFILE, ServerlessBackendStack, performance_profile, table_indexes)
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+INDEXES = 3  # UserAccessIndex, LowStockIndex, ItemChangesIndex
+
+TUNED = {
+    'architecture': 'x86_64',
+    'memorySize': 2048,
+    'timeoutSeconds': 60,
+    'reservedConcurrency': 100,
+    'provisionedConcurrencyMin': 2,
+    'provisionedConcurrencyMax': 20,
+    'provisionedConcurrencyUtilization': 0.6,
+    'billingMode': 'PAY_PER_REQUEST',
+}
+
+
+@pytest.fixture(autouse=True)
+def repo_root(monkeypatch):
+    # The stack reads lambda-handler/ relative to the working directory
+    monkeypatch.chdir(REPO_ROOT)
+
+
+def synth(profile=None, **context):
+    if profile is not None:
+        context['performanceProfile'] = profile
+    app = cdk.App(context=context)
+    return Template.from_stack(ServerlessBackendStack(app, 'ServerlessBackendStack'))
+
+
+def test_default_profile():
+    template = synth()
+    template.has_resource_properties('AWS::Lambda::Function', {
+        'FunctionName': 'formlambda',
+        'Architectures': ['arm64'],
+        'MemorySize': DEFAULT_PERFORMANCE_PROFILE['memorySize'],
+        'Timeout': DEFAULT_PERFORMANCE_PROFILE['timeoutSeconds'],
+        'ReservedConcurrentExecutions': Match.absent(),
+    })
+    template.resource_count_is('AWS::Lambda::Alias', 0)
+    template.has_resource_properties('AWS::DynamoDB::Table', {
+        'BillingMode': Match.absent(),  # PROVISIONED is CloudFormation's default
+        'ProvisionedThroughput': {'ReadCapacityUnits': 5, 'WriteCapacityUnits': 5},
+        'GlobalSecondaryIndexes': Match.array_with([Match.object_like({
+            'IndexName': 'ItemChangesIndex',
+            'ProvisionedThroughput': {'ReadCapacityUnits': 5, 'WriteCapacityUnits': 5},
+        })]),
+    })
+    # Read and write capacity of the table and of every index
+    template.resource_count_is('AWS::ApplicationAutoScaling::ScalableTarget', 2 * (1 + INDEXES))
+    template.has_resource_properties('AWS::ApplicationAutoScaling::ScalableTarget', {
+        'ServiceNamespace': 'dynamodb',
+        'ScalableDimension': 'dynamodb:index:WriteCapacityUnits',
+        'ResourceId': {'Fn::Join': ['', Match.array_with(['/index/ItemChangesIndex'])]},
+        'MinCapacity': 5, 'MaxCapacity': 50,
+    })
+    template.has_resource_properties('AWS::ApplicationAutoScaling::ScalingPolicy', {
+        'PolicyType': 'TargetTrackingScaling',
+        'TargetTrackingScalingPolicyConfiguration': Match.object_like({
+            'TargetValue': 70,
+            'PredefinedMetricSpecification': {'PredefinedMetricType': 'DynamoDBReadCapacityUtilization'},
+        }),
+    })
+
+
+# As an object in cdk.json, and as the JSON string `-c performanceProfile=...` passes
+@pytest.mark.parametrize('profile', [TUNED, json.dumps(TUNED)], ids=['object', 'json-string'])
+def test_tuned_profile(profile):
+    template = synth(profile)
+    template.has_resource_properties('AWS::Lambda::Function', {
+        'FunctionName': 'formlambda',
+        'Architectures': ['x86_64'],
+        'MemorySize': 2048,
+        'Timeout': 60,
+        'ReservedConcurrentExecutions': 100,
+    })
+    template.has_resource_properties('AWS::Lambda::Alias', {
+        'Name': 'live',
+        'ProvisionedConcurrencyConfig': {'ProvisionedConcurrentExecutions': 2},
+    })
+    template.has_resource_properties('AWS::ApplicationAutoScaling::ScalableTarget', {
+        'ServiceNamespace': 'lambda',
+        'ScalableDimension': 'lambda:function:ProvisionedConcurrency',
+        'MinCapacity': 2, 'MaxCapacity': 20,
+    })
+    template.has_resource_properties('AWS::ApplicationAutoScaling::ScalingPolicy', {
+        'TargetTrackingScalingPolicyConfiguration': Match.object_like({
+            'TargetValue': 0.6,
+            'PredefinedMetricSpecification': {
+                'PredefinedMetricType': 'LambdaProvisionedConcurrencyUtilization'},
+        }),
+    })
+    # The API invokes the alias, so its requests land on the provisioned environments
+    aliases = template.find_resources('AWS::Lambda::Alias')
+    (alias_id,) = aliases
+    template.has_resource_properties('AWS::ApiGatewayV2::Integration', {
+        'IntegrationUri': {'Ref': alias_id},
+    })
+    # Requests then run as formlambda:live, but background jobs re-invoke the
+    # unqualified function (schedule_continuation), which is what the role allows
+    template.has_resource_properties('AWS::IAM::Policy', {
+        'PolicyDocument': {'Statement': Match.array_with([Match.object_like({
+            'Action': 'lambda:InvokeFunction',
+            'Resource': {'Fn::Join': ['', Match.array_with([':function:formlambda'])]},
+        })])},
+    })
+    template.has_resource_properties('AWS::DynamoDB::Table', {
+        'BillingMode': 'PAY_PER_REQUEST',
+        'ProvisionedThroughput': Match.absent(),
+        'GlobalSecondaryIndexes': Match.array_with([Match.object_like({
+            'IndexName': 'ItemChangesIndex', 'ProvisionedThroughput': Match.absent(),
+        })]),
+    })
+    # Only the alias scales; on-demand tables have no capacity to scale
+    template.resource_count_is('AWS::ApplicationAutoScaling::ScalableTarget', 1)
+
+
+@pytest.mark.parametrize('overrides', [
+    {'memorySize': 64},
+    {'billingMode': 'ON_DEMAND'},
+    {'memmorySize': 2048},
+    {'provisionedConcurrencyMin': 5, 'provisionedConcurrencyMax': 2},
+    {'readCapacityMin': 10, 'readCapacityMax': 5},
+])
+def test_invalid_profile_rejected(overrides):
+    with pytest.raises(ValueError):
+        performance_profile(overrides)
+
+
+# Staged upgrade of a table deployed before the indexes: one new index per deploy
+@pytest.mark.parametrize('count', [0, 1, '2'])
+def test_table_indexes_subset(count):
+    template = synth(tableIndexes=count)
+    names = ['UserAccessIndex', 'LowStockIndex', 'ItemChangesIndex'][:int(count)]
+    (table,) = template.find_resources('AWS::DynamoDB::Table').values()
+    assert [index['IndexName'] for index in table['Properties'].get('GlobalSecondaryIndexes', [])] == names
+    # Only the indexes that exist are autoscaled
+    template.resource_count_is('AWS::ApplicationAutoScaling::ScalableTarget', 2 * (1 + len(names)))
+
+
+@pytest.mark.parametrize('count', [-1, 4, 'all', 1.5, True])
+def test_invalid_table_indexes_rejected(count):
+    with pytest.raises(ValueError):
+        table_indexes(count)
@@ -0,0 +1,116 @@
+"""
+Warehouses created with itemShards: listing, cursors, delta sync and deletion
+merge or touch every shard (query_shards, query_shards_page).
+"""
+import base64
+import json
+import time
+
+import pytest
+
+SHARDS = 4
+WH = {"warehouseId": "wh"}
+LIST = "GET /warehouses/{warehouseId}/items"
+ITEM_IDS = [f"item-{n:02d}" for n in range(23)]
+
+
+@pytest.fixture
+def sharded(api, index):
+    api.create_warehouse("wh", itemShards=SHARDS)
+    status, body, _ = api.call("POST /warehouses/{warehouseId}/items/batch", WH, body={
+        "items": [{"itemId": item_id, "itemName": item_id, "quantity": n} for n, item_id in enumerate(ITEM_IDS)]
+    })
+    assert (status, body["succeeded"]) == (200, len(ITEM_IDS))
+    # The items really are spread over every shard
+    assert len({index.item_key("wh", item_id, SHARDS)["PK"] for item_id in ITEM_IDS}) == SHARDS
+    return api
+
+
+def list_pages(api, query, max_pages=30):
+    """Every page of GET .../items with query, following nextCursor."""
+    pages, cursor = [], None
+    while len(pages) < max_pages:
+        status, body, _ = api.call(LIST, WH, query=dict(query, **({"cursor": cursor} if cursor else {})))
+        assert status == 200, body
+        pages.append(body)
+        cursor = body["nextCursor"]
+        if not cursor:
+            return pages
+    pytest.fail(f"Still a nextCursor after {max_pages} pages.")
+
+
+def decode(cursor):
+    return json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+
+
+def encode(key):
+    return base64.urlsafe_b64encode(json.dumps(key).encode("utf-8")).decode("ascii")
+
+
+def test_list_pages_return_every_item_once_in_order(sharded):
+    pages = list_pages(sharded, {"limit": "5"})
+    assert len(pages) == 5
+    assert [it["itemId"] for page in pages for it in page["items"]] == ITEM_IDS
+    assert all(len(page["items"]) == 5 for page in pages[:-1])
+
+
+def test_tampered_cursor_rejected(sharded):
+    _, first, _ = sharded.call(LIST, WH, query={"limit": "5"})
+    cursor = decode(first["nextCursor"])
+    shard = next(n for n, key in enumerate(cursor["shards"]) if isinstance(key, dict))
+    other_shard = (shard + 1) % SHARDS
+
+    tampered = [
+        dict(cursor, PK="WAREHOUSE#other"),
+        dict(cursor, shards=cursor["shards"][:-1]),
+        dict(cursor, shards=[dict(key, PK=f"WAREHOUSE#wh#{other_shard}") if n == shard else key
+                             for n, key in enumerate(cursor["shards"])]),
+        dict(cursor, shards=[dict(key, SK="ACCESS#user-0") if n == shard else key
+                             for n, key in enumerate(cursor["shards"])]),
+    ]
+    for key in tampered:
+        status, body, _ = sharded.call(LIST, WH, query={"limit": "5", "cursor": encode(key)})
+        assert (status, body) == (400, {"error": "Invalid cursor."})
+
+
+def test_delta_sync_merges_the_shards(sharded):
+    time.sleep(0.01)
+    since = int(time.time() * 1000)
+    time.sleep(0.01)
+    renamed = ["item-03", "item-11", "item-17"]
+    for item_id in renamed:
+        status, _, _ = sharded.call("PUT /warehouses/{warehouseId}/items/{itemId}", dict(WH, itemId=item_id),
+                                    body={"itemName": f"{item_id} renamed"})
+        assert status == 200
+    status, _, _ = sharded.call("POST /warehouses/{warehouseId}/items/{itemId}/adjust",
+                                dict(WH, itemId="item-20"), body={"delta": 1})
+    assert status == 200
+    status, _, _ = sharded.call("DELETE /warehouses/{warehouseId}/items/{itemId}", dict(WH, itemId="item-05"))
+    assert status == 200
+
+    pages = list_pages(sharded, {"since": str(since), "limit": "2"})
+    changed = [it for page in pages for it in page["items"]]
+    # In order of change across all shards, each change once
+    assert [it["itemId"] for it in changed] == renamed + ["item-20"]
+    assert [it["updatedAt"] for it in changed] == sorted(it["updatedAt"] for it in changed)
+    assert [it["itemId"] for page in pages for it in page["deleted"]] == ["item-05"]
+    # Only the last page carries the next sync's since
+    assert [page["nextSince"] is not None for page in pages] == [False] * (len(pages) - 1) + [True]
+    assert since <= pages[-1]["nextSince"] <= changed[-1]["updatedAt"]
+
+    # From the start, every item still there is sent once
+    pages = list_pages(sharded, {"since": "0", "limit": "7"})
+    assert sorted(it["itemId"] for page in pages for it in page["items"]) == [
+        item_id for item_id in ITEM_IDS if item_id != "item-05"]
+
+
+def test_delete_removes_every_shard(sharded, table):
+    def rows():
+        return [it for it in table.scan()["Items"] if it["PK"].split("#")[1] == "wh"]
+
+    assert len([it for it in rows() if it["SK"] == "TOTALS"]) == SHARDS
+    status, _, _ = sharded.call("DELETE /warehouses/{warehouseId}", WH)
+    assert status == 200
+    assert rows() == []
+    status, _, _ = sharded.call("GET /warehouses/{warehouseId}", WH)
+    assert status == 403